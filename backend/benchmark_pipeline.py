@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for each stage of the detection pipeline.
+
+Times every stage separately on the sample images in public/models/:
+- base64_decode: base64 -> bytes (the JSON /detect path)
+- imdecode: full-resolution cv2.imdecode
+- decode_image: the DCT-downscaled decode the servers actually use
+- preprocess: letterbox into the model input tensor (AadhaarDetector.preprocess)
+- per backend (torch .pt, ONNX fp32, ONNX int8) at each batch size:
+  preprocess / inference / postprocess as reported by
+  InferenceBackend.predict_batch(images, timings), plus the end-to-end call
+
+Each stage gets warmup runs, then a fixed number of timed repeats with the
+garbage collector paused; results (mean/std/min/p50/p95/p99/max in ms) are
+saved as JSON together with the library versions and CPU count, so runs can
+be compared. Pass --baseline with an earlier JSON file to print the change
+per stage.
+
+Usage:
+    python benchmark_pipeline.py
+    python benchmark_pipeline.py --repeat 50 --batch-sizes 1,2,4 --output after.json --baseline before.json
+"""
+
+import argparse
+import base64
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from image_decode import decode_image
+from onnx_detector import MODEL_INPUT_SIZE, MODEL_PATH, available_cpus, int8_model_path, letterbox_into
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_IMAGE_DIR = BASE_DIR.parent / "public" / "models"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def summarize(samples_ns: list[int]) -> dict:
+    """Statistics in milliseconds"""
+    ms = np.array(samples_ns, dtype=np.float64) / 1e6
+    return {
+        "n": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "std_ms": round(float(ms.std()), 4),
+        "min_ms": round(float(ms.min()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4)
+    }
+
+
+def time_calls(fn: Callable[[], object], repeat: int, warmup: int) -> list[int]:
+    """Run fn warmup times, then return repeat wall-clock samples (ns) with GC paused"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            fn()
+            samples.append(time.perf_counter_ns() - started)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples
+
+
+def load_samples(image_dir: Path) -> list[dict]:
+    """Encoded bytes, base64 text and decoded image for every sample image"""
+    samples = []
+    for path in sorted(image_dir.iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        data = path.read_bytes()
+        image, factor = decode_image(data, MODEL_INPUT_SIZE)
+        if image is None:
+            print(f"   ⚠️ Skipping undecodable image: {path.name}")
+            continue
+        samples.append({
+            "name": path.name,
+            "bytes": data,
+            "base64": base64.b64encode(data).decode(),
+            "image": image,
+            "decode_factor": factor
+        })
+    return samples
+
+
+def bench_image_stages(samples: list[dict], repeat: int, warmup: int) -> dict:
+    """Backend-independent stages, per image and pooled over all images"""
+    tensor = np.empty((1, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dtype=np.float32)
+    stages = {
+        "base64_decode": lambda s: (lambda: base64.b64decode(s["base64"])),
+        "imdecode": lambda s: (lambda: cv2.imdecode(np.frombuffer(s["bytes"], np.uint8), cv2.IMREAD_COLOR)),
+        "decode_image": lambda s: (lambda: decode_image(s["bytes"], MODEL_INPUT_SIZE)),
+        # What AadhaarDetector.preprocess does, without needing a model loaded
+        "preprocess": lambda s: (lambda: letterbox_into(s["image"], tensor[0], MODEL_INPUT_SIZE))
+    }
+
+    results = {}
+    for stage, make_call in stages.items():
+        pooled = []
+        per_image = {}
+        for sample in samples:
+            timings = time_calls(make_call(sample), repeat, warmup)
+            pooled.extend(timings)
+            per_image[sample["name"]] = summarize(timings)["mean_ms"]
+        results[stage] = {**summarize(pooled), "per_image_mean_ms": per_image}
+        print(f"   {stage:<14} mean {results[stage]['mean_ms']:8.3f} ms   p95 {results[stage]['p95_ms']:8.3f} ms")
+    return results
+
+
+def bench_backend(backend, samples: list[dict], batch_sizes: list[int], repeat: int, warmup: int) -> dict:
+    """predict_batch stage timings for each batch size (images cycled from the samples)"""
+    images = [sample["image"] for sample in samples]
+    results = {}
+    for batch_size in batch_sizes:
+        batches = [[images[(start + i) % len(images)] for i in range(batch_size)] for start in range(len(images))]
+        stage_samples: dict[str, list[int]] = {}
+        total = []
+
+        for batch in batches[:1] * warmup:
+            backend.predict_batch(batch)
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                for batch in batches:
+                    timings = {}
+                    started = time.perf_counter_ns()
+                    backend.predict_batch(batch, timings)
+                    total.append(time.perf_counter_ns() - started)
+                    for stage, seconds in timings.items():
+                        stage_samples.setdefault(stage, []).append(int(seconds * 1e9))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        result = {stage: summarize(values) for stage, values in stage_samples.items()}
+        result["predict_batch"] = summarize(total)
+        result["per_image_mean_ms"] = round(result["predict_batch"]["mean_ms"] / batch_size, 4)
+        results[f"batch_{batch_size}"] = result
+
+        breakdown = ", ".join(f"{stage} {stats['mean_ms']:.2f}" for stage, stats in result.items()
+                              if isinstance(stats, dict) and stage != "predict_batch")
+        print(f"   batch {batch_size:<3} {result['predict_batch']['mean_ms']:8.2f} ms/call "
+              f"({result['per_image_mean_ms']:.2f} ms/image)  [{breakdown}]")
+    return results
+
+
+def load_backend(kind: str, model_path: Path):
+    """InferenceBackend for a benchmark target, or (None, reason) if it can't be loaded"""
+    if not model_path.exists():
+        return None, f"model not found: {model_path}"
+    try:
+        if kind == "torch":
+            from inference_backend import TorchBackend
+            return TorchBackend(str(model_path)), None
+        from inference_backend import OnnxBackend
+        return OnnxBackend(str(model_path)), None
+    except ImportError as e:
+        return None, f"missing dependency: {e}"
+
+
+def environment() -> dict:
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": available_cpus(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "ort_profile": os.environ.get("ORT_PROFILE", "default")
+    }
+    try:
+        import onnxruntime as ort
+        info["onnxruntime"] = ort.__version__
+    except ImportError:
+        pass
+    if "torch" in sys.modules:
+        info["torch"] = sys.modules["torch"].__version__
+    return info
+
+
+def compare(results: dict, baseline: dict):
+    """Print mean-latency change per stage against an earlier run"""
+    def flatten(node: dict, prefix: str = "") -> dict:
+        flat = {}
+        for key, value in node.items():
+            if isinstance(value, dict) and "mean_ms" in value:
+                flat[prefix + key] = value["mean_ms"]
+            elif isinstance(value, dict):
+                flat.update(flatten(value, f"{prefix}{key}."))
+        return flat
+
+    current, previous = flatten(results["stages"]), flatten(baseline.get("stages", {}))
+    print("\n" + "=" * 60)
+    print("📊 Change vs baseline (mean)")
+    print("=" * 60)
+    for key in current:
+        if key in previous and previous[key] > 0:
+            change = (current[key] - previous[key]) / previous[key] * 100
+            print(f"   {key:<45} {previous[key]:9.3f} -> {current[key]:9.3f} ms  ({change:+.1f}%)")
+
+
+def run(
+    image_dir: Path,
+    torch_model: Path,
+    onnx_model: Path,
+    int8_model: Path,
+    batch_sizes: list[int],
+    repeat: int,
+    warmup: int,
+    backends: list[str]
+) -> dict:
+    print("=" * 60)
+    print("⏱️  Aadhaar Detection Pipeline Benchmark")
+    print("=" * 60)
+    print(f"\n📁 Images: {image_dir}")
+    print(f"🔁 Repeats: {repeat} (warmup {warmup}), batch sizes: {batch_sizes}")
+
+    samples = load_samples(image_dir)
+    if not samples:
+        print(f"❌ No sample images found in {image_dir}")
+        sys.exit(1)
+    print(f"📷 {len(samples)} sample image(s)")
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {"repeat": repeat, "warmup": warmup, "batch_sizes": batch_sizes, "input_size": MODEL_INPUT_SIZE},
+        "images": [
+            {"name": s["name"], "bytes": len(s["bytes"]), "decoded_shape": list(s["image"].shape),
+             "decode_factor": s["decode_factor"]}
+            for s in samples
+        ],
+        "stages": {},
+        "skipped": {}
+    }
+
+    print("\n🔹 Image stages:")
+    results["stages"]["image"] = bench_image_stages(samples, repeat, warmup)
+
+    targets = {"torch": ("torch", torch_model), "onnx_fp32": ("onnx", onnx_model), "onnx_int8": ("onnx", int8_model)}
+    for name in backends:
+        kind, model_path = targets[name]
+        print(f"\n🔹 {name} ({model_path.name}):")
+        backend, reason = load_backend(kind, model_path)
+        if backend is None:
+            print(f"   ⏭️  Skipped: {reason}")
+            results["skipped"][name] = reason
+            continue
+        results["stages"][name] = {"model": str(model_path), **bench_backend(backend, samples, batch_sizes, repeat, warmup)}
+
+    results["environment"] = environment()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the Aadhaar detection pipeline")
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGE_DIR, help="Directory of sample images")
+    parser.add_argument("--torch-model", type=Path,
+                        default=BASE_DIR / os.environ.get("MODEL1_PATH", "models/best4.pt"))
+    parser.add_argument("--onnx-model", type=Path,
+                        default=BASE_DIR / os.environ.get("ONNX_MODEL_PATH", MODEL_PATH))
+    parser.add_argument("--int8-model", type=Path, help="Defaults to <onnx-model>_int8.onnx (quantize_to_int8.py -i <onnx-model>)")
+    parser.add_argument("--backends", default="torch,onnx_fp32,onnx_int8",
+                        help="Comma-separated subset of torch, onnx_fp32, onnx_int8")
+    parser.add_argument("--batch-sizes", default="1,2", help="Comma-separated batch sizes for inference")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repeats per stage and image")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed warmup runs per stage and image")
+    parser.add_argument("--output", "-o", type=Path, default=Path("benchmark_results.json"), help="JSON results file")
+    parser.add_argument("--baseline", type=Path, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = set(backends) - {"torch", "onnx_fp32", "onnx_int8"}
+    if unknown:
+        parser.error(f"Unknown backend(s): {', '.join(sorted(unknown))}")
+    int8_model = args.int8_model or int8_model_path(args.onnx_model)
+
+    results = run(
+        args.images,
+        args.torch_model,
+        args.onnx_model,
+        int8_model,
+        [int(b) for b in args.batch_sizes.split(",")],
+        args.repeat,
+        args.warmup,
+        backends
+    )
+
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\n💾 Results saved to {args.output}")
+
+    if args.baseline:
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
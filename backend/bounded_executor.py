@@ -0,0 +1,144 @@
+"""
+Bounded thread-pool executor for blocking inference with load shedding.
+
+Requests that would queue behind more than max_queue pending jobs are rejected
+immediately with ExecutorSaturatedError (mapped to 503 + Retry-After by the
+API) instead of waiting in an unbounded backlog. The event loop never runs
+inference itself, so /health and other handlers stay responsive under load.
+"""
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Recent jobs kept for wait/run time statistics
+_TIMING_WINDOW = 1024
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """The inference queue is full; retry after retry_after seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BoundedInferenceExecutor:
+    """
+    Run blocking calls on max_workers threads with at most max_queue calls
+    waiting for a worker.
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 16, name: str = "inference"):
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must be >= 0")
+
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        # Admitted calls not yet finished, and how many of those are running
+        self._pending = 0
+        self._running = 0
+
+        # Stats
+        self.total_submitted = 0
+        self.total_rejected = 0
+        self._wait_times: deque = deque(maxlen=_TIMING_WINDOW)
+        self._run_times: deque = deque(maxlen=_TIMING_WINDOW)
+
+    @property
+    def queue_depth(self) -> int:
+        """Admitted calls waiting for a worker"""
+        return self._pending - self._running
+
+    @property
+    def saturated(self) -> bool:
+        """True if a new call would be rejected right now"""
+        return self._pending >= self.max_workers + self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        run_times = list(self._run_times)
+        avg_run = sum(run_times) / len(run_times) if run_times else 1.0
+        return max(1, math.ceil(avg_run * (self.queue_depth + 1) / self.max_workers))
+
+    def check_admission(self):
+        """
+        Cheap early check, e.g. before downloading a request's images.
+
+        Raises:
+            ExecutorSaturatedError: if a call submitted now would be rejected
+        """
+        if self.saturated:
+            with self._lock:
+                self.total_rejected += 1
+            raise ExecutorSaturatedError(self.retry_after())
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        Run fn(*args) on the pool and await its result.
+
+        Raises:
+            ExecutorSaturatedError: if the queue is already full
+        """
+        with self._lock:
+            if self.saturated:
+                self.total_rejected += 1
+                raise ExecutorSaturatedError(self.retry_after())
+            self._pending += 1
+            self.total_submitted += 1
+        submitted_at = time.perf_counter()
+
+        def call():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._wait_times.append(started_at - submitted_at)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    self._run_times.append(time.perf_counter() - started_at)
+
+        # Like asyncio.to_thread, run in a copy of the caller's context (request trace)
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._pool, context.run, call)
+
+    def shutdown(self):
+        """Stop accepting work and drop calls that haven't started"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Queue depth and wait/run times over the recent window"""
+        with self._lock:
+            waits = sorted(self._wait_times)
+            run_times = list(self._run_times)
+            in_flight = self._running
+            queue_depth = self._pending - self._running
+
+        def ms(seconds: float) -> float:
+            return round(seconds * 1000, 2)
+
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+            "queue_depth": queue_depth,
+            "total_submitted": self.total_submitted,
+            "total_rejected": self.total_rejected,
+            "avg_wait_ms": ms(sum(waits) / len(waits)) if waits else 0.0,
+            "p95_wait_ms": ms(waits[min(len(waits) - 1, int(len(waits) * 0.95))]) if waits else 0.0,
+            "max_wait_ms": ms(waits[-1]) if waits else 0.0,
+            "avg_run_ms": ms(sum(run_times) / len(run_times)) if run_times else 0.0
+        }
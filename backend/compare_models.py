@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Accuracy-vs-latency comparison of model variants.
+
+Runs the fp32 ONNX model (the reference), its int8 variant and optionally the
+.pt checkpoint over a directory of images through the same
+InferenceBackend.predict_batch the servers use, and reports side by side:
+- agreement with the reference: top class per image, and confidence deltas
+  for detections matched to a reference box (same class, IoU >= 0.5)
+- image-level precision/recall/F1 per class at our confidence thresholds
+  (CONFIDENCE_THRESHOLD / LOW_CONFIDENCE_THRESHOLD), given a labels file
+- box mAP@0.5 and mAP@0.5:0.95, given YOLO-format label files
+- predict_batch latency (mean/p50/p95)
+
+Labels (both optional):
+    --labels labels.json       {"aadharF.jpg": ["aadhar_front"], "pancard.jpg": []}
+    --yolo-labels labels_dir/  <image stem>.txt lines "class cx cy w h" (normalized),
+                               as used for training with ultralytics
+
+Detections are kept down to the lowest requested threshold (instead of
+predict_batch's usual 0.25 floor), so precision/recall at 0.15 and 0.10
+really are measured there; mAP is measured from that floor rather than over
+the full precision/recall curve ultralytics val reports.
+
+The report is written into model_info.json under "comparison", next to the
+"int8" block written by quantize_to_int8.py.
+
+Usage:
+    python compare_models.py --fp32 ../public/models/aadhaar_detector_v2.onnx --labels labels.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmark_pipeline import load_backend, summarize
+from image_decode import decode_image
+from onnx_detector import MODEL_INPUT_SIZE, MODEL_PATH, int8_model_path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_IMAGE_DIR = BASE_DIR.parent / "public" / "models"
+DEFAULT_MODEL_INFO = BASE_DIR.parent / "public" / "models" / "model_info.json"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+MATCH_IOU = 0.5
+MAP_IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def box_xyxy(bbox: dict) -> tuple[float, float, float, float]:
+    return bbox["x"], bbox["y"], bbox["x"] + bbox["width"], bbox["y"] + bbox["height"]
+
+
+def iou(a: tuple, b: tuple) -> float:
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def load_images(image_dir: Path) -> list[dict]:
+    """Decoded images (as the servers decode them) and their original sizes"""
+    images = []
+    for path in sorted(image_dir.iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        data = path.read_bytes()
+        image, factor = decode_image(data, MODEL_INPUT_SIZE)
+        if image is None:
+            print(f"   ⚠️ Skipping undecodable image: {path.name}")
+            continue
+        images.append({"name": path.name, "stem": path.stem, "image": image, "factor": factor})
+    return images
+
+
+def load_yolo_labels(labels_dir: Path, images: list[dict], class_names: dict) -> dict:
+    """Ground-truth boxes per image name, in decoded-image pixels"""
+    ground_truth = {}
+    for item in images:
+        label_path = labels_dir / f"{item['stem']}.txt"
+        if not label_path.exists():
+            continue
+        height, width = item["image"].shape[:2]
+        boxes = []
+        for line in label_path.read_text().splitlines():
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            class_id = int(parts[0])
+            cx, cy, w, h = (float(v) for v in parts[1:5])
+            boxes.append({
+                "class": class_names.get(class_id, str(class_id)),
+                "box": ((cx - w / 2) * width, (cy - h / 2) * height, (cx + w / 2) * width, (cy + h / 2) * height)
+            })
+        ground_truth[item["name"]] = boxes
+    return ground_truth
+
+
+def run_model(backend, images: list[dict], repeat: int) -> tuple[dict, dict]:
+    """Detections per image name, and predict_batch latency stats"""
+    detections = {}
+    samples_ns = []
+    backend.predict_batch([images[0]["image"]])  # warmup
+    for item in images:
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            result = backend.predict_batch([item["image"]])[0]
+            samples_ns.append(time.perf_counter_ns() - started)
+        detections[item["name"]] = result
+    return detections, summarize(samples_ns)
+
+
+def agreement(candidate: dict, reference: dict) -> dict:
+    """Top-class agreement and matched-detection confidence deltas against the reference model"""
+    top_matches = 0
+    deltas = []
+    unmatched = 0
+    for name, ref_detections in reference.items():
+        detections = candidate[name]
+        ref_top = ref_detections[0]["class"] if ref_detections else None
+        top = detections[0]["class"] if detections else None
+        top_matches += ref_top == top
+
+        used = set()
+        for ref in ref_detections:
+            best, best_iou = None, MATCH_IOU
+            for i, detection in enumerate(detections):
+                if i in used or detection["class"] != ref["class"]:
+                    continue
+                overlap = iou(box_xyxy(detection["bbox"]), box_xyxy(ref["bbox"]))
+                if overlap >= best_iou:
+                    best, best_iou = i, overlap
+            if best is None:
+                unmatched += 1
+            else:
+                used.add(best)
+                deltas.append(detections[best]["confidence"] - ref["confidence"])
+
+    deltas = np.abs(np.array(deltas)) if deltas else np.zeros(0)
+    return {
+        "top_class_agreement": round(top_matches / len(reference), 4) if reference else None,
+        "matched_detections": int(deltas.size),
+        "unmatched_reference_detections": unmatched,
+        "confidence_delta_mean": round(float(deltas.mean()), 4) if deltas.size else None,
+        "confidence_delta_max": round(float(deltas.max()), 4) if deltas.size else None
+    }
+
+
+def image_level_scores(detections: dict, labels: dict, classes: list[str], threshold: float) -> dict:
+    """Per-class precision/recall/F1 of "class present at >= threshold" decisions"""
+    per_class = {}
+    for class_name in classes:
+        tp = fp = fn = 0
+        for name, expected in labels.items():
+            if name not in detections:
+                continue
+            predicted = any(d["class"] == class_name and d["confidence"] >= threshold for d in detections[name])
+            actual = class_name in expected
+            tp += predicted and actual
+            fp += predicted and not actual
+            fn += actual and not predicted
+        if tp + fp + fn == 0:
+            continue
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_class[class_name] = {
+            "precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4),
+            "tp": tp, "fp": fp, "fn": fn
+        }
+    macro_f1 = np.mean([scores["f1"] for scores in per_class.values()]) if per_class else 0.0
+    return {"threshold": threshold, "macro_f1": round(float(macro_f1), 4), "per_class": per_class}
+
+
+def average_precision(detections: dict, ground_truth: dict, class_name: str, iou_threshold: float) -> float:
+    """VOC-style all-point interpolated AP for one class"""
+    predictions = sorted(
+        ((d["confidence"], name, box_xyxy(d["bbox"])) for name, dets in detections.items()
+         if name in ground_truth for d in dets if d["class"] == class_name),
+        key=lambda p: -p[0]
+    )
+    targets = {name: [g["box"] for g in boxes if g["class"] == class_name] for name, boxes in ground_truth.items()}
+    total = sum(len(boxes) for boxes in targets.values())
+    if total == 0:
+        return float("nan")
+
+    matched = {name: [False] * len(boxes) for name, boxes in targets.items()}
+    hits = []
+    for _, name, box in predictions:
+        best, best_iou = None, iou_threshold
+        for i, target in enumerate(targets[name]):
+            overlap = iou(box, target)
+            if not matched[name][i] and overlap >= best_iou:
+                best, best_iou = i, overlap
+        if best is not None:
+            matched[name][best] = True
+        hits.append(best is not None)
+
+    if not hits:
+        return 0.0
+    tp = np.cumsum(hits)
+    recall = np.concatenate(([0.0], tp / total, [1.0]))
+    precision = np.concatenate(([1.0], tp / np.arange(1, len(hits) + 1), [0.0]))
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+
+def box_map(detections: dict, ground_truth: dict, classes: list[str]) -> dict:
+    per_class = {}
+    for class_name in classes:
+        aps = [average_precision(detections, ground_truth, class_name, t) for t in MAP_IOU_THRESHOLDS]
+        if np.isnan(aps[0]):
+            continue
+        per_class[class_name] = {"ap50": round(aps[0], 4), "ap50_95": round(float(np.mean(aps)), 4)}
+    return {
+        "map50": round(float(np.mean([c["ap50"] for c in per_class.values()])), 4) if per_class else None,
+        "map50_95": round(float(np.mean([c["ap50_95"] for c in per_class.values()])), 4) if per_class else None,
+        "per_class": per_class
+    }
+
+
+def compare(
+    image_dir: Path,
+    models: dict,
+    labels_path: Path = None,
+    yolo_labels_dir: Path = None,
+    thresholds: tuple = (0.15, 0.10),
+    repeat: int = 3
+) -> dict:
+    """
+    Args:
+        models: {"fp32": path, "int8": path, "pt": path}; fp32 is the reference
+    """
+    print("=" * 60)
+    print("🔬 Model Accuracy vs Latency Comparison")
+    print("=" * 60)
+
+    images = load_images(image_dir)
+    if not images:
+        print(f"❌ No images found in {image_dir}")
+        sys.exit(1)
+    print(f"\n📷 {len(images)} image(s) from {image_dir}")
+
+    labels = json.loads(labels_path.read_text()) if labels_path else None
+    report = {
+        "imageDir": str(image_dir),
+        "images": len(images),
+        "labeledImages": len(labels) if labels else 0,
+        "thresholds": list(thresholds),
+        "detectionFloor": min(thresholds),
+        "reference": "fp32",
+        "models": {}
+    }
+
+    results = {}
+    class_names = None
+    for variant, model_path in models.items():
+        if model_path is None:
+            continue
+        print(f"\n🔹 {variant} ({Path(model_path).name})")
+        backend, reason = load_backend("torch" if variant == "pt" else "onnx", Path(model_path))
+        if backend is None:
+            print(f"   ⏭️  Skipped: {reason}")
+            report["models"][variant] = {"skipped": reason}
+            continue
+        backend.confidence_threshold = min(thresholds)
+        class_names = class_names or backend.class_names
+        detections, latency = run_model(backend, images, repeat)
+        results[variant] = detections
+        report["models"][variant] = {"model": Path(model_path).name, "latency": latency}
+        print(f"   ⚡ {latency['mean_ms']:.2f} ms mean, {latency['p95_ms']:.2f} ms p95")
+
+    if "fp32" not in results:
+        print("❌ The fp32 reference model is required")
+        sys.exit(1)
+
+    classes = [class_names[i] for i in sorted(class_names)]
+    ground_truth = load_yolo_labels(yolo_labels_dir, images, class_names) if yolo_labels_dir else None
+    reference_ms = report["models"]["fp32"]["latency"]["mean_ms"]
+
+    for variant, detections in results.items():
+        entry = report["models"][variant]
+        entry["speedup_vs_fp32"] = round(reference_ms / entry["latency"]["mean_ms"], 2)
+        if variant != "fp32":
+            entry["agreement"] = agreement(detections, results["fp32"])
+        if labels:
+            entry["image_level"] = [image_level_scores(detections, labels, classes, t) for t in thresholds]
+        if ground_truth:
+            entry["box"] = box_map(detections, ground_truth, classes)
+
+    print("\n" + "=" * 60)
+    print("📊 Side by side")
+    print("=" * 60)
+    for variant, entry in report["models"].items():
+        if "skipped" in entry:
+            continue
+        line = f"   {variant:<5} {entry['latency']['mean_ms']:8.2f} ms  ({entry['speedup_vs_fp32']:.2f}x)"
+        if "agreement" in entry:
+            a = entry["agreement"]
+            line += f"  top-class agree {a['top_class_agreement']:.1%}"
+            if a["confidence_delta_mean"] is not None:
+                line += f", |Δconf| mean {a['confidence_delta_mean']:.4f} max {a['confidence_delta_max']:.4f}"
+        if "image_level" in entry:
+            line += f"  F1@{thresholds[0]} {entry['image_level'][0]['macro_f1']:.3f}"
+        if "box" in entry and entry["box"]["map50"] is not None:
+            line += f"  mAP50 {entry['box']['map50']:.3f} mAP50-95 {entry['box']['map50_95']:.3f}"
+        print(line)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fp32, int8 and .pt models for accuracy and latency")
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGE_DIR, help="Directory of evaluation images")
+    parser.add_argument("--fp32", type=Path,
+                        default=BASE_DIR / os.environ.get("ONNX_MODEL_PATH", MODEL_PATH),
+                        help="Reference fp32 ONNX model")
+    parser.add_argument("--int8", type=Path, help="INT8 ONNX model (default: <fp32>_int8.onnx, from quantize_to_int8.py -i <fp32>)")
+    parser.add_argument("--pt", type=Path, help="Optional .pt checkpoint (needs torch/ultralytics)")
+    parser.add_argument("--labels", type=Path, help="JSON of image name -> list of classes present")
+    parser.add_argument("--yolo-labels", type=Path, help="Directory of YOLO-format .txt box labels")
+    parser.add_argument("--thresholds", default=os.environ.get("CONFIDENCE_THRESHOLD", "0.15") + ","
+                        + os.environ.get("LOW_CONFIDENCE_THRESHOLD", "0.10"),
+                        help="Comma-separated confidence thresholds for precision/recall")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image")
+    parser.add_argument("--model-info", type=Path, default=DEFAULT_MODEL_INFO,
+                        help="model_info.json to write the report into")
+    parser.add_argument("--no-save", action="store_true", help="Only print the report")
+    args = parser.parse_args()
+
+    int8_model = args.int8 or int8_model_path(args.fp32)
+    report = compare(
+        args.images,
+        {"fp32": args.fp32, "int8": int8_model, "pt": args.pt},
+        labels_path=args.labels,
+        yolo_labels_dir=args.yolo_labels,
+        thresholds=tuple(float(t) for t in args.thresholds.split(",")),
+        repeat=args.repeat
+    )
+
+    if not args.no_save:
+        model_info = json.loads(args.model_info.read_text()) if args.model_info.exists() else {}
+        model_info["comparison"] = report
+        args.model_info.write_text(json.dumps(model_info, indent=2))
+        print(f"\n💾 Comparison saved to {args.model_info} (\"comparison\")")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,14 +10,22 @@ Classes detected:
 - aadhar_long_front
 - other
 - print_aadhar
+
+Pass --dynamic-batch to also export a server-side model with a dynamic batch
+axis, used by AadhaarDetector.detect_batch() to run several images per call.
 """
 
 import os
 import sys
 from pathlib import Path
 
-def convert_to_onnx():
-    """Convert YOLOv8 best2.pt model to ONNX format optimized for browser."""
+def convert_to_onnx(dynamic_batch: bool = False):
+    """
+    Convert YOLOv8 best2.pt model to ONNX format optimized for browser.
+    
+    Args:
+        dynamic_batch: Also export a server model with a dynamic batch axis
+    """
     
     try:
         from ultralytics import YOLO
@@ -84,6 +92,27 @@ def convert_to_onnx():
     print(f"📁 Output: {final_path_small}")
     print(f"📊 Size: {final_path_small.stat().st_size / 1024 / 1024:.2f} MB")
     
+    # Server-side variant for batched inference. The browser models above stay
+    # static; only the backend loads this one.
+    final_path_batch = None
+    if dynamic_batch:
+        print("\n📦 Creating server model variant (640px, dynamic batch)...")
+        export_path_batch = model.export(
+            format="onnx",
+            imgsz=640,
+            simplify=True,
+            opset=12,
+            dynamic=True,         # Dynamic batch axis: [N, 3, 640, 640]
+            half=False,
+        )
+        
+        final_path_batch = output_dir / "aadhaar_detector_v2_batch.onnx"
+        shutil.move(export_path_batch, final_path_batch)
+        
+        print(f"✅ Batch model exported!")
+        print(f"📁 Output: {final_path_batch}")
+        print(f"📊 Size: {final_path_batch.stat().st_size / 1024 / 1024:.2f} MB")
+    
     # Create model info JSON for the frontend
     model_info = {
         "name": "aadhaar_detector_v2",
@@ -103,6 +132,12 @@ def convert_to_onnx():
         "precision": "float32",
         "description": "Aadhaar card detector with support for regular and long format cards"
     }
+    if final_path_batch is not None:
+        model_info["serverBatch"] = {
+            "filename": final_path_batch.name,
+            "inputSize": 640,
+            "dynamicBatch": True
+        }
     
     import json
     info_path = output_dir / "model_info_v2.json"
@@ -118,9 +153,18 @@ def convert_to_onnx():
     print(f"  1. {final_path.name} - Standard model (640px input)")
     print(f"  2. {final_path_small.name} - Small model (320px input)")
     print(f"  3. {info_path.name} - Model metadata")
+    if final_path_batch is not None:
+        print(f"  4. {final_path_batch.name} - Server model (640px, dynamic batch)")
     print("\nClasses supported:")
     for i, cls in enumerate(model_info["classes"]):
         print(f"  {i}: {cls}")
 
 if __name__ == "__main__":
-    convert_to_onnx()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Convert best.pt to ONNX")
+    parser.add_argument("--dynamic-batch", action="store_true",
+                        help="Also export a server model with a dynamic batch axis")
+    
+    args = parser.parse_args()
+    convert_to_onnx(dynamic_batch=args.dynamic_batch)
@@ -0,0 +1,109 @@
+"""
+Fast image decoding for detection.
+
+Phone photos are often 12 MP, but the model only sees 640px. For JPEGs we read
+the dimensions from the header first and let libjpeg decode straight to 1/2,
+1/4 or 1/8 scale in the DCT domain (cv2.IMREAD_REDUCED_COLOR_*), picking the
+smallest decode whose longer side still covers the model input size. Other
+formats are decoded normally.
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Largest reduction first
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# JPEG start-of-frame markers that carry the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+def read_jpeg_size(data) -> Optional[tuple[int, int]]:
+    """
+    Read (width, height) from a JPEG header without decoding pixels.
+
+    Returns None if the data isn't a JPEG or the header can't be parsed.
+    """
+    data = memoryview(data)
+    size = len(data)
+    if size < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    pos = 2
+    while pos + 4 <= size:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == 0xDA:
+            # Start of scan reached without a frame header
+            return None
+
+        segment_length = (data[pos + 2] << 8) | data[pos + 3]
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > size:
+                return None
+            height = (data[pos + 5] << 8) | data[pos + 6]
+            width = (data[pos + 7] << 8) | data[pos + 8]
+            return (width, height) if width and height else None
+        pos += 2 + segment_length
+
+    return None
+
+
+def choose_reduction(width: int, height: int, target_size: int) -> tuple[int, int]:
+    """
+    Pick the largest DCT reduction whose longer side still covers target_size.
+
+    Returns:
+        (factor, cv2 imread flag) - (1, cv2.IMREAD_COLOR) when no reduction fits
+    """
+    longest = max(width, height)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        # libjpeg rounds scaled dimensions up
+        if -(-longest // factor) >= target_size:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def decode_image(data, target_size: Optional[int] = 640) -> tuple[Optional[np.ndarray], int]:
+    """
+    Decode encoded image bytes to a BGR array, downscaling JPEGs during decode.
+
+    Args:
+        data: Encoded image (bytes, bytearray, memoryview or uint8 array)
+        target_size: Model input size the decoded image must still cover;
+            None disables reduced decoding
+
+    Returns:
+        (image or None if undecodable, reduction factor applied). Multiply
+        coordinates in the decoded image by the factor to get original pixels.
+    """
+    buffer = data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+
+    factor, flag = 1, cv2.IMREAD_COLOR
+    if target_size:
+        dimensions = read_jpeg_size(buffer)
+        if dimensions is not None:
+            factor, flag = choose_reduction(*dimensions, target_size)
+
+    image = cv2.imdecode(buffer, flag)
+    if image is None and factor != 1:
+        # Some unusual JPEGs refuse scaled decoding; fall back to a full decode
+        factor = 1
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    return image, factor
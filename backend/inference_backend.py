@@ -0,0 +1,228 @@
+"""
+Pluggable inference backends for the FastAPI servers.
+
+Both servers talk to a backend through predict_batch(), which returns plain
+detection dicts, so the /detect handlers don't care whether the model runs on
+ultralytics/torch or on ONNX Runtime. Select with INFERENCE_BACKEND=onnx|torch,
+or INFERENCE_BACKEND=remote to use a dedicated inference process (shm_inference.py).
+
+create_small_backend() builds the reduced-resolution (320px) variant the
+servers switch to under load (see model_selection.py).
+
+The torch backend imports torch and ultralytics lazily, so an ONNX-only
+worker never pays for loading them.
+"""
+
+import copy
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKEND_REMOTE = "remote"
+SUPPORTED_BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_REMOTE)
+
+# ultralytics predict() default (onnx_detector.NMS_CONFIDENCE_THRESHOLD matches it)
+DEFAULT_CONFIDENCE_THRESHOLD = 0.25
+
+
+class InferenceBackend:
+    """
+    Base class for inference backends.
+
+    predict_batch() returns, per image, a list of detections:
+        {"class_id": int, "class": str, "confidence": float,
+         "bbox": {"x", "y", "width", "height"}}
+    ordered by descending confidence, after NMS. Detections scoring below
+    confidence_threshold are dropped before NMS.
+
+    If a timings dict is passed, the backend adds the seconds this batch spent
+    in "preprocess", "inference" and "postprocess" to it.
+    """
+
+    name = "base"
+
+    def __init__(self, model_path: str):
+        if not Path(model_path).exists():
+            logger.critical(f"Model not found at {model_path}")
+            raise FileNotFoundError(f"Model not found at {model_path}")
+        self.model_path = model_path
+        self.device = "cpu"
+        self.class_names: dict[int, str] = {}
+        # Square model input in pixels (None = the model's own default)
+        self.input_size: Optional[int] = None
+        # Images per forward pass the model accepts (None = any; larger batches run in chunks)
+        self.max_batch_size: Optional[int] = None
+        self.confidence_threshold = DEFAULT_CONFIDENCE_THRESHOLD
+
+    def predict_batch(self, images: list[np.ndarray], timings: Optional[dict] = None) -> list[list[dict]]:
+        raise NotImplementedError
+
+    def predict(self, image: np.ndarray) -> list[dict]:
+        """Detections for a single image"""
+        return self.predict_batch([image])[0]
+
+    def info(self) -> dict:
+        """Backend details for /health"""
+        return {"backend": self.name, "device": self.device, "model_path": self.model_path, "input_size": self.input_size}
+
+    def close(self):
+        """Release resources held by the backend"""
+
+
+class TorchBackend(InferenceBackend):
+    """ultralytics YOLO on a .pt checkpoint (GPU when CUDA is available)"""
+
+    name = BACKEND_TORCH
+
+    def __init__(self, model_path: str, input_size: Optional[int] = None):
+        super().__init__(model_path)
+        import torch
+        from ultralytics import YOLO
+
+        self._torch = torch
+        if torch.cuda.is_available():
+            self.device = "cuda"
+            logger.info(f"CUDA available. Using GPU: {torch.cuda.get_device_name(0)}")
+        else:
+            self.device = "cpu"
+            logger.info("CUDA not available. Using CPU")
+
+        logger.info(f"Loading YOLO model from {model_path}")
+        self.model = YOLO(model_path)
+        self.class_names = {i: name for i, name in self.model.names.items()}
+        # ultralytics letterboxes to imgsz at predict time, so one checkpoint serves any size
+        self.input_size = input_size or self.model.overrides.get("imgsz", 640)
+
+    def at_input_size(self, input_size: int) -> "TorchBackend":
+        """This backend at another input size, sharing the loaded YOLO model"""
+        backend = copy.copy(self)
+        backend.input_size = input_size
+        return backend
+
+    def predict_batch(self, images: list[np.ndarray], timings: Optional[dict] = None) -> list[list[dict]]:
+        predictions = self.model(
+            images, device=self.device, imgsz=self.input_size, conf=self.confidence_threshold, verbose=False
+        )
+
+        if timings is not None and predictions:
+            # ultralytics reports per-image milliseconds averaged over the batch
+            for stage, ms in predictions[0].speed.items():
+                if ms is not None:
+                    timings[stage] = timings.get(stage, 0.0) + ms * len(images) / 1000
+
+        results = []
+        for prediction in predictions:
+            detections = []
+            for box in prediction.boxes:
+                class_id = int(box.cls[0])
+                x1, y1, x2, y2 = (float(v) for v in box.xyxy[0])
+                detections.append({
+                    "class_id": class_id,
+                    "class": self.class_names.get(class_id, "unknown"),
+                    "confidence": float(box.conf[0]),
+                    "bbox": {"x": x1, "y": y1, "width": x2 - x1, "height": y2 - y1}
+                })
+            results.append(detections)
+        return results
+
+    def info(self) -> dict:
+        torch = self._torch
+        cuda_available = torch.cuda.is_available()
+        return {
+            **super().info(),
+            "torch_version": torch.__version__,
+            "cuda_available": cuda_available,
+            "cuda_device_count": torch.cuda.device_count() if cuda_available else 0,
+            "cuda_device_name": torch.cuda.get_device_name(0) if cuda_available else "N/A"
+        }
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime on CPU via onnx_detector.AadhaarDetector - no torch import"""
+
+    name = BACKEND_ONNX
+
+    def __init__(self, model_path: str, profile: str = None):
+        super().__init__(model_path)
+        from onnx_detector import AadhaarDetector
+
+        logger.info(f"Loading ONNX model from {model_path}")
+        self.detector = AadhaarDetector(model_path, profile=profile)
+        self.class_names = dict(enumerate(self.detector.class_names))
+        self.input_size = self.detector.input_size
+        self.max_batch_size = self.detector.max_batch_size
+
+    def predict_batch(self, images: list[np.ndarray], timings: Optional[dict] = None) -> list[list[dict]]:
+        return self.detector.detect_all_batch(images, timings, self.confidence_threshold)
+
+    def info(self) -> dict:
+        import onnxruntime as ort
+
+        return {
+            **super().info(),
+            "onnxruntime_version": ort.__version__,
+            "providers": self.detector.session.get_providers(),
+            "ort_profile": self.detector.profile,
+            "ort_session_settings": self.detector.session_settings,
+            "max_batch_size": self.detector.max_batch_size
+        }
+
+
+def create_backend(name: str, torch_model_path: str, onnx_model_path: str) -> InferenceBackend:
+    """
+    Build the backend selected by INFERENCE_BACKEND.
+
+    Args:
+        name: "onnx", "torch" or "remote"
+        torch_model_path: .pt checkpoint used by the torch backend
+        onnx_model_path: .onnx model used by the onnx backend
+    """
+    name = name.strip().lower()
+    if name == BACKEND_TORCH:
+        backend = TorchBackend(torch_model_path)
+    elif name == BACKEND_ONNX:
+        backend = OnnxBackend(onnx_model_path)
+    elif name == BACKEND_REMOTE:
+        from shm_inference import create_remote_backend
+        backend = create_remote_backend()
+    else:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{name}', expected one of {SUPPORTED_BACKENDS}")
+
+    logger.info(f"Inference backend: {backend.name} on {backend.device}. Classes: {backend.class_names}")
+    return backend
+
+
+def create_small_backend(
+    backend: InferenceBackend,
+    small_onnx_model_path: str,
+    input_size: int = 320
+) -> Optional[InferenceBackend]:
+    """
+    Build the reduced-resolution variant of a full backend from create_backend(),
+    or None if there isn't one (remote backend, or no small ONNX export).
+
+    Args:
+        backend: The full backend
+        small_onnx_model_path: Small .onnx export (aadhaar_detector_v2_small.onnx)
+        input_size: Input size for the torch backend; ONNX models carry their own
+    """
+    if isinstance(backend, TorchBackend):
+        # Same checkpoint, letterboxed smaller: share the model instead of loading it twice
+        small_backend = backend.at_input_size(input_size)
+    elif isinstance(backend, OnnxBackend):
+        if not Path(small_onnx_model_path).exists():
+            logger.warning(f"Small model not found at {small_onnx_model_path}; adaptive model selection disabled")
+            return None
+        small_backend = OnnxBackend(small_onnx_model_path)
+    else:
+        logger.info(f"No small model variant for INFERENCE_BACKEND '{backend.name}'; adaptive model selection disabled")
+        return None
+
+    logger.info(f"Small model variant: {small_backend.name} at {small_backend.input_size}px")
+    return small_backend
@@ -0,0 +1,269 @@
+"""
+JWT verification with a verified-claims cache.
+
+The frontend reuses one token for the front and back images, retries and
+/review-queue polling, so most requests present a token that was already
+verified. TokenVerifier keys a bounded LRU by a hash of the raw token and
+holds the verified claims until the token's exp (capped at max_ttl, so a
+rotated key or secret takes effect within that window). Rejected tokens are
+cached too, for a shorter negative_ttl, so a client hammering with a bad or
+expired token doesn't cost a signature check per request.
+
+Keys are constructed once and reused:
+- HS* algorithms use JWT_SECRET_KEY
+- RS*/ES*/PS* use a JWKS key set fetched from JWT_JWKS_URL, cached for
+  jwks_ttl and refreshed early (at most every min_refresh seconds) when
+  a token names an unknown kid - or, without a JWKS URL, a PEM public key in
+  JWT_SECRET_KEY
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Optional
+
+from jose import JWTError, jwk, jwt
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_PREFIXES = ("RS", "ES", "PS")
+
+
+class TokenRejectedError(Exception):
+    """The token failed verification; detail is safe to return to the client"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class JWKSKeySet:
+    """Public keys from a JWKS endpoint, by kid, constructed once per fetch"""
+
+    def __init__(self, url: str, algorithm: str, ttl: float = 3600.0, min_refresh: float = 30.0, timeout: float = 5.0):
+        self.url = url
+        self.algorithm = algorithm
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.timeout = timeout
+
+        self._keys: dict[Optional[str], object] = {}
+        self._fetched_at = float("-inf")
+        self._lock = threading.Lock()
+
+        # Stats
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            document = json.load(response)
+        keys = {}
+        for key_data in document.get("keys", []):
+            if key_data.get("use", "sig") != "sig":
+                continue
+            try:
+                keys[key_data.get("kid")] = jwk.construct(key_data, key_data.get("alg", self.algorithm))
+            except JWTError as e:
+                logger.warning(f"Skipping JWKS key {key_data.get('kid')}: {e}")
+        self._keys = keys
+        self.fetches += 1
+        logger.info(f"Loaded {len(keys)} signing key(s) from {self.url}")
+
+    def _find(self, kid: Optional[str]):
+        key = self._keys.get(kid)
+        if key is None and kid is None and len(self._keys) == 1:
+            # Single-key sets may be used without a kid header
+            key = next(iter(self._keys.values()))
+        return key
+
+    def get(self, kid: Optional[str]):
+        """Key for kid, refetching the set if it is stale or kid is unknown; None if not found"""
+        key = self._find(kid)
+        if key is not None and time.monotonic() - self._fetched_at < self.ttl:
+            return key
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            key = self._find(kid)
+            age = time.monotonic() - self._fetched_at
+            if age >= self.ttl or (key is None and age >= self.min_refresh):
+                try:
+                    self._fetch()
+                    self._fetched_at = time.monotonic()
+                except Exception as e:
+                    # Keep serving the previous keys; retry after min_refresh
+                    self.fetch_errors += 1
+                    self._fetched_at = time.monotonic() - self.ttl + self.min_refresh
+                    logger.error(f"Failed to fetch JWKS from {self.url}: {e}")
+                key = self._find(kid)
+            return key
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "keys": len(self._keys),
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors
+        }
+
+
+class TokenVerifier:
+    """Thread-safe JWT verification with positive and negative result caching"""
+
+    def __init__(
+        self,
+        secret_key: str,
+        algorithm: str,
+        issuer: str,
+        jwks_url: Optional[str] = None,
+        max_entries: int = 10000,
+        max_ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+        jwks_ttl: float = 3600.0
+    ):
+        self.algorithm = algorithm
+        self.issuer = issuer
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+
+        self.jwks: Optional[JWKSKeySet] = None
+        self._key = None
+        if algorithm.startswith(ASYMMETRIC_PREFIXES) and jwks_url:
+            self.jwks = JWKSKeySet(jwks_url, algorithm, ttl=jwks_ttl)
+        else:
+            self._key = jwk.construct(secret_key, algorithm)
+
+        # token hash -> (expires_at (wall clock), claims) / (expires_at, detail)
+        self._verified: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        # Rejections get a smaller share so a flood of junk tokens can't evict good ones
+        self._rejected: OrderedDict[bytes, tuple[float, str]] = OrderedDict()
+        self._max_rejected = max(1, max_entries // 4)
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _cache_key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=32).digest()
+
+    def _lookup(self, key: bytes, now: float):
+        """(claims, None) on a verified hit, (None, detail) on a rejected hit, else (None, None)"""
+        with self._lock:
+            entry = self._verified.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._verified.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], None
+                del self._verified[key]
+            entry = self._rejected.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.negative_hits += 1
+                    return None, entry[1]
+                del self._rejected[key]
+            self.misses += 1
+        return None, None
+
+    def _store(self, entries: OrderedDict, limit: int, key: bytes, value: tuple):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > limit:
+                entries.popitem(last=False)
+
+    def _signing_key(self, token: str):
+        if self.jwks is None:
+            return self._key
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.jwks.get(kid)
+        if key is None:
+            raise JWTError(f"No signing key found for kid {kid!r}")
+        return key
+
+    def _verify(self, token: str) -> dict:
+        """Full verification (signature, expiry, issuer)"""
+        try:
+            payload = jwt.decode(
+                token,
+                self._signing_key(token),
+                algorithms=[self.algorithm],
+                options={"verify_aud": False}
+            )
+        except JWTError as e:
+            logger.error(f"JWT verification failed: {e}")
+            raise TokenRejectedError("Invalid or expired token")
+
+        if payload.get("iss") != self.issuer:
+            logger.warning(f"Invalid JWT issuer: {payload.get('iss')}")
+            raise TokenRejectedError("Invalid token issuer")
+
+        # jose checks exp too, but double-check
+        exp = payload.get("exp")
+        if exp and time.time() > exp:
+            logger.warning("JWT token expired")
+            raise TokenRejectedError("Token has expired")
+
+        logger.info(f"JWT verified for request_id: {payload.get('request_id', 'unknown')}")
+        return payload
+
+    def verify(self, token: str) -> dict:
+        """
+        Verified claims for token (a copy; safe to modify).
+
+        Raises:
+            TokenRejectedError: if the token is invalid, expired or from the wrong issuer
+        """
+        if not self.enabled:
+            return self._verify(token)
+
+        key = self._cache_key(token)
+        now = time.time()
+        claims, detail = self._lookup(key, now)
+        if claims is not None:
+            return dict(claims)
+        if detail is not None:
+            raise TokenRejectedError(detail)
+
+        try:
+            claims = self._verify(token)
+        except TokenRejectedError as e:
+            self._store(self._rejected, self._max_rejected, key, (now + self.negative_ttl, e.detail))
+            raise
+
+        expires_at = now + self.max_ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        self._store(self._verified, self.max_entries, key, (expires_at, claims))
+        return dict(claims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            stats = {
+                "enabled": self.enabled,
+                "algorithm": self.algorithm,
+                "verified_entries": len(self._verified),
+                "rejected_entries": len(self._rejected),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+            }
+        if self.jwks is not None:
+            stats["jwks"] = self.jwks.stats()
+        return stats
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+End-to-end load generator for the detection servers.
+
+Drives POST /detect (or /detect/binary) the way the frontend does: every
+request carries a freshly minted JWT (JWT_SECRET_KEY / JWT_ISSUER, read from
+the environment or .env like the servers), and images come from the samples
+in public/models/:
+- url:    main.py - passport_first/passport_old URLs served by a local static
+          file server started here (or --static-base-url)
+- base64: main_stateless.py /detect - base64 JSON payloads
+- binary: main_stateless.py /detect/binary - multipart uploads
+
+Load is either closed-loop (--concurrency workers, each sending its next
+request when the previous one finishes) or open-loop (--rate requests per
+second with Poisson arrivals, independent of response times). In open-loop
+mode latency is measured from each request's scheduled start, so a server
+that falls behind shows it in the percentiles instead of hiding it.
+
+Reports throughput, latency (mean/p50/p95/p99/max), error rates by status
+and the mean of each Server-Timing stage, and saves them as JSON.
+
+The servers rate-limit per user and IP; spread requests over --users or run
+them with RATE_LIMIT_ENABLED=false when measuring raw capacity. The sample
+images repeat, so main_stateless.py's result cache will answer most binary
+uploads; set RESULT_CACHE_MAX_BYTES=0 to measure the full pipeline.
+
+Usage:
+    python load_test.py --mode url --target http://localhost:8109 --concurrency 8 --duration 30
+    python load_test.py --mode base64 --target http://localhost:8109 --rate 20 --duration 60 -o stateless.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+import numpy as np
+from dotenv import load_dotenv
+from jose import jwt
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_IMAGE_DIR = BASE_DIR.parent / "public" / "models"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+MODES = ("url", "base64", "binary")
+
+
+class TokenMinter:
+    """Short-lived backend tokens with the same claims as the frontend's generateBackendToken"""
+
+    def __init__(self, secret_key: str, algorithm: str, issuer: str, users: int, ttl_seconds: int = 300):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.issuer = issuer
+        self.users = users
+        self.ttl_seconds = ttl_seconds
+
+    def mint(self, sequence: int) -> tuple[str, str]:
+        """(token, user_id) for the sequence-th request"""
+        user_id = f"loadtest-{sequence % self.users}"
+        now = int(time.time())
+        token = jwt.encode({
+            "request_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": "backend_request",
+            "iat": now,
+            "iss": self.issuer,
+            "exp": now + self.ttl_seconds
+        }, self.secret_key, algorithm=self.algorithm)
+        return token, user_id
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_static_server(directory: Path, host: str, port: int) -> ThreadingHTTPServer:
+    """Serve the sample images over HTTP for url mode"""
+    server = ThreadingHTTPServer((host, port), partial(_QuietHandler, directory=str(directory)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="static-files", daemon=True).start()
+    return server
+
+
+def load_images(image_dir: Path) -> list[tuple[str, bytes]]:
+    images = [
+        (path.name, path.read_bytes())
+        for path in sorted(image_dir.iterdir())
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if len(images) < 2:
+        raise SystemExit(f"Need at least two sample images in {image_dir}")
+    return images
+
+
+class RequestFactory:
+    """Pre-builds request bodies so the client spends its time sending, not encoding"""
+
+    def __init__(self, mode: str, images: list[tuple[str, bytes]], static_base_url: Optional[str], threshold: float):
+        self.mode = mode
+        # Front/back pairs cycle through the samples
+        pairs = [(images[i], images[(i + 1) % len(images)]) for i in range(len(images))]
+        self._bodies = []
+        for (front_name, front), (back_name, back) in pairs:
+            if mode == "url":
+                self._bodies.append(json.dumps({
+                    "user_id": "loadtest",
+                    "passport_first": f"{static_base_url}/{front_name}",
+                    "passport_old": f"{static_base_url}/{back_name}",
+                    "confidence_threshold": threshold
+                }).encode())
+            elif mode == "base64":
+                self._bodies.append(json.dumps({
+                    "user_id": "loadtest",
+                    "front_image": base64.b64encode(front).decode(),
+                    "back_image": base64.b64encode(back).decode(),
+                    "confidence_threshold": threshold
+                }).encode())
+            else:
+                self._bodies.append(((front_name, front), (back_name, back), threshold))
+
+    def build(self, sequence: int, user_id: str) -> dict:
+        """kwargs for aiohttp's session.post"""
+        body = self._bodies[sequence % len(self._bodies)]
+        if self.mode != "binary":
+            return {"data": body, "headers": {"Content-Type": "application/json"}}
+        (front_name, front), (back_name, back), threshold = body
+        form = aiohttp.FormData()
+        form.add_field("user_id", user_id)
+        form.add_field("confidence_threshold", str(threshold))
+        form.add_field("front_image", front, filename=front_name, content_type="application/octet-stream")
+        form.add_field("back_image", back, filename=back_name, content_type="application/octet-stream")
+        return {"data": form, "headers": {}}
+
+
+class Results:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.success_latencies: list[float] = []
+        self.statuses: dict[str, int] = {}
+        self.server_timing: dict[str, list[float]] = {}
+        self.started = 0
+        # Open-loop arrivals not sent because --max-in-flight was reached
+        self.client_dropped = 0
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+
+    def record(self, status: str, latency: float, server_timing: Optional[str]):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latencies.append(latency)
+        if status == "200":
+            self.success_latencies.append(latency)
+        for entry in (server_timing or "").split(","):
+            name, _, params = entry.strip().partition(";")
+            if params.startswith("dur="):
+                try:
+                    self.server_timing.setdefault(name, []).append(float(params[4:]))
+                except ValueError:
+                    pass
+
+    def report(self) -> dict:
+        def latency_stats(values: list[float]) -> dict:
+            if not values:
+                return {}
+            ms = np.array(values) * 1000
+            return {
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                "max_ms": round(float(ms.max()), 2)
+            }
+
+        completed = len(self.latencies)
+        successes = len(self.success_latencies)
+        elapsed = (self.last_end - self.first_start) if completed else 0.0
+        return {
+            "requests": completed,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+            "success_rps": round(successes / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(1 - successes / completed, 4) if completed else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+            "client_dropped": self.client_dropped,
+            "latency": latency_stats(self.latencies),
+            "success_latency": latency_stats(self.success_latencies),
+            "server_timing_mean_ms": {
+                name: round(sum(values) / len(values), 2) for name, values in self.server_timing.items()
+            }
+        }
+
+
+class LoadTest:
+    def __init__(self, session: aiohttp.ClientSession, endpoint: str, factory: RequestFactory,
+                 minter: TokenMinter, timeout: float):
+        self.session = session
+        self.endpoint = endpoint
+        self.factory = factory
+        self.minter = minter
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._sequence = 0
+
+    async def send(self, results: Optional[Results], scheduled: Optional[float] = None):
+        """One request; latency counts from scheduled (open loop) or from now"""
+        sequence = self._sequence
+        self._sequence += 1
+        token, user_id = self.minter.mint(sequence)
+        kwargs = self.factory.build(sequence, user_id)
+        kwargs["headers"] = {**kwargs["headers"], "Authorization": f"Bearer {token}"}
+
+        started = scheduled if scheduled is not None else time.perf_counter()
+        server_timing = None
+        try:
+            async with self.session.post(self.endpoint, timeout=self.timeout, **kwargs) as response:
+                await response.read()
+                status = str(response.status)
+                server_timing = response.headers.get("Server-Timing")
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except aiohttp.ClientError as e:
+            status = type(e).__name__
+        ended = time.perf_counter()
+
+        if results is not None:
+            if results.first_start is None or started < results.first_start:
+                results.first_start = started
+            results.last_end = ended if results.last_end is None else max(results.last_end, ended)
+            results.record(status, ended - started, server_timing)
+
+    async def closed_loop(self, results: Results, concurrency: int, stop_at: float, max_requests: Optional[int]):
+        async def worker():
+            while time.perf_counter() < stop_at and (max_requests is None or results.started < max_requests):
+                results.started += 1
+                await self.send(results)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def open_loop(self, results: Results, rate: float, stop_at: float, max_requests: Optional[int],
+                        max_in_flight: int, rng: random.Random):
+        in_flight: set[asyncio.Task] = set()
+        next_at = time.perf_counter()
+        while next_at < stop_at and (max_requests is None or results.started < max_requests):
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                # Client-side cap reached; count it instead of queueing unboundedly
+                results.client_dropped += 1
+            else:
+                results.started += 1
+                task = asyncio.create_task(self.send(results, scheduled=next_at))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            next_at += rng.expovariate(rate)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+
+async def run(args) -> dict:
+    images = load_images(args.images)
+    static_server = None
+    static_base_url = args.static_base_url
+    if args.mode == "url" and not static_base_url:
+        static_server = start_static_server(args.images, args.static_host, args.static_port)
+        static_base_url = f"http://{args.static_host}:{static_server.server_address[1]}"
+        print(f"📁 Serving {args.images} at {static_base_url}")
+
+    endpoint = args.target.rstrip("/") + ("/detect/binary" if args.mode == "binary" else "/detect")
+    factory = RequestFactory(args.mode, images, static_base_url, args.confidence_threshold)
+    minter = TokenMinter(
+        os.environ.get("JWT_SECRET_KEY", "your-super-secret-key-change-in-production"),
+        os.environ.get("JWT_ALGORITHM", "HS256"),
+        os.environ.get("JWT_ISSUER", "ai-verification-frontend"),
+        args.users
+    )
+    load = f"{args.rate} req/s open loop" if args.rate else f"{args.concurrency} concurrent (closed loop)"
+    print(f"🎯 {endpoint} [{args.mode}], {load}, {args.duration}s"
+          + (f" or {args.requests} requests" if args.requests else ""))
+
+    connector = aiohttp.TCPConnector(limit=0)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            test = LoadTest(session, endpoint, factory, minter, args.timeout)
+
+            if args.warmup:
+                print(f"🔥 Warmup: {args.warmup} request(s)")
+                await asyncio.gather(*(test.send(None) for _ in range(args.warmup)))
+
+            results = Results()
+            stop_at = time.perf_counter() + args.duration
+            if args.rate:
+                await test.open_loop(results, args.rate, stop_at, args.requests, args.max_in_flight,
+                                     random.Random(args.seed))
+            else:
+                await test.closed_loop(results, args.concurrency, stop_at, args.requests)
+    finally:
+        if static_server is not None:
+            static_server.shutdown()
+
+    return {
+        "label": args.label,
+        "target": endpoint,
+        "mode": args.mode,
+        "load": {"rate": args.rate, "concurrency": None if args.rate else args.concurrency,
+                 "duration_s": args.duration, "max_requests": args.requests, "users": args.users},
+        **results.report()
+    }
+
+
+def print_report(report: dict):
+    print("\n" + "=" * 60)
+    print(f"📊 {report['label'] or report['target']}")
+    print("=" * 60)
+    print(f"   Requests:   {report['requests']} in {report['elapsed_s']}s")
+    print(f"   Throughput: {report['throughput_rps']} req/s ({report['success_rps']} successful/s)")
+    print(f"   Error rate: {report['error_rate']:.2%}  {report['statuses']}")
+    if report["client_dropped"]:
+        print(f"   ⚠️ {report['client_dropped']} arrival(s) not sent: --max-in-flight reached")
+    for key, title in (("latency", "All"), ("success_latency", "200 OK")):
+        stats = report[key]
+        if stats:
+            print(f"   {title:<7} latency: mean {stats['mean_ms']} ms, p50 {stats['p50_ms']} ms, "
+                  f"p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms")
+    if report["server_timing_mean_ms"]:
+        stages = ", ".join(f"{name} {ms}" for name, ms in report["server_timing_mean_ms"].items())
+        print(f"   Server-Timing (mean ms): {stages}")
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Load-test the Aadhaar detection servers")
+    parser.add_argument("--target", default="http://localhost:8109", help="Server base URL")
+    parser.add_argument("--mode", choices=MODES, default="url",
+                        help="url (main.py), base64 or binary (main_stateless.py)")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Closed-loop workers")
+    parser.add_argument("--rate", "-r", type=float, help="Open-loop arrival rate (req/s); overrides --concurrency")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Open-loop cap on outstanding requests")
+    parser.add_argument("--duration", "-d", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", "-n", type=int, help="Stop after this many requests")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests sent first")
+    parser.add_argument("--users", type=int, default=1000, help="Distinct user_ids to spread requests over")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--confidence-threshold", type=float, default=0.15)
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGE_DIR, help="Directory of sample images")
+    parser.add_argument("--static-base-url", help="Existing server for url mode instead of the built-in one")
+    parser.add_argument("--static-host", default="127.0.0.1")
+    parser.add_argument("--static-port", type=int, default=8765, help="Built-in static server port (0 = any)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for open-loop arrivals")
+    parser.add_argument("--label", help="Name for this run in the report")
+    parser.add_argument("--output", "-o", type=Path, help="Save the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
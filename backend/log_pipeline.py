@@ -0,0 +1,200 @@
+"""
+Asynchronous logging for the API servers.
+
+configure_logging() replaces logging.basicConfig: request threads only put
+records on a bounded queue (QueueHandler) and a QueueListener thread does the
+formatting and stream I/O, so a slow terminal or log collector can't add
+latency to requests. If the queue fills up, records are dropped and counted
+rather than blocking the caller.
+
+- Output is the usual text line or, with fmt="json", one JSON object per
+  line, including the X-Request-ID of the request that logged it.
+- uvicorn's own loggers (including the access log) are routed through the
+  same queue.
+- sampled_logger() returns a logger for per-request/per-detection INFO lines
+  that are sampled and rate-limited, so they don't scale with traffic.
+  Warnings and errors always pass.
+
+Hot-path debug output (e.g. per-inference tensor shapes in onnx_detector) is
+guarded by module-level constants read once at import, so when disabled it
+costs a single branch and its arguments are never built.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from tracing import current_request_id
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Tag records with the current request's X-Request-ID (runs in the caller's thread, before queueing)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: timestamp, level, logger, message, request_id, extras"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops records when full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only snapshot the message (args may change once we return); the
+        # formatter, timestamps and tracebacks are rendered on the listener thread
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Pass a sample_rate fraction of INFO/DEBUG records, at most max_per_second
+    of them (token bucket, burst of one second). WARNING and above always pass.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_per_second: float = 0.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._tokens = max_per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.suppressed += 1
+            return False
+        if self.max_per_second > 0:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.max_per_second, self._tokens + (now - self._updated) * self.max_per_second)
+                self._updated = now
+                if self._tokens < 1.0:
+                    self.suppressed += 1
+                    return False
+                self._tokens -= 1.0
+        return True
+
+
+def configure_logging(level: str = "INFO", fmt: str = "text", use_queue: bool = True, queue_size: int = 10000):
+    """
+    Set up root logging for this process.
+
+    Args:
+        level: Root log level name
+        fmt: "text" (the classic single line) or "json"
+        use_queue: Format and write on a background thread (False = inline, e.g. for debugging)
+        queue_size: Records buffered before new ones are dropped
+    """
+    global _listener, _queue_handler
+    stop_logging()
+
+    fmt = fmt.strip().lower()
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Unknown log format '{fmt}', expected 'text' or 'json'")
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level.strip().upper())
+
+    if use_queue:
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        _queue_handler.addFilter(RequestIdFilter())
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        root.addHandler(_queue_handler)
+    else:
+        stream_handler.addFilter(RequestIdFilter())
+        root.addHandler(stream_handler)
+
+    # uvicorn installs its own synchronous handlers; send its records through ours
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+atexit.register(stop_logging)
+
+
+def sampled_logger(name: str, sample_rate: float = 1.0, max_per_second: float = 0.0) -> logging.Logger:
+    """Logger whose INFO/DEBUG records are sampled and rate-limited (see SamplingFilter)"""
+    sampled = logging.getLogger(name)
+    for existing in [f for f in sampled.filters if isinstance(f, SamplingFilter)]:
+        sampled.removeFilter(existing)
+    sampled.addFilter(SamplingFilter(sample_rate, max_per_second))
+    return sampled
+
+
+def stats() -> dict:
+    """Whether logging is queued, the current backlog and records dropped so far"""
+    return {
+        "async": _listener is not None,
+        "queued": _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+        "dropped": _queue_handler.dropped if _queue_handler is not None else 0
+    }
@@ -1,90 +1,110 @@
 import asyncio
+import contextvars
 import hashlib
 import logging
+import mmap
 import os
-import shutil
 import sys
-import tempfile
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
-import aiofiles
 import aiohttp
-import cv2
-import torch
+import numpy as np
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
 from pydantic import BaseModel
-from ultralytics import YOLO
+
+from bounded_executor import BoundedInferenceExecutor, ExecutorSaturatedError
+from image_decode import decode_image
+from inference_backend import InferenceBackend, create_backend, create_small_backend
+from jwt_verifier import TokenRejectedError, TokenVerifier
+import log_pipeline
+from log_pipeline import configure_logging, sampled_logger
+from metrics import (
+    MetricsMiddleware, count_detections, metrics_response, observe_batch, record_model_selection,
+    record_verdict, stage_timer, track_queue_depth
+)
+from model_selection import (
+    HINT_HEADER, VARIANT_FULL, VARIANT_SMALL, InvalidModelHintError, ModelDecision, ModelSelector, parse_hint
+)
+from rate_limit import BucketSpec, client_ip, create_rate_limiter, request_buckets
+import tracing
+from tracing import TracingMiddleware, record_timings
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging: formatting and I/O happen on a background thread.
+# LOG_FORMAT=json for structured output; per-request INFO lines go through
+# request_logger, which is sampled (LOG_SAMPLE_RATE) and capped per second.
+configure_logging(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    fmt=os.environ.get("LOG_FORMAT", "text"),
+    use_queue=os.environ.get("LOG_ASYNC", "true").strip().lower() in ("1", "true", "yes", "on")
 )
 logger = logging.getLogger(__name__)
+request_logger = sampled_logger(
+    f"{__name__}.requests",
+    sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", "1.0")),
+    max_per_second=float(os.environ.get("LOG_MAX_PER_SECOND", "50"))
+)
 
 # --- JWT Configuration ---
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-super-secret-key-change-in-production")
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 JWT_ISSUER = os.environ.get("JWT_ISSUER", "ai-verification-frontend")
+# JWKS endpoint for RS*/ES*/PS* algorithms (else JWT_SECRET_KEY holds the secret or PEM public key)
+JWT_JWKS_URL = os.environ.get("JWT_JWKS_URL", "")
+# Verified tokens are cached until exp (at most JWT_CACHE_MAX_TTL seconds);
+# rejected ones for JWT_NEGATIVE_CACHE_TTL. JWT_CACHE_SIZE=0 disables caching.
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_MAX_TTL = float(os.environ.get("JWT_CACHE_MAX_TTL", "300"))
+JWT_NEGATIVE_CACHE_TTL = float(os.environ.get("JWT_NEGATIVE_CACHE_TTL", "30"))
 
 # CORS Configuration
 ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",")
 
+# Optional per-request latency budget. Not enforced here; a request whose
+# budget the full model would miss is served by the small one instead.
+LATENCY_BUDGET_HEADER = "X-Request-Timeout-Ms"
+
+# Clients may pick the model with X-Model-Hint only when the operator allows it;
+# otherwise load and the latency budget alone switch requests to the small model
+ALLOW_MODEL_HINT = os.environ.get("ALLOW_MODEL_HINT", "false").strip().lower() in ("1", "true", "yes", "on")
+
 security = HTTPBearer()
 
 
+token_verifier = TokenVerifier(
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    JWT_ISSUER,
+    jwks_url=JWT_JWKS_URL or None,
+    max_entries=JWT_CACHE_SIZE,
+    max_ttl=JWT_CACHE_MAX_TTL,
+    negative_ttl=JWT_NEGATIVE_CACHE_TTL
+)
+
+
 def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """
     Verify JWT token from Authorization header.
     Returns the decoded payload if valid.
     """
-    token = credentials.credentials
     try:
-        payload = jwt.decode(
-            token,
-            JWT_SECRET_KEY,
-            algorithms=[JWT_ALGORITHM],
-            options={"verify_aud": False}
-        )
-        
-        # Verify issuer
-        if payload.get("iss") != JWT_ISSUER:
-            logger.warning(f"Invalid JWT issuer: {payload.get('iss')}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token issuer",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        # Check expiration (jose library handles this, but double-check)
-        exp = payload.get("exp")
-        if exp and datetime.utcnow().timestamp() > exp:
-            logger.warning("JWT token expired")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        logger.info(f"JWT verified for request_id: {payload.get('request_id', 'unknown')}")
-        return payload
-        
-    except JWTError as e:
-        logger.error(f"JWT verification failed: {e}")
+        with stage_timer("jwt_verify"):
+            return token_verifier.verify(credentials.credentials)
+    except TokenRejectedError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            detail=e.detail,
             headers={"WWW-Authenticate": "Bearer"},
         )
 
@@ -94,44 +114,70 @@ def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(securit
 class AadhaarCardDetector:
     """Simple pipeline to detect Aadhaar front and back cards"""
     
-    def __init__(self, model_path: str):
-        """Initialize the detector with YOLO model"""
-        # Check CUDA availability
-        if torch.cuda.is_available():
-            self.device = "cuda"
-            logger.info(f"CUDA available. Using GPU: {torch.cuda.get_device_name(0)}")
-        else:
-            self.device = "cpu"
-            logger.info("CUDA not available. Using CPU")
-        
-        # Load YOLO model
-        logger.info(f"Loading YOLO model from {model_path}")
-        if not Path(model_path).exists():
-            logger.critical(f"Model not found at {model_path}")
-            raise FileNotFoundError(f"Model not found at {model_path}")
-        
-        self.model = YOLO(model_path)
-        self.card_classes = {i: name for i, name in self.model.names.items()}
+    def __init__(self, backend: InferenceBackend, small_backend: Optional[InferenceBackend] = None):
+        """Initialize the detector with an inference backend (torch or onnx) and optional 320px variant"""
+        self.backend = backend
+        self.backends = {VARIANT_FULL: backend}
+        if small_backend is not None:
+            self.backends[VARIANT_SMALL] = small_backend
+        self.device = backend.device
+        self.card_classes = backend.class_names
+        self._decode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="decode")
         logger.info(f"Model loaded successfully. Classes: {self.card_classes}")
     
+    def _decode(self, side: str, data) -> np.ndarray:
+        """Decode an encoded image buffer (bytes, bytearray or mmap)"""
+        with stage_timer("image_decode"):
+            image, _ = decode_image(data, config.MODEL_INPUT_SIZE)
+        if image is None:
+            raise ValueError(f"Failed to decode {side} image")
+        return image
+    
+    def _apply_detections(self, result: dict, side: str, detections: list[dict], confidence_threshold: float):
+        """Fold one side's detections into the combined result"""
+        for detection in detections:
+            confidence = detection["confidence"]
+            if confidence < confidence_threshold:
+                continue
+            
+            class_name = detection["class"]
+            
+            if class_name == 'print_aadhar':
+                result["print_aadhar_detected"] = True
+                logger.warning(f"Print Aadhaar detected in {side} image!")
+                # Potentially return early if this is a hard failure
+                # return result
+            
+            elif class_name == f'aadhar_{side}':
+                result[f"{side}_detected"] = True
+                result[f"{side}_confidence"] = confidence
+                result["details"][side].append({
+                    "class": class_name,
+                    "confidence": confidence
+                })
+                request_logger.info(f"✓ {side.capitalize()} card detected (confidence: {confidence:.2%})")
+    
     def detect_cards(
         self, 
-        front_image_path: Optional[str] = None, 
-        back_image_path: Optional[str] = None, 
-        confidence_threshold: float = 0.15
+        front_image=None, 
+        back_image=None, 
+        confidence_threshold: float = 0.15,
+        variant: str = VARIANT_FULL
     ) -> dict:
         """
-        Detect Aadhaar cards in front and/or back images
+        Detect Aadhaar cards in front and/or back images.
+        Both images are decoded in parallel and run through the model as one batch.
         
         Args:
-            front_image_path: Path to front image (optional)
-            back_image_path: Path to back image (optional)
+            front_image: Encoded front image bytes or mmap (optional)
+            back_image: Encoded back image bytes or mmap (optional)
             confidence_threshold: Minimum confidence for detection
+            variant: VARIANT_FULL or VARIANT_SMALL model (see model_selection.py)
             
         Returns:
             Dictionary with detection results
         """
-        logger.info(f"Starting card detection (threshold: {confidence_threshold})")
+        request_logger.info(f"Starting card detection (threshold: {confidence_threshold})")
         
         result = {
             "front_detected": False,
@@ -145,78 +191,56 @@ class AadhaarCardDetector:
             }
         }
         
-        # Detect in front image if path is provided
-        if front_image_path and os.path.exists(front_image_path):
-            try:
-                logger.info(f"Processing front image: {Path(front_image_path).name}")
-                front_results = self.model(str(front_image_path), device=self.device)
-                
-                for box in front_results[0].boxes:
-                    confidence = float(box.conf[0])
-                    if confidence < confidence_threshold:
-                        continue
-                    
-                    class_id = int(box.cls[0])
-                    class_name = self.card_classes.get(class_id, "unknown")
-                    
-                    if class_name == 'print_aadhar':
-                        result["print_aadhar_detected"] = True
-                        logger.warning("Print Aadhaar detected in front image!")
-                        # Potentially return early if this is a hard failure
-                        # return result
-                    
-                    elif class_name == 'aadhar_front':
-                        result["front_detected"] = True
-                        result["front_confidence"] = confidence
-                        result["details"]["front"].append({
-                            "class": class_name,
-                            "confidence": confidence
-                        })
-                        logger.info(f"✓ Front card detected (confidence: {confidence:.2%})")
-            
-            except Exception as e:
-                logger.error(f"Error processing front image: {e}")
-                result["details"]["front"].append({"error": str(e)})
-        elif front_image_path:
-            # Path was provided but file not found
-            result["details"]["front"].append({"error": "Front image not found at path"})
-            logger.error(f"Front image not found at {front_image_path}")
-
-        # Detect in back image if path is provided
-        if back_image_path and os.path.exists(back_image_path):
+        encoded = {}
+        for side, data in (("front", front_image), ("back", back_image)):
+            if data is None:
+                continue
+            if len(data) == 0:
+                result["details"][side].append({"error": f"{side.capitalize()} image is empty"})
+                logger.error(f"{side.capitalize()} image is empty")
+                continue
+            request_logger.info(f"Processing {side} image ({len(data)} bytes)")
+            encoded[side] = data
+        
+        # Decode both sides concurrently (cv2 releases the GIL while decoding),
+        # each in a copy of this request's context so decode spans join its trace
+        futures = {
+            side: self._decode_pool.submit(contextvars.copy_context().run, self._decode, side, data)
+            for side, data in encoded.items()
+        }
+        images = {}
+        for side, future in futures.items():
             try:
-                logger.info(f"Processing back image: {Path(back_image_path).name}")
-                back_results = self.model(str(back_image_path), device=self.device)
-                
-                for box in back_results[0].boxes:
-                    confidence = float(box.conf[0])
-                    if confidence < confidence_threshold:
-                        continue
-                    
-                    class_id = int(box.cls[0])
-                    class_name = self.card_classes.get(class_id, "unknown")
-                    
-                    if class_name == 'print_aadhar':
-                        result["print_aadhar_detected"] = True
-                        logger.warning("Print Aadhaar detected in back image!")
-                        # return result
-                    
-                    elif class_name == 'aadhar_back':
-                        result["back_detected"] = True
-                        result["back_confidence"] = confidence
-                        result["details"]["back"].append({
-                            "class": class_name,
-                            "confidence": confidence
-                        })
-                        logger.info(f"✓ Back card detected (confidence: {confidence:.2%})")
-            
+                images[side] = future.result()
             except Exception as e:
-                logger.error(f"Error processing back image: {e}")
-                result["details"]["back"].append({"error": str(e)})
-        elif back_image_path:
-            # Path was provided but file not found
-            result["details"]["back"].append({"error": "Back image not found at path"})
-            logger.error(f"Back image not found at {back_image_path}")
+                logger.error(f"Error processing {side} image: {e}")
+                result["details"][side].append({"error": str(e)})
+        
+        # Decoded images don't reference the encoded buffers; unmap local files
+        # here, in the worker that used them, not from the (possibly cancelled) handler
+        close_mapped(front_image)
+        close_mapped(back_image)
+        
+        if not images:
+            return result
+        
+        # One forward pass for both sides
+        timings = {}
+        try:
+            batch_detections = self.backends[variant].predict_batch(list(images.values()), timings)
+            observe_batch(len(images), timings, variant)
+            record_timings(timings)
+            if model_selector is not None:
+                model_selector.observe(variant, sum(timings.values()))
+        except Exception as e:
+            for side in images:
+                logger.error(f"Error processing {side} image: {e}")
+                result["details"][side].append({"error": str(e)})
+            return result
+        
+        for side, detections in zip(images, batch_detections):
+            count_detections(detections, confidence_threshold)
+            self._apply_detections(result, side, detections, confidence_threshold)
         
         return result
 
@@ -235,22 +259,77 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type", "X-Request-ID"],
-    expose_headers=["X-Request-ID"],
+    allow_headers=["Authorization", "Content-Type", "X-Request-ID", LATENCY_BUDGET_HEADER] + ([HINT_HEADER] if ALLOW_MODEL_HINT else []),
+    expose_headers=["X-Request-ID", "Retry-After", "Server-Timing", "X-Model-Variant"],
     max_age=600,  # Cache preflight for 10 minutes
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 class Config:
     """Application configuration"""
     BASE_DIR = Path(__file__).parent
     MODEL_PATH = BASE_DIR / os.environ.get("MODEL1_PATH", "models/best4.pt")
-    DOWNLOAD_DIR = BASE_DIR / Path(os.environ.get("DOWNLOAD_DIR", "temp/downloads"))
+    ONNX_MODEL_PATH = BASE_DIR / os.environ.get("ONNX_MODEL_PATH", "../public/models/aadhaar_detector_v2.onnx")
+    # "onnx" runs ONNX Runtime without importing torch; "torch" uses ultralytics on MODEL_PATH
+    INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+    # JPEGs are decoded at reduced scale as long as they still cover this size
+    MODEL_INPUT_SIZE = int(os.environ.get("MODEL_INPUT_SIZE", "640"))
     DEFAULT_CONFIDENCE_THRESHOLD = float(os.environ.get("CONFIDENCE_THRESHOLD", "0.15"))
+    # Shared HTTP client for image downloads (keep-alive pool, cached DNS)
+    HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+    HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "20"))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "30"))
+    HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", "300"))
+    DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", "30"))
+    # Downloads larger than this are rejected while streaming
+    DOWNLOAD_MAX_BYTES = int(os.environ.get("DOWNLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+    # Inference runs on INFERENCE_WORKERS threads; requests beyond
+    # INFERENCE_MAX_QUEUE waiting jobs get 503 + Retry-After
+    INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "1"))
+    INFERENCE_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", "16"))
+    # 320px variant served under load: the small ONNX export, or the .pt at
+    # SMALL_MODEL_INPUT_SIZE for the torch backend. Requests switch to it once
+    # ADAPTIVE_MODEL_QUEUE_DEPTH jobs are waiting (well before INFERENCE_MAX_QUEUE
+    # sheds them), when the full model would miss their X-Request-Timeout-Ms
+    # budget, or on X-Model-Hint when ALLOW_MODEL_HINT is set.
+    ADAPTIVE_MODEL_ENABLED = os.environ.get("ADAPTIVE_MODEL_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+    SMALL_ONNX_MODEL_PATH = BASE_DIR / os.environ.get("SMALL_ONNX_MODEL_PATH", "../public/models/aadhaar_detector_v2_small.onnx")
+    SMALL_MODEL_INPUT_SIZE = int(os.environ.get("SMALL_MODEL_INPUT_SIZE", "320"))
+    ADAPTIVE_MODEL_QUEUE_DEPTH = int(os.environ.get("ADAPTIVE_MODEL_QUEUE_DEPTH", "4"))
+    # Token-bucket rate limiting per JWT identity and per client IP, checked
+    # before any image work. Shared across workers when REDIS_URL is set.
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+    RATE_LIMIT_USER = BucketSpec.per_minute(
+        float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "30")),
+        float(os.environ.get("RATE_LIMIT_USER_BURST", "10"))
+    )
+    RATE_LIMIT_IP = BucketSpec.per_minute(
+        float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "300")),
+        float(os.environ.get("RATE_LIMIT_IP_BURST", "60"))
+    )
+    # Only enable behind a proxy that sets X-Forwarded-For
+    RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").strip().lower() in ("1", "true", "yes", "on")
+    # Per-IP bucket. Behind the frontend or a proxy every caller shares its address
+    # unless X-Forwarded-For is trusted, so it is on by default only then
+    RATE_LIMIT_IP_ENABLED = os.environ.get(
+        "RATE_LIMIT_IP_ENABLED", "true" if RATE_LIMIT_TRUST_FORWARDED else "false"
+    ).strip().lower() in ("1", "true", "yes", "on")
+    REDIS_URL = os.environ.get("REDIS_URL", "")
+    # Request tracing: Server-Timing headers always; spans exported when
+    # TRACE_EXPORTER is "file" (JSON lines at TRACE_FILE) or "otlp" (collector)
+    TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none")
+    TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+    TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
 
 
 config = Config()
 detector: Optional[AadhaarCardDetector] = None
+http_session: Optional[aiohttp.ClientSession] = None
+inference_executor: Optional[BoundedInferenceExecutor] = None
+model_selector: Optional[ModelSelector] = None
+rate_limiter = None
 
 
 class DetectionRequest(BaseModel):
@@ -264,13 +343,53 @@ class DetectionRequest(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Initialize the detector on startup"""
-    global detector
+    global detector, http_session, inference_executor, model_selector, rate_limiter
     try:
-        # Create necessary directories
-        config.DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        # One pooled client for the app's lifetime, so repeated downloads from
+        # the same storage host reuse TCP/TLS connections
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=config.HTTP_POOL_LIMIT,
+                limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=config.HTTP_DNS_CACHE_TTL
+            ),
+            timeout=aiohttp.ClientTimeout(total=config.DOWNLOAD_TIMEOUT)
+        )
         
         # Initialize detector
-        detector = AadhaarCardDetector(model_path=str(config.MODEL_PATH))
+        backend = create_backend(
+            config.INFERENCE_BACKEND,
+            torch_model_path=str(config.MODEL_PATH),
+            onnx_model_path=str(config.ONNX_MODEL_PATH)
+        )
+        small_backend = None
+        if config.ADAPTIVE_MODEL_ENABLED:
+            small_backend = create_small_backend(
+                backend,
+                small_onnx_model_path=str(config.SMALL_ONNX_MODEL_PATH),
+                input_size=config.SMALL_MODEL_INPUT_SIZE
+            )
+        detector = AadhaarCardDetector(backend, small_backend)
+        inference_executor = BoundedInferenceExecutor(
+            max_workers=config.INFERENCE_WORKERS,
+            max_queue=config.INFERENCE_MAX_QUEUE
+        )
+        model_selector = ModelSelector(
+            full_input_size=backend.input_size,
+            small_input_size=small_backend.input_size if small_backend is not None else None,
+            queue_threshold=config.ADAPTIVE_MODEL_QUEUE_DEPTH,
+            drain_per_pass=config.INFERENCE_WORKERS
+        )
+        track_queue_depth(lambda: inference_executor.queue_depth)
+        if config.RATE_LIMIT_ENABLED:
+            rate_limiter = create_rate_limiter(config.REDIS_URL)
+        tracing.configure(
+            config.TRACE_EXPORTER,
+            service_name="aadhaar-detection",
+            file_path=config.TRACE_FILE,
+            otlp_endpoint=config.TRACE_OTLP_ENDPOINT
+        )
         logger.info("✓ Detector initialized successfully")
         
     except Exception as e:
@@ -278,48 +397,185 @@ async def startup_event():
         sys.exit(1)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the HTTP client and release the inference backend"""
+    if http_session is not None:
+        await http_session.close()
+    if inference_executor is not None:
+        inference_executor.shutdown()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    tracing.shutdown()
+    if detector is not None:
+        for backend in detector.backends.values():
+            backend.close()
+
+
+async def fetch_image_bytes(
+    session: aiohttp.ClientSession,
+    url: str,
+    max_bytes: int
+) -> bytearray:
+    """Stream a URL into memory, failing fast once it exceeds max_bytes"""
+    async with session.get(url) as response:
+        response.raise_for_status()
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise ValueError(f"Image is {response.content_length} bytes, limit is {max_bytes}")
+        
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise ValueError(f"Image exceeds {max_bytes} bytes")
+        return buffer
+
+
+def map_local_image(path: str):
+    """Memory-map a local image file read-only; None if it isn't a file"""
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files can't be mapped; detect_cards reports them per side
+            return b""
+        # The mapping stays valid after the file object is closed
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def close_mapped(data):
+    """
+    Unmap a local image from map_local_image (no-op for other buffers). While
+    a decode still holds a view of it - an abandoned request whose job runs on -
+    close() raises BufferError; the mapping is then released with that view.
+    """
+    if isinstance(data, mmap.mmap):
+        try:
+            data.close()
+        except BufferError:
+            pass
+
+
 async def download_image(
     session: aiohttp.ClientSession, 
-    url: str, 
-    filepath: Path
-) -> bool:
-    """Download image from URL or copy from local path"""
+    url: str
+):
+    """
+    Fetch an encoded image from URL, or map it from a local path.
+    
+    Returns:
+        bytearray (downloaded) or mmap (local file), or None on failure.
+        Callers must close_mapped() it once decoding is done.
+    """
     try:
-        # Check if the URL is a local file path
-        if os.path.exists(url):
-            shutil.copy(url, filepath)
-            logger.info(f"✓ Copied local file: {filepath.name}")
-            return True
-        else:
-            async with session.get(str(url), timeout=30) as response:
-                response.raise_for_status()
-                async with aiofiles.open(filepath, 'wb') as f:
-                    await f.write(await response.read())
-                logger.info(f"✓ Downloaded: {filepath.name}")
-                return True
+        # Local paths are checked and mapped off the event loop
+        data = await asyncio.to_thread(map_local_image, url)
+        if data is not None:
+            request_logger.info(f"✓ Mapped local file: {Path(url).name}")
+            return data
+        with stage_timer("download"):
+            data = await fetch_image_bytes(session, str(url), config.DOWNLOAD_MAX_BYTES)
+        request_logger.info(f"✓ Downloaded {len(data)} bytes")
+        return data
     except Exception as e:
         logger.error(f"✗ Failed to process image from {url}: {e}")
-        return False
+        return None
+
+
+async def enforce_rate_limit(
+    http_request: Request,
+    jwt_payload: dict = Depends(verify_jwt_token)
+) -> dict:
+    """
+    Verify the JWT, then draw a token from the caller's identity and IP buckets.
+    Runs before the handler reads or decodes any image. Returns the JWT payload.
+    """
+    if rate_limiter is not None:
+        decision = await rate_limiter.acquire(request_buckets(
+            jwt_payload,
+            client_ip(http_request, config.RATE_LIMIT_TRUST_FORWARDED) if config.RATE_LIMIT_IP_ENABLED else None,
+            config.RATE_LIMIT_USER,
+            config.RATE_LIMIT_IP
+        ))
+        if not decision.allowed:
+            logger.warning(f"Rate limit exceeded for request_id: {jwt_payload.get('request_id', 'unknown')}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": decision.retry_after_header},
+            )
+    return jwt_payload
+
+
+def request_hint(http_request: Request) -> Optional[str]:
+    """
+    The request's X-Model-Hint, or None when ALLOW_MODEL_HINT is off.
+    
+    Raises:
+        InvalidModelHintError: for an unknown X-Model-Hint value
+    """
+    return parse_hint(http_request.headers.get(HINT_HEADER)) if ALLOW_MODEL_HINT else None
+
+
+def select_model(http_request: Request, started: float) -> ModelDecision:
+    """
+    Choose the full or small model for this request from the executor's queue
+    depth, what is left of the request's budget and its X-Model-Hint, and
+    count the decision.
+    
+    Raises:
+        InvalidModelHintError: for an unknown X-Model-Hint value
+    """
+    hint = request_hint(http_request)
+    budget = None
+    header = http_request.headers.get(LATENCY_BUDGET_HEADER)
+    if header:
+        try:
+            budget = started + float(header) / 1000 - time.monotonic()
+        except ValueError:
+            logger.warning(f"Ignoring invalid {LATENCY_BUDGET_HEADER} header: {header!r}")
+    decision = model_selector.choose(inference_executor.queue_depth, budget, hint)
+    record_model_selection(decision.variant, decision.reason)
+    return decision
+
+
+def server_busy_response(retry_after: int) -> JSONResponse:
+    """503 telling the client when the inference queue should have room again"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "message": "Server busy, please retry later", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)}
+    )
 
 
 @app.post("/detect", response_class=JSONResponse, tags=["Detection"])
 async def detect_aadhaar_cards(
     request: DetectionRequest,
-    jwt_payload: dict = Depends(verify_jwt_token)
+    http_request: Request,
+    jwt_payload: dict = Depends(enforce_rate_limit)
 ):
     """
     Detect Aadhaar front and/or back cards from provided URLs.
     Handles requests with one or both image URLs.
+    Under load (or on a tight X-Request-Timeout-Ms budget, or an allowed
+    X-Model-Hint) the 320px model is used; data.model and X-Model-Variant say which one served it.
     Requires valid JWT token in Authorization header.
     """
+    started = time.monotonic()
     if detector is None:
         return JSONResponse(
             status_code=503,
             content={"success": False, "message": "Detector not initialized"}
         )
 
+    # Shed load before spending bandwidth on downloads
+    try:
+        inference_executor.check_admission()
+    except ExecutorSaturatedError as e:
+        return server_busy_response(e.retry_after)
+
     # Log the authenticated request
-    logger.info(f"Authenticated request from: {jwt_payload.get('request_id', 'unknown')}")
+    request_logger.info(f"Authenticated request from: {jwt_payload.get('request_id', 'unknown')}")
 
     # Check if at least one image URL is provided
     if not request.passport_first and not request.passport_old:
@@ -328,56 +584,63 @@ async def detect_aadhaar_cards(
             content={"success": False, "message": "At least one image URL (passport_first or passport_old) is required."}
         )
     
+    try:
+        request_hint(http_request)
+    except InvalidModelHintError as e:
+        return JSONResponse(status_code=400, content={"success": False, "message": str(e)})
+    
     # Generate unique task ID
     task_id = hashlib.md5(
         f"{request.user_id}_{datetime.now().timestamp()}".encode()
     ).hexdigest()
     
-    # Create temporary directory for downloads
-    user_dir = config.DOWNLOAD_DIR / request.user_id / task_id
-    user_dir.mkdir(parents=True, exist_ok=True)
-    
-    front_path = user_dir / "front.jpg"
-    back_path = user_dir / "back.jpg"
-    
-    logger.info(f"Processing request for user_id={request.user_id}, task_id={task_id}")
+    request_logger.info(f"Processing request for user_id={request.user_id}, task_id={task_id}")
     
+    front_data, back_data = None, None
     try:
-        front_downloaded, back_downloaded = False, False
+        # Fetch both sides concurrently over the shared connection pool;
+        # images stay in memory and are decoded straight from the buffers
+        front_data, back_data = await asyncio.gather(
+            download_image(http_session, str(request.passport_first))
+            if request.passport_first else asyncio.sleep(0, result=None),
+            download_image(http_session, str(request.passport_old))
+            if request.passport_old else asyncio.sleep(0, result=None),
+        )
+        front_downloaded = front_data is not None
+        back_downloaded = back_data is not None
+        
+        # If a URL was provided but failed, it's an error
+        if request.passport_first and not front_downloaded:
+            raise ValueError(f"Failed to download front image from {request.passport_first}")
+        if request.passport_old and not back_downloaded:
+            raise ValueError(f"Failed to download back image from {request.passport_old}")
         
-        async with aiohttp.ClientSession() as session:
-            if request.passport_first:
-                front_downloaded = await download_image(session, str(request.passport_first), front_path)
-                if not front_downloaded:
-                    # If a URL was provided but failed, it's an error
-                    raise ValueError(f"Failed to download front image from {request.passport_first}")
-
-            if request.passport_old:
-                back_downloaded = await download_image(session, str(request.passport_old), back_path)
-                if not back_downloaded:
-                    raise ValueError(f"Failed to download back image from {request.passport_old}")
+        # Pick the model once the downloads are done, against the queue as it is now
+        model_decision = select_model(http_request, started)
+        model_headers = {"X-Model-Variant": model_decision.variant}
         
-        # Perform card detection with potentially None paths
-        detection_result = detector.detect_cards(
-            front_image_path=str(front_path) if front_downloaded else None,
-            back_image_path=str(back_path) if back_downloaded else None,
-            confidence_threshold=request.confidence_threshold
+        # Perform card detection with potentially None images, off the event loop
+        detection_result = await inference_executor.run(
+            detector.detect_cards, front_data, back_data, request.confidence_threshold, model_decision.variant
         )
         
         # Check for security violation
         if detection_result["print_aadhar_detected"]:
+            record_verdict("print_aadhar")
             return JSONResponse(
                 status_code=400,
                 content={
                     "success": False, 
                     "message": "Print Aadhaar detected - security violation",
-                    "data": {"print_aadhar_detected": True}
-                }
+                    "data": {"print_aadhar_detected": True, "model": model_decision.as_dict()}
+                },
+                headers=model_headers
             )
         
         # Determine overall success and message
         front_ok = detection_result["front_detected"]
         back_ok = detection_result["back_detected"]
+        record_verdict("detected" if front_ok or back_ok else "not_detected")
         
         # This covers all cases: front only, back only, or both
         both_provided_and_detected = front_ok and back_ok and front_downloaded and back_downloaded
@@ -408,7 +671,8 @@ async def detect_aadhaar_cards(
             "front_confidence": detection_result["front_confidence"],
             "back_confidence": detection_result["back_confidence"],
             "both_detected": both_provided_and_detected,
-            "details": detection_result["details"]
+            "details": detection_result["details"],
+            "model": model_decision.as_dict()
         }
         
         return JSONResponse(
@@ -418,9 +682,14 @@ async def detect_aadhaar_cards(
                 "detected": front_ok or back_ok,
                 "message": message,
                 "data": response_data
-            }
+            },
+            headers=model_headers
         )
     
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejected task {task_id}: {e}")
+        return server_busy_response(e.retry_after)
+    
     except Exception as e:
         logger.error(f"Error during detection for task {task_id}: {e}", exc_info=True)
         return JSONResponse(
@@ -429,10 +698,9 @@ async def detect_aadhaar_cards(
         )
     
     finally:
-        # Clean up downloaded files
-        if user_dir.exists():
-            shutil.rmtree(user_dir, ignore_errors=True)
-            logger.info(f"✓ Cleaned up temporary files for task_id={task_id}")
+        # Release mapped local files detect_cards didn't get to
+        close_mapped(front_data)
+        close_mapped(back_data)
 
 
 @app.get("/health", tags=["Monitoring"])
@@ -446,11 +714,13 @@ async def health_check():
                 "message": "Service is healthy",
                 "data": {
                     "detector_status": "initialized",
-                    "device": detector.device,
-                    "torch_version": torch.__version__,
-                    "cuda_available": torch.cuda.is_available(),
-                    "cuda_device_count": torch.cuda.device_count() if torch.cuda.is_available() else 0,
-                    "cuda_device_name": torch.cuda.get_device_name(0) if torch.cuda.is_available() else "N/A"
+                    **detector.backend.info(),
+                    "inference_queue": inference_executor.stats(),
+                    "small_model": detector.backends[VARIANT_SMALL].info() if VARIANT_SMALL in detector.backends else None,
+                    "model_selection": model_selector.stats() if model_selector else None,
+                    "rate_limit": rate_limiter.stats() if rate_limiter else None,
+                    "jwt_cache": token_verifier.stats(),
+                    "logging": log_pipeline.stats()
                 }
             }
         )
@@ -468,6 +738,12 @@ async def health_check():
         )
 
 
+@app.get("/metrics", tags=["Monitoring"])
+async def prometheus_metrics():
+    """Prometheus metrics: per-stage latency, verdicts, detected classes, queue gauges"""
+    return metrics_response()
+
+
 @app.get("/", tags=["Info"])
 async def root():
     """API information endpoint"""
@@ -478,6 +754,7 @@ async def root():
         "endpoints": {
             "POST /detect": "Detect Aadhaar cards from front and back URLs",
             "GET /health": "Check service health",
+            "GET /metrics": "Prometheus metrics",
             "GET /": "API information"
         }
     }
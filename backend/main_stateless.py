@@ -3,48 +3,89 @@ Stateless Hybrid AI Verification Backend
 - Zero disk writes - processes images in memory
 - Async processing with asyncio.to_thread
 - Manual review queue support for low-confidence cases
-- Redis rate limiting support (optional)
+- Token-bucket rate limiting, shared across workers via Redis (optional)
+- Load-adaptive switching between the 640px and 320px models
 """
 
 import asyncio
 import base64
-import hashlib
-import io
+import functools
 import logging
 import os
 import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 from enum import Enum
 
-import cv2
 import numpy as np
-import torch
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, HTTPException, status, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
 from pydantic import BaseModel
-from ultralytics import YOLO
+
+try:
+    import python_multipart as multipart
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    # python-multipart before 0.0.13
+    import multipart
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import parse_options_header
+
+from image_decode import decode_image
+from inference_backend import InferenceBackend, create_backend, create_small_backend
+from jwt_verifier import TokenRejectedError, TokenVerifier
+import log_pipeline
+from log_pipeline import configure_logging, sampled_logger
+from metrics import (
+    MetricsMiddleware, count_detections, metrics_response, observe_batch, record_model_selection,
+    record_verdict, stage_timer, track_queue_depth, track_review_queue
+)
+from micro_batching import DeadlineExceededError, MicroBatchScheduler
+from model_selection import (
+    HINT_HEADER, VARIANT_FULL, VARIANT_SMALL, InvalidModelHintError, ModelDecision, ModelSelector, parse_hint
+)
+from rate_limit import BucketSpec, client_ip, create_rate_limiter, request_buckets
+import tracing
+from tracing import TracingMiddleware, record_span, record_timings, span
+from result_cache import InferenceResultCache
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging: formatting and I/O happen on a background thread.
+# LOG_FORMAT=json for structured output; per-request INFO lines go through
+# request_logger, which is sampled (LOG_SAMPLE_RATE) and capped per second.
+configure_logging(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    fmt=os.environ.get("LOG_FORMAT", "text"),
+    use_queue=os.environ.get("LOG_ASYNC", "true").strip().lower() in ("1", "true", "yes", "on")
 )
 logger = logging.getLogger(__name__)
+request_logger = sampled_logger(
+    f"{__name__}.requests",
+    sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", "1.0")),
+    max_per_second=float(os.environ.get("LOG_MAX_PER_SECOND", "50"))
+)
 
 # --- JWT Configuration ---
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-super-secret-key-change-in-production")
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 JWT_ISSUER = os.environ.get("JWT_ISSUER", "ai-verification-frontend")
+# JWKS endpoint for RS*/ES*/PS* algorithms (else JWT_SECRET_KEY holds the secret or PEM public key)
+JWT_JWKS_URL = os.environ.get("JWT_JWKS_URL", "")
+# Verified tokens are cached until exp (at most JWT_CACHE_MAX_TTL seconds);
+# rejected ones for JWT_NEGATIVE_CACHE_TTL. JWT_CACHE_SIZE=0 disables caching.
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_MAX_TTL = float(os.environ.get("JWT_CACHE_MAX_TTL", "300"))
+JWT_NEGATIVE_CACHE_TTL = float(os.environ.get("JWT_NEGATIVE_CACHE_TTL", "30"))
 
 # CORS Configuration
 ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",")
@@ -53,6 +94,25 @@ ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "http://localhost:3000,http:
 CONFIDENCE_THRESHOLD = float(os.environ.get("CONFIDENCE_THRESHOLD", "0.15"))
 LOW_CONFIDENCE_THRESHOLD = float(os.environ.get("LOW_CONFIDENCE_THRESHOLD", "0.10"))
 
+# Largest accepted image upload for /detect/binary (per image)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# A multipart body holds at most both images plus a few short form fields
+MAX_MULTIPART_BYTES = 2 * MAX_UPLOAD_BYTES + 64 * 1024
+
+# Model input size; JPEGs are decoded at the smallest DCT scale that still covers it
+MODEL_INPUT_SIZE = int(os.environ.get("MODEL_INPUT_SIZE", "640"))
+
+# Per-request time budget. Clients may send a shorter (or longer, up to
+# REQUEST_DEADLINE_MAX_MS) budget in the X-Request-Timeout-Ms header; work still
+# queued when it runs out is dropped and the request gets a 504.
+REQUEST_DEADLINE_MS = float(os.environ.get("REQUEST_DEADLINE_MS", "30000"))
+REQUEST_DEADLINE_MAX_MS = float(os.environ.get("REQUEST_DEADLINE_MAX_MS", "120000"))
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# Clients may pick the model with X-Model-Hint only when the operator allows it;
+# otherwise load and the latency budget alone switch requests to the small model
+ALLOW_MODEL_HINT = os.environ.get("ALLOW_MODEL_HINT", "false").strip().lower() in ("1", "true", "yes", "on")
+
 security = HTTPBearer()
 
 
@@ -62,42 +122,26 @@ class VerificationStatus(str, Enum):
     PENDING_REVIEW = "pending_review"
 
 
+token_verifier = TokenVerifier(
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    JWT_ISSUER,
+    jwks_url=JWT_JWKS_URL or None,
+    max_entries=JWT_CACHE_SIZE,
+    max_ttl=JWT_CACHE_MAX_TTL,
+    negative_ttl=JWT_NEGATIVE_CACHE_TTL
+)
+
+
 def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Verify JWT token from Authorization header."""
-    token = credentials.credentials
     try:
-        payload = jwt.decode(
-            token,
-            JWT_SECRET_KEY,
-            algorithms=[JWT_ALGORITHM],
-            options={"verify_aud": False}
-        )
-        
-        if payload.get("iss") != JWT_ISSUER:
-            logger.warning(f"Invalid JWT issuer: {payload.get('iss')}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token issuer",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        exp = payload.get("exp")
-        if exp and datetime.utcnow().timestamp() > exp:
-            logger.warning("JWT token expired")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        logger.info(f"JWT verified for request_id: {payload.get('request_id', 'unknown')}")
-        return payload
-        
-    except JWTError as e:
-        logger.error(f"JWT verification failed: {e}")
+        with stage_timer("jwt_verify"):
+            return token_verifier.verify(credentials.credentials)
+    except TokenRejectedError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            detail=e.detail,
             headers={"WWW-Authenticate": "Bearer"},
         )
 
@@ -108,109 +152,158 @@ class StatelessAadhaarDetector:
     No disk I/O for image processing.
     """
     
-    def __init__(self, model_path: str):
-        """Initialize the detector with YOLO model"""
-        if torch.cuda.is_available():
-            self.device = "cuda"
-            logger.info(f"CUDA available. Using GPU: {torch.cuda.get_device_name(0)}")
-        else:
-            self.device = "cpu"
-            logger.info("CUDA not available. Using CPU")
-        
-        logger.info(f"Loading YOLO model from {model_path}")
-        if not Path(model_path).exists():
-            logger.critical(f"Model not found at {model_path}")
-            raise FileNotFoundError(f"Model not found at {model_path}")
-        
-        self.model = YOLO(model_path)
-        self.card_classes = {i: name for i, name in self.model.names.items()}
+    def __init__(self, backend: InferenceBackend, cache: Optional[InferenceResultCache] = None):
+        """Initialize the detector with an inference backend (torch or onnx)"""
+        self.backend = backend
+        self.device = backend.device
+        self.card_classes = backend.class_names
+        # Raw detections by image content hash; max_bytes=0 disables caching
+        self.cache = cache if cache is not None else InferenceResultCache(max_bytes=0)
         logger.info(f"Model loaded successfully. Classes: {self.card_classes}")
     
-    def decode_base64_image(self, base64_string: str) -> Optional[np.ndarray]:
-        """
-        Decode base64 image string directly to numpy array in memory.
-        NO DISK WRITES.
-        """
+    def base64_to_bytes(self, base64_string: str) -> Optional[bytes]:
+        """Decode a base64 string (optionally a data URL) to the encoded image bytes"""
         try:
             # Remove data URL prefix if present
             if ',' in base64_string:
                 base64_string = base64_string.split(',')[1]
-            
-            # Decode base64 to bytes
-            image_bytes = base64.b64decode(base64_string)
-            
-            # Convert bytes to numpy array using cv2.imdecode (in memory)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                logger.error("Failed to decode image from base64")
-                return None
-            
-            return image
+            with stage_timer("base64_decode"):
+                return base64.b64decode(base64_string)
         except Exception as e:
             logger.error(f"Error decoding base64 image: {e}")
             return None
     
-    def detect_from_bytes(
-        self, 
-        image: np.ndarray,
-        confidence_threshold: float = CONFIDENCE_THRESHOLD
-    ) -> dict:
+    def decode_base64_image(self, base64_string: str) -> Optional[np.ndarray]:
         """
-        Detect Aadhaar card from numpy array (in memory).
+        Decode base64 image string directly to numpy array in memory.
+        NO DISK WRITES.
         """
-        result = {
+        image_bytes = self.base64_to_bytes(base64_string)
+        if image_bytes is None:
+            return None
+        
+        image = self.decode_image_bytes(image_bytes)
+        if image is None:
+            logger.error("Failed to decode image from base64")
+        return image
+    
+    def decode_image_bytes(self, image_bytes) -> Optional[np.ndarray]:
+        """
+        Decode raw encoded image bytes (JPEG/PNG/...) to a numpy array in memory.
+        The bytes are wrapped with np.frombuffer, not copied. NO DISK WRITES.
+        """
+        try:
+            # Reads the JPEG header first so large photos are downscaled
+            # during decode instead of after it
+            with stage_timer("image_decode"):
+                image, _ = decode_image(image_bytes, MODEL_INPUT_SIZE)
+            return image
+        except Exception as e:
+            logger.error(f"Error decoding image bytes: {e}")
+            return None
+    
+    def _empty_result(self) -> dict:
+        return {
             "detected": False,
             "class": None,
             "confidence": 0.0,
             "print_aadhar_detected": False,
             "all_detections": []
         }
+    
+    def _parse_detections(self, detections: list[dict], confidence_threshold: float) -> dict:
+        """Turn one image's backend detections into a detection result dict"""
+        result = self._empty_result()
         
-        try:
-            # Run YOLO inference directly on numpy array
-            predictions = self.model(image, device=self.device, verbose=False)
+        for detection in detections:
+            confidence = detection["confidence"]
+            class_name = detection["class"]
+            
+            result["all_detections"].append({
+                "class": class_name,
+                "confidence": confidence
+            })
+            
+            if class_name == 'print_aadhar' and confidence > confidence_threshold:
+                result["print_aadhar_detected"] = True
+                logger.warning("Print Aadhaar detected!")
+            
+            if confidence >= confidence_threshold:
+                if class_name in ['aadhar_front', 'aadhar_back']:
+                    if confidence > result["confidence"]:
+                        result["detected"] = True
+                        result["class"] = class_name
+                        result["confidence"] = confidence
+        
+        return result
+    
+    def lookup_or_decode(self, image_bytes) -> tuple[bytes, Optional[list[dict]], Optional[np.ndarray]]:
+        """
+        Check the result cache before paying for a decode.
+        
+        Returns:
+            (cache key, cached raw detections or None, decoded image or None).
+            On a hit no image is decoded; on a miss the image is None only if
+            decoding failed.
+        """
+        key = self.cache.key(image_bytes)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return key, cached, None
+        return key, None, self.decode_image_bytes(image_bytes)
+    
+    def score_detections(self, detections: list[dict], confidence_threshold: float) -> dict:
+        """Apply a confidence threshold to raw (possibly cached) detections"""
+        return self._parse_detections(detections, confidence_threshold)
+    
+    def detect_batch(self, items: list[tuple[np.ndarray, float]]) -> list[dict]:
+        """
+        Detect Aadhaar cards in several images with one forward pass.
+        
+        Args:
+            items: (image, confidence_threshold) pairs
             
-            for box in predictions[0].boxes:
-                confidence = float(box.conf[0])
-                class_id = int(box.cls[0])
-                class_name = self.card_classes.get(class_id, "unknown")
-                
-                result["all_detections"].append({
-                    "class": class_name,
-                    "confidence": confidence
-                })
-                
-                if class_name == 'print_aadhar' and confidence > confidence_threshold:
-                    result["print_aadhar_detected"] = True
-                    logger.warning("Print Aadhaar detected!")
-                
-                if confidence >= confidence_threshold:
-                    if class_name in ['aadhar_front', 'aadhar_back']:
-                        if confidence > result["confidence"]:
-                            result["detected"] = True
-                            result["class"] = class_name
-                            result["confidence"] = confidence
-                            
+        Returns:
+            One detection result dict per item, in order
+        """
+        images = [image for image, _ in items]
+        try:
+            predictions = self.backend.predict_batch(images)
         except Exception as e:
             logger.error(f"Error during detection: {e}")
-            result["error"] = str(e)
+            results = []
+            for _ in items:
+                result = self._empty_result()
+                result["error"] = str(e)
+                results.append(result)
+            return results
         
-        return result
+        return [
+            self._parse_detections(detections, confidence_threshold)
+            for detections, (_, confidence_threshold) in zip(predictions, items)
+        ]
     
-    def detect_cards_from_base64(
-        self,
-        front_base64: Optional[str] = None,
-        back_base64: Optional[str] = None,
+    def detect_from_bytes(
+        self, 
+        image: np.ndarray,
         confidence_threshold: float = CONFIDENCE_THRESHOLD
     ) -> dict:
         """
-        Detect Aadhaar cards from base64 encoded images.
-        All processing happens in memory - NO DISK WRITES.
+        Detect Aadhaar card from numpy array (in memory).
+        """
+        return self.detect_batch([(image, confidence_threshold)])[0]
+    
+    def merge_card_results(
+        self,
+        front_result: Optional[dict],
+        back_result: Optional[dict],
+        front_error: Optional[str] = None,
+        back_error: Optional[str] = None
+    ) -> dict:
+        """
+        Combine per-side detection results into the verification result.
+        A side is skipped when both its result and error are None.
         """
-        logger.info(f"Starting stateless card detection (threshold: {confidence_threshold})")
-        
         result = {
             "front_detected": False,
             "back_detected": False,
@@ -224,43 +317,26 @@ class StatelessAadhaarDetector:
             "status": VerificationStatus.REJECTED.value
         }
         
-        # Process front image
-        if front_base64:
-            front_image = self.decode_base64_image(front_base64)
-            if front_image is not None:
-                front_result = self.detect_from_bytes(front_image, confidence_threshold)
-                
-                if front_result.get("print_aadhar_detected"):
-                    result["print_aadhar_detected"] = True
-                
-                if front_result.get("detected") and front_result.get("class") == 'aadhar_front':
-                    result["front_detected"] = True
-                    result["front_confidence"] = front_result["confidence"]
-                    result["details"]["front"] = front_result["all_detections"]
-                    logger.info(f"✓ Front card detected (confidence: {front_result['confidence']:.2%})")
-                else:
-                    result["details"]["front"] = front_result.get("all_detections", [])
-            else:
-                result["details"]["front"].append({"error": "Failed to decode front image"})
-        
-        # Process back image
-        if back_base64:
-            back_image = self.decode_base64_image(back_base64)
-            if back_image is not None:
-                back_result = self.detect_from_bytes(back_image, confidence_threshold)
-                
-                if back_result.get("print_aadhar_detected"):
-                    result["print_aadhar_detected"] = True
-                
-                if back_result.get("detected") and back_result.get("class") == 'aadhar_back':
-                    result["back_detected"] = True
-                    result["back_confidence"] = back_result["confidence"]
-                    result["details"]["back"] = back_result["all_detections"]
-                    logger.info(f"✓ Back card detected (confidence: {back_result['confidence']:.2%})")
-                else:
-                    result["details"]["back"] = back_result.get("all_detections", [])
+        for side, side_result, side_error in (
+            ("front", front_result, front_error),
+            ("back", back_result, back_error),
+        ):
+            if side_error:
+                result["details"][side].append({"error": side_error})
+                continue
+            if side_result is None:
+                continue
+            
+            if side_result.get("print_aadhar_detected"):
+                result["print_aadhar_detected"] = True
+            
+            if side_result.get("detected") and side_result.get("class") == f"aadhar_{side}":
+                result[f"{side}_detected"] = True
+                result[f"{side}_confidence"] = side_result["confidence"]
+                result["details"][side] = side_result["all_detections"]
+                request_logger.info(f"✓ {side.capitalize()} card detected (confidence: {side_result['confidence']:.2%})")
             else:
-                result["details"]["back"].append({"error": "Failed to decode back image"})
+                result["details"][side] = side_result.get("all_detections", [])
         
         # Determine verification status
         if result["print_aadhar_detected"]:
@@ -278,6 +354,38 @@ class StatelessAadhaarDetector:
                 result["status"] = VerificationStatus.PENDING_REVIEW.value
         
         return result
+    
+    def detect_cards_from_base64(
+        self,
+        front_base64: Optional[str] = None,
+        back_base64: Optional[str] = None,
+        confidence_threshold: float = CONFIDENCE_THRESHOLD
+    ) -> dict:
+        """
+        Detect Aadhaar cards from base64 encoded images.
+        All processing happens in memory - NO DISK WRITES.
+        """
+        request_logger.info(f"Starting stateless card detection (threshold: {confidence_threshold})")
+        
+        results = {"front": None, "back": None}
+        errors = {"front": None, "back": None}
+        
+        images = {}
+        for side, data in (("front", front_base64), ("back", back_base64)):
+            if not data:
+                continue
+            image = self.decode_base64_image(data)
+            if image is not None:
+                images[side] = image
+            else:
+                errors[side] = f"Failed to decode {side} image"
+        
+        # Front and back go through the model as one batch
+        if images:
+            batch_results = self.detect_batch([(image, confidence_threshold) for image in images.values()])
+            results.update(zip(images, batch_results))
+        
+        return self.merge_card_results(results["front"], results["back"], errors["front"], errors["back"])
 
 
 # --- FastAPI Application ---
@@ -294,20 +402,70 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type", "X-Request-ID"],
-    expose_headers=["X-Request-ID"],
+    allow_headers=["Authorization", "Content-Type", "X-Request-ID", DEADLINE_HEADER] + ([HINT_HEADER] if ALLOW_MODEL_HINT else []),
+    expose_headers=["X-Request-ID", "Server-Timing", "X-Model-Variant"],
     max_age=600,
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 class Config:
     """Application configuration"""
     BASE_DIR = Path(__file__).parent
     MODEL_PATH = BASE_DIR / os.environ.get("MODEL1_PATH", "models/best4.pt")
+    ONNX_MODEL_PATH = BASE_DIR / os.environ.get("ONNX_MODEL_PATH", "../public/models/aadhaar_detector_v2.onnx")
+    # 320px variant served under load: the small ONNX export, or the .pt at
+    # SMALL_MODEL_INPUT_SIZE for the torch backend. Requests switch to it when
+    # ADAPTIVE_MODEL_QUEUE_DEPTH images are already waiting, when the full
+    # model would miss their X-Request-Timeout-Ms budget, or on X-Model-Hint
+    # when ALLOW_MODEL_HINT is set.
+    ADAPTIVE_MODEL_ENABLED = os.environ.get("ADAPTIVE_MODEL_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+    SMALL_ONNX_MODEL_PATH = BASE_DIR / os.environ.get("SMALL_ONNX_MODEL_PATH", "../public/models/aadhaar_detector_v2_small.onnx")
+    SMALL_MODEL_INPUT_SIZE = int(os.environ.get("SMALL_MODEL_INPUT_SIZE", "320"))
+    ADAPTIVE_MODEL_QUEUE_DEPTH = int(os.environ.get("ADAPTIVE_MODEL_QUEUE_DEPTH", "8"))
+    # "onnx" runs ONNX Runtime without importing torch; "torch" uses ultralytics on MODEL_PATH
+    INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+    # Cross-request micro-batching: flush after BATCH_WINDOW_MS or BATCH_MAX_SIZE images
+    BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+    BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "5"))
+    # Raw-detection cache keyed by image content; RESULT_CACHE_MAX_BYTES=0 disables it
+    RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "600"))
+    # Token-bucket rate limiting per JWT identity and per client IP, checked
+    # before any image work. Shared across workers when REDIS_URL is set.
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+    RATE_LIMIT_USER = BucketSpec.per_minute(
+        float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "30")),
+        float(os.environ.get("RATE_LIMIT_USER_BURST", "10"))
+    )
+    RATE_LIMIT_IP = BucketSpec.per_minute(
+        float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "300")),
+        float(os.environ.get("RATE_LIMIT_IP_BURST", "60"))
+    )
+    # Only enable behind a proxy that sets X-Forwarded-For
+    RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").strip().lower() in ("1", "true", "yes", "on")
+    # Per-IP bucket. Behind the frontend or a proxy every caller shares its address
+    # unless X-Forwarded-For is trusted, so it is on by default only then
+    RATE_LIMIT_IP_ENABLED = os.environ.get(
+        "RATE_LIMIT_IP_ENABLED", "true" if RATE_LIMIT_TRUST_FORWARDED else "false"
+    ).strip().lower() in ("1", "true", "yes", "on")
+    REDIS_URL = os.environ.get("REDIS_URL", "")
+    # Request tracing: Server-Timing headers always; spans exported when
+    # TRACE_EXPORTER is "file" (JSON lines at TRACE_FILE) or "otlp" (collector)
+    TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none")
+    TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+    TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
 
 
 config = Config()
 detector: Optional[StatelessAadhaarDetector] = None
+scheduler: Optional[MicroBatchScheduler] = None
+# Backend and micro-batcher per model variant; the full ones are detector.backend and scheduler
+backends: dict[str, InferenceBackend] = {}
+schedulers: dict[str, MicroBatchScheduler] = {}
+model_selector: Optional[ModelSelector] = None
+rate_limiter = None
 
 
 class DetectionRequestBase64(BaseModel):
@@ -335,45 +493,489 @@ manual_review_queue: list[ManualReviewItem] = []
 @app.on_event("startup")
 async def startup_event():
     """Initialize the detector on startup"""
-    global detector
+    global detector, scheduler, model_selector, rate_limiter
     try:
-        detector = StatelessAadhaarDetector(model_path=str(config.MODEL_PATH))
+        backend = create_backend(
+            config.INFERENCE_BACKEND,
+            torch_model_path=str(config.MODEL_PATH),
+            onnx_model_path=str(config.ONNX_MODEL_PATH)
+        )
+        backends[VARIANT_FULL] = backend
+        if config.ADAPTIVE_MODEL_ENABLED:
+            small_backend = create_small_backend(
+                backend,
+                small_onnx_model_path=str(config.SMALL_ONNX_MODEL_PATH),
+                input_size=config.SMALL_MODEL_INPUT_SIZE
+            )
+            if small_backend is not None:
+                backends[VARIANT_SMALL] = small_backend
+        cache = InferenceResultCache(
+            max_bytes=config.RESULT_CACHE_MAX_BYTES,
+            ttl_seconds=config.RESULT_CACHE_TTL
+        )
+        detector = StatelessAadhaarDetector(backend, cache)
+        for variant, variant_backend in backends.items():
+            batch_size, window_ms = config.BATCH_MAX_SIZE, config.BATCH_WINDOW_MS
+            if variant_backend.max_batch_size is not None and variant_backend.max_batch_size < batch_size:
+                # Collect no more than one forward pass takes; a batch-1 model
+                # gains nothing from waiting, so it runs each image as it arrives
+                batch_size = variant_backend.max_batch_size
+                if batch_size == 1:
+                    window_ms = 0.0
+                logger.warning(
+                    f"{variant} model has a fixed batch axis of {batch_size}, so "
+                    + ("micro-batching is off for it" if batch_size == 1 else f"micro-batches are capped at {batch_size}")
+                    + ". Export with convert_best2_to_onnx.py --dynamic-batch and point ONNX_MODEL_PATH at "
+                    "aadhaar_detector_v2_batch.onnx"
+                )
+            schedulers[variant] = MicroBatchScheduler(
+                functools.partial(run_inference_batch, variant),
+                max_batch_size=batch_size,
+                max_wait_ms=window_ms
+            )
+            schedulers[variant].start()
+        scheduler = schedulers[VARIANT_FULL]
+        model_selector = ModelSelector(
+            full_input_size=backend.input_size,
+            small_input_size=backends[VARIANT_SMALL].input_size if VARIANT_SMALL in backends else None,
+            queue_threshold=config.ADAPTIVE_MODEL_QUEUE_DEPTH,
+            drain_per_pass=scheduler.max_batch_size
+        )
+        track_queue_depth(lambda: sum(s.queue_depth for s in schedulers.values()))
+        track_review_queue(lambda: len(manual_review_queue))
+        if config.RATE_LIMIT_ENABLED:
+            rate_limiter = create_rate_limiter(config.REDIS_URL)
+        tracing.configure(
+            config.TRACE_EXPORTER,
+            service_name="aadhaar-detection-stateless",
+            file_path=config.TRACE_FILE,
+            otlp_endpoint=config.TRACE_OTLP_ENDPOINT
+        )
         logger.info("✓ Stateless detector initialized successfully")
     except Exception as e:
         logger.critical(f"Failed to initialize detector: {e}", exc_info=True)
         sys.exit(1)
 
 
+def run_inference_batch(variant: str, images: list[np.ndarray]) -> list[tuple[list[dict], dict]]:
+    """
+    Scheduler batch function: one forward pass on the variant's backend, with
+    its stage timings recorded. Each image's result carries the batch timings
+    so the request can trace them.
+    """
+    timings = {}
+    results = backends[variant].predict_batch(images, timings)
+    observe_batch(len(images), timings, variant)
+    model_selector.observe(variant, sum(timings.values()))
+    return [(detections, timings) for detections in results]
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the inference schedulers and release the backends"""
+    for variant_scheduler in schedulers.values():
+        await variant_scheduler.stop()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    tracing.shutdown()
+    for backend in backends.values():
+        backend.close()
+
+
+async def enforce_rate_limit(
+    http_request: Request,
+    jwt_payload: dict = Depends(verify_jwt_token)
+) -> dict:
+    """
+    Verify the JWT, then draw a token from the caller's identity and IP buckets.
+    Runs before the handler reads or decodes any image. Returns the JWT payload.
+    """
+    if rate_limiter is not None:
+        decision = await rate_limiter.acquire(request_buckets(
+            jwt_payload,
+            client_ip(http_request, config.RATE_LIMIT_TRUST_FORWARDED) if config.RATE_LIMIT_IP_ENABLED else None,
+            config.RATE_LIMIT_USER,
+            config.RATE_LIMIT_IP
+        ))
+        if not decision.allowed:
+            logger.warning(f"Rate limit exceeded for request_id: {jwt_payload.get('request_id', 'unknown')}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": decision.retry_after_header},
+            )
+    return jwt_payload
+
+
+def request_deadline(http_request: Request) -> float:
+    """Absolute time.monotonic() deadline from the X-Request-Timeout-Ms header or the default"""
+    budget_ms = REQUEST_DEADLINE_MS
+    header = http_request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            budget_ms = min(float(header), REQUEST_DEADLINE_MAX_MS)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {header!r}")
+    return time.monotonic() + budget_ms / 1000
+
+
+def request_hint(http_request: Request) -> Optional[str]:
+    """
+    The request's X-Model-Hint, or None when ALLOW_MODEL_HINT is off.
+    
+    Raises:
+        InvalidModelHintError: for an unknown X-Model-Hint value
+    """
+    return parse_hint(http_request.headers.get(HINT_HEADER)) if ALLOW_MODEL_HINT else None
+
+
+def select_model(http_request: Request, deadline: float) -> ModelDecision:
+    """
+    Choose the full or small model for this request from the micro-batcher's
+    queue depth, the request's budget and its X-Model-Hint, and count the decision.
+    
+    Raises:
+        InvalidModelHintError: for an unknown X-Model-Hint value
+    """
+    hint = request_hint(http_request)
+    # Only a budget the client sent asks for speed; the default deadline doesn't
+    budget = deadline - time.monotonic() if DEADLINE_HEADER in http_request.headers else None
+    decision = model_selector.choose(scheduler.queue_depth, budget, hint)
+    record_model_selection(decision.variant, decision.reason)
+    return decision
+
+
+def invalid_hint_response(e: InvalidModelHintError) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"success": False, "message": str(e)})
+
+
+class ClientDisconnectedError(Exception):
+    """The client closed the connection before the response was ready"""
+
+
+async def wait_for_disconnect(http_request: Request):
+    """Return once the client goes away (call only after the body has been read)"""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_deadline(http_request: Request, work, deadline: float):
+    """
+    Await work unless the deadline passes or the client disconnects first.
+    Either way the work is cancelled, which also drops its queued inference.
+    
+    Raises:
+        DeadlineExceededError, ClientDisconnectedError
+    """
+    work = asyncio.ensure_future(work)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(http_request))
+    try:
+        done, _ = await asyncio.wait(
+            {work, disconnect},
+            timeout=max(0.0, deadline - time.monotonic()),
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        if work in done:
+            return work.result()
+        if disconnect in done:
+            raise ClientDisconnectedError()
+        raise DeadlineExceededError("Request deadline exceeded")
+    finally:
+        for task in (work, disconnect):
+            if not task.done():
+                task.cancel()
+
+
+def deadline_exceeded_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=504,
+        content={"success": False, "message": "Request deadline exceeded before detection completed"}
+    )
+
+
+def client_disconnected_response() -> JSONResponse:
+    # Nobody reads this; 499 (client closed request) keeps access logs honest
+    return JSONResponse(
+        status_code=499,
+        content={"success": False, "message": "Client disconnected"}
+    )
+
+
+async def detect_cards_batched(
+    front_data,
+    back_data,
+    confidence_threshold: float,
+    to_bytes: Callable[..., Optional[bytes]],
+    deadline: Optional[float] = None,
+    variant: str = VARIANT_FULL
+) -> dict:
+    """
+    Decode images in a worker thread, then run inference through the
+    variant's micro-batching scheduler so concurrent requests share forward
+    passes. Images already in the result cache skip both decode and inference;
+    only full-model results are cached, and they serve either variant.
+    
+    Args:
+        front_data / back_data: Encoded image (base64 string or raw bytes), or None
+        confidence_threshold: Minimum confidence for detection
+        to_bytes: detector.base64_to_bytes, or an identity function for raw bytes
+        deadline: time.monotonic() after which queued inference is dropped
+        variant: VARIANT_FULL or VARIANT_SMALL (see select_model)
+    
+    Raises:
+        DeadlineExceededError: if the deadline passes before inference runs
+    """
+    request_logger.info(f"Starting stateless card detection (threshold: {confidence_threshold})")
+    
+    # Set when this coroutine is cancelled so decodes that haven't started yet are skipped
+    cancelled = threading.Event()
+    
+    def prepare(data):
+        if not data or cancelled.is_set():
+            return None
+        image_bytes = to_bytes(data)
+        if image_bytes is None:
+            return None, None, None
+        if cancelled.is_set():
+            return None
+        return detector.lookup_or_decode(image_bytes)
+    
+    try:
+        # Decode front and back in parallel worker threads (cv2 releases the GIL)
+        prepared = await asyncio.gather(
+            asyncio.to_thread(prepare, front_data),
+            asyncio.to_thread(prepare, back_data)
+        )
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+    
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceededError("Deadline passed during decode")
+    
+    # Submit every cache miss before awaiting so front and back share a batch
+    futures = []
+    for entry in prepared:
+        if entry is not None and entry[1] is None and entry[2] is not None:
+            futures.append(schedulers[variant].submit(entry[2], deadline))
+        else:
+            futures.append(None)
+    
+    # Await both sides together: cancelling this coroutine (deadline, client
+    # disconnect) cancels both futures, and the scheduler drops them unrun
+    waited = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(future for future in futures if future is not None),
+        return_exceptions=True
+    )
+    waited = time.perf_counter() - waited
+    
+    # Both sides rode in the same forward pass(es); trace its stages once
+    batch_timings = next((outcome[1] for outcome in outcomes if isinstance(outcome, tuple)), None)
+    if batch_timings is not None:
+        record_span("queue_wait", max(0.0, waited - sum(batch_timings.values())))
+        record_timings(batch_timings)
+    outcomes = iter(outcomes)
+    
+    side_results = []
+    side_errors = []
+    for side, entry, future in zip(("front", "back"), prepared, futures):
+        if entry is None:
+            side_results.append(None)
+            side_errors.append(None)
+            continue
+        
+        key, detections, image = entry
+        if detections is None and image is None:
+            side_results.append(None)
+            side_errors.append(f"Failed to decode {side} image")
+            continue
+        
+        if future is not None:
+            outcome = next(outcomes)
+            # A future cancelled on its own comes back as a CancelledError, which
+            # is a BaseException rather than an Exception
+            if isinstance(outcome, (DeadlineExceededError, asyncio.CancelledError)):
+                raise outcome
+            if isinstance(outcome, Exception):
+                logger.error(f"Error during detection: {outcome}")
+                result = detector._empty_result()
+                result["error"] = str(outcome)
+                side_results.append(result)
+                side_errors.append(None)
+                continue
+            detections, _ = outcome
+            if variant == VARIANT_FULL:
+                detector.cache.put(key, detections)
+        
+        count_detections(detections, confidence_threshold)
+        side_results.append(detector.score_detections(detections, confidence_threshold))
+        side_errors.append(None)
+    
+    return detector.merge_card_results(side_results[0], side_results[1], side_errors[0], side_errors[1])
+
+
 async def add_to_review_queue(item: ManualReviewItem):
     """Add item to manual review queue (async background task)"""
-    manual_review_queue.append(item)
+    with span("review_enqueue"):
+        manual_review_queue.append(item)
     logger.info(f"Added to manual review queue: user_id={item.user_id}")
 
 
+def build_detection_response(
+    detection_result: dict,
+    user_id: str,
+    front_provided: bool,
+    back_provided: bool,
+    force_upload: bool,
+    background_tasks: BackgroundTasks,
+    model_decision: ModelDecision
+) -> JSONResponse:
+    """
+    Turn a merged detection result into the /detect response.
+    Shared by the base64 and binary endpoints so status logic, review
+    queueing and the response schema stay identical. Every response reports
+    which model variant served it, and why, in data.model and X-Model-Variant.
+    """
+    model_headers = {"X-Model-Variant": model_decision.variant}
+
+    # Check for security violation
+    if detection_result["print_aadhar_detected"]:
+        record_verdict(VerificationStatus.REJECTED.value)
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False, 
+                "message": "Print Aadhaar detected - security violation",
+                "data": {"print_aadhar_detected": True, "model": model_decision.as_dict()}
+            },
+            headers=model_headers
+        )
+
+    # Handle force upload (three-strike bypass)
+    if force_upload and not (detection_result["front_detected"] and detection_result["back_detected"]):
+        # Queue for manual review
+        review_item = ManualReviewItem(
+            user_id=user_id,
+            timestamp=datetime.utcnow().isoformat(),
+            front_confidence=detection_result["front_confidence"],
+            back_confidence=detection_result["back_confidence"],
+            reason="Force upload - bypassed client-side checks"
+        )
+        background_tasks.add_task(add_to_review_queue, review_item)
+        record_verdict(VerificationStatus.PENDING_REVIEW.value)
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "detected": True,
+                "status": VerificationStatus.PENDING_REVIEW.value,
+                "message": "Document submitted for manual review",
+                "data": {
+                    "user_id": user_id,
+                    "front_detected": detection_result["front_detected"],
+                    "back_detected": detection_result["back_detected"],
+                    "front_confidence": detection_result["front_confidence"],
+                    "back_confidence": detection_result["back_confidence"],
+                    "both_detected": detection_result["front_detected"] and detection_result["back_detected"],
+                    "model": model_decision.as_dict()
+                }
+            },
+            headers=model_headers
+        )
+
+    # Handle low confidence cases - add to manual review
+    if detection_result["status"] == VerificationStatus.PENDING_REVIEW.value:
+        review_item = ManualReviewItem(
+            user_id=user_id,
+            timestamp=datetime.utcnow().isoformat(),
+            front_confidence=detection_result["front_confidence"],
+            back_confidence=detection_result["back_confidence"],
+            reason="Low confidence detection"
+        )
+        background_tasks.add_task(add_to_review_queue, review_item)
+
+    record_verdict(detection_result["status"])
+
+    # Build response
+    front_ok = detection_result["front_detected"]
+    back_ok = detection_result["back_detected"]
+    both_provided_and_detected = front_ok and back_ok and front_provided and back_provided
+
+    message = "Detection complete."
+    if both_provided_and_detected:
+        message = "Both Aadhaar cards detected successfully."
+    elif front_ok:
+        message = "Aadhaar front card detected successfully."
+    elif back_ok:
+        message = "Aadhaar back card detected successfully."
+    else:
+        missing = []
+        if front_provided and not front_ok:
+            missing.append("front")
+        if back_provided and not back_ok:
+            missing.append("back")
+        if missing:
+            message = f"Could not detect Aadhaar card(s): {', '.join(missing)}."
+        else:
+            message = "No Aadhaar card detected in the provided image(s)."
+
+    response_data = {
+        "user_id": user_id,
+        "front_detected": front_ok,
+        "back_detected": back_ok,
+        "front_confidence": detection_result["front_confidence"],
+        "back_confidence": detection_result["back_confidence"],
+        "both_detected": both_provided_and_detected,
+        "status": detection_result["status"],
+        "details": detection_result["details"],
+        "model": model_decision.as_dict()
+    }
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "success": True,
+            "detected": front_ok or back_ok,
+            "message": message,
+            "data": response_data
+        },
+        headers=model_headers
+    )
+
+
 @app.post("/detect", response_class=JSONResponse, tags=["Detection"])
 async def detect_aadhaar_cards_stateless(
     request: DetectionRequestBase64,
+    http_request: Request,
     background_tasks: BackgroundTasks,
-    jwt_payload: dict = Depends(verify_jwt_token)
+    jwt_payload: dict = Depends(enforce_rate_limit)
 ):
     """
     Detect Aadhaar front and/or back cards from base64 encoded images.
     
     Key features:
     - Zero disk I/O - all processing in memory
-    - Async model inference via asyncio.to_thread
+    - Async model inference, micro-batched across concurrent requests
     - Manual review queue for low-confidence detections
     - Force upload support (three-strike rule bypass)
+    - Optional X-Request-Timeout-Ms budget; work is dropped once it expires
+      (504) or the client disconnects
     
     Requires valid JWT token in Authorization header.
     """
+    deadline = request_deadline(http_request)
+    
     if detector is None:
         return JSONResponse(
             status_code=503,
             content={"success": False, "message": "Detector not initialized"}
         )
 
-    logger.info(f"Stateless detection request from: {jwt_payload.get('request_id', 'unknown')}")
+    request_logger.info(f"Stateless detection request from: {jwt_payload.get('request_id', 'unknown')}")
 
     if not request.front_image and not request.back_image:
         return JSONResponse(
@@ -382,118 +984,265 @@ async def detect_aadhaar_cards_stateless(
         )
     
     try:
-        # Run detection in thread pool to avoid blocking event loop
-        detection_result = await asyncio.to_thread(
-            detector.detect_cards_from_base64,
-            request.front_image,
-            request.back_image,
-            request.confidence_threshold
+        model_decision = select_model(http_request, deadline)
+    except InvalidModelHintError as e:
+        return invalid_hint_response(e)
+    
+    try:
+        # Decode off the event loop, then batch inference with other requests
+        detection_result = await run_until_deadline(
+            http_request,
+            detect_cards_batched(
+                request.front_image,
+                request.back_image,
+                request.confidence_threshold,
+                detector.base64_to_bytes,
+                deadline,
+                model_decision.variant
+            ),
+            deadline
         )
         
-        # Check for security violation
-        if detection_result["print_aadhar_detected"]:
+        return build_detection_response(
+            detection_result,
+            user_id=request.user_id,
+            front_provided=bool(request.front_image),
+            back_provided=bool(request.back_image),
+            force_upload=request.force_upload,
+            background_tasks=background_tasks,
+            model_decision=model_decision
+        )
+    
+    except DeadlineExceededError as e:
+        logger.warning(f"Stateless detection dropped: {e}")
+        return deadline_exceeded_response()
+    
+    except ClientDisconnectedError:
+        logger.info("Client disconnected; stateless detection cancelled")
+        return client_disconnected_response()
+    
+    except Exception as e:
+        logger.error(f"Error during stateless detection: {e}", exc_info=True)
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "message": "Internal server error", "error": str(e)}
+        )
+
+
+def _parse_bool(value) -> bool:
+    """Parse a form/query flag such as force_upload"""
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+async def _stream_body(http_request: Request, max_bytes: int):
+    """Yield the request body in chunks, with a 413 as soon as it exceeds max_bytes"""
+    content_length = http_request.headers.get("content-length")
+    if content_length and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+    
+    received = 0
+    async for chunk in http_request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+        yield chunk
+
+
+async def _read_raw_body(http_request: Request) -> bytes:
+    """Read a raw image body, enforcing MAX_UPLOAD_BYTES without buffering past it"""
+    body = bytearray()
+    async for chunk in _stream_body(http_request, MAX_UPLOAD_BYTES):
+        body += chunk
+    return body
+
+
+async def _read_multipart(http_request: Request) -> tuple[dict, dict]:
+    """
+    Parse a multipart/form-data body in memory: ({field: str}, {file field: bytes}).
+    
+    request.form() would spool file parts over 1 MB to temporary files, so the
+    body is streamed through python-multipart instead, with every part capped
+    at MAX_UPLOAD_BYTES.
+    """
+    _, options = parse_options_header(http_request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="multipart/form-data body without a boundary")
+    
+    fields, files = {}, {}
+    part = {}
+    
+    def on_part_begin():
+        part.update(headers={}, header_field=bytearray(), header_value=bytearray(), data=bytearray())
+    
+    def on_header_field(data: bytes, start: int, end: int):
+        part["header_field"] += data[start:end]
+    
+    def on_header_value(data: bytes, start: int, end: int):
+        part["header_value"] += data[start:end]
+    
+    def on_header_end():
+        part["headers"][bytes(part["header_field"]).lower()] = bytes(part["header_value"])
+        part["header_field"], part["header_value"] = bytearray(), bytearray()
+    
+    def on_part_data(data: bytes, start: int, end: int):
+        part["data"] += data[start:end]
+        if len(part["data"]) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_UPLOAD_BYTES} bytes")
+    
+    def on_part_end():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("latin-1")
+        if b"filename" in disposition:
+            files[name] = part["data"]
+        else:
+            fields[name] = part["data"].decode("utf-8", errors="replace")
+    
+    parser = multipart.MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+    try:
+        async for chunk in _stream_body(http_request, MAX_MULTIPART_BYTES):
+            parser.write(chunk)
+        parser.finalize()
+    except FormParserError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+    return fields, files
+
+
+@app.post("/detect/binary", response_class=JSONResponse, tags=["Detection"])
+async def detect_aadhaar_cards_binary(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    jwt_payload: dict = Depends(enforce_rate_limit)
+):
+    """
+    Detect Aadhaar front and/or back cards from binary image uploads.
+    
+    Avoids the base64-in-JSON overhead of POST /detect: image bytes go
+    straight into np.frombuffer/cv2.imdecode. Accepts either:
+    - multipart/form-data with `front_image` and/or `back_image` file parts
+      and `user_id`, `confidence_threshold`, `force_upload` form fields
+    - a raw image body (image/jpeg, image/png, application/octet-stream) for
+      one side, with `user_id`, `side` (front|back), `confidence_threshold`
+      and `force_upload` as query parameters
+    
+    Status logic, manual review queue, deadline handling and response schema
+    are the same as POST /detect. Requires valid JWT token in Authorization header.
+    """
+    deadline = request_deadline(http_request)
+    
+    if detector is None:
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "message": "Detector not initialized"}
+        )
+    
+    request_logger.info(f"Binary detection request from: {jwt_payload.get('request_id', 'unknown')}")
+    
+    content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+    front_bytes = back_bytes = None
+    
+    if content_type == "multipart/form-data":
+        params, files = await _read_multipart(http_request)
+        front_bytes = files.get("front_image")
+        back_bytes = files.get("back_image")
+    elif content_type.startswith("image/") or content_type == "application/octet-stream":
+        params = http_request.query_params
+        side = params.get("side", "front").lower()
+        if side not in ("front", "back"):
             return JSONResponse(
                 status_code=400,
-                content={
-                    "success": False, 
-                    "message": "Print Aadhaar detected - security violation",
-                    "data": {"print_aadhar_detected": True}
-                }
-            )
-        
-        # Handle force upload (three-strike bypass)
-        if request.force_upload and not (detection_result["front_detected"] and detection_result["back_detected"]):
-            # Queue for manual review
-            review_item = ManualReviewItem(
-                user_id=request.user_id,
-                timestamp=datetime.utcnow().isoformat(),
-                front_confidence=detection_result["front_confidence"],
-                back_confidence=detection_result["back_confidence"],
-                reason="Force upload - bypassed client-side checks"
-            )
-            background_tasks.add_task(add_to_review_queue, review_item)
-            
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "success": True,
-                    "detected": True,
-                    "status": VerificationStatus.PENDING_REVIEW.value,
-                    "message": "Document submitted for manual review",
-                    "data": {
-                        "user_id": request.user_id,
-                        "front_detected": detection_result["front_detected"],
-                        "back_detected": detection_result["back_detected"],
-                        "front_confidence": detection_result["front_confidence"],
-                        "back_confidence": detection_result["back_confidence"],
-                        "both_detected": detection_result["front_detected"] and detection_result["back_detected"],
-                    }
-                }
+                content={"success": False, "message": "Query parameter 'side' must be 'front' or 'back'."}
             )
-        
-        # Handle low confidence cases - add to manual review
-        if detection_result["status"] == VerificationStatus.PENDING_REVIEW.value:
-            review_item = ManualReviewItem(
-                user_id=request.user_id,
-                timestamp=datetime.utcnow().isoformat(),
-                front_confidence=detection_result["front_confidence"],
-                back_confidence=detection_result["back_confidence"],
-                reason="Low confidence detection"
-            )
-            background_tasks.add_task(add_to_review_queue, review_item)
-        
-        # Build response
-        front_ok = detection_result["front_detected"]
-        back_ok = detection_result["back_detected"]
-        both_provided_and_detected = front_ok and back_ok and request.front_image and request.back_image
-        
-        message = "Detection complete."
-        if both_provided_and_detected:
-            message = "Both Aadhaar cards detected successfully."
-        elif front_ok:
-            message = "Aadhaar front card detected successfully."
-        elif back_ok:
-            message = "Aadhaar back card detected successfully."
+        body = await _read_raw_body(http_request)
+        if side == "front":
+            front_bytes = body
         else:
-            missing = []
-            if request.front_image and not front_ok:
-                missing.append("front")
-            if request.back_image and not back_ok:
-                missing.append("back")
-            if missing:
-                message = f"Could not detect Aadhaar card(s): {', '.join(missing)}."
-            else:
-                message = "No Aadhaar card detected in the provided image(s)."
-
-        response_data = {
-            "user_id": request.user_id,
-            "front_detected": front_ok,
-            "back_detected": back_ok,
-            "front_confidence": detection_result["front_confidence"],
-            "back_confidence": detection_result["back_confidence"],
-            "both_detected": both_provided_and_detected,
-            "status": detection_result["status"],
-            "details": detection_result["details"]
-        }
-        
+            back_bytes = body
+    else:
         return JSONResponse(
-            status_code=200,
-            content={
-                "success": True,
-                "detected": front_ok or back_ok,
-                "message": message,
-                "data": response_data
-            }
+            status_code=415,
+            content={"success": False, "message": "Use multipart/form-data or a raw image/* body."}
+        )
+    
+    user_id = params.get("user_id")
+    if not user_id:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "message": "user_id is required."}
+        )
+    
+    if not front_bytes and not back_bytes:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "message": "At least one image (front_image or back_image) is required."}
+        )
+    
+    try:
+        confidence_threshold = float(params.get("confidence_threshold", CONFIDENCE_THRESHOLD))
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "message": "confidence_threshold must be a number."}
+        )
+    
+    try:
+        model_decision = select_model(http_request, deadline)
+    except InvalidModelHintError as e:
+        return invalid_hint_response(e)
+    
+    try:
+        detection_result = await run_until_deadline(
+            http_request,
+            detect_cards_batched(
+                front_bytes,
+                back_bytes,
+                confidence_threshold,
+                lambda data: data,  # already raw bytes
+                deadline,
+                model_decision.variant
+            ),
+            deadline
+        )
+        
+        return build_detection_response(
+            detection_result,
+            user_id=user_id,
+            front_provided=bool(front_bytes),
+            back_provided=bool(back_bytes),
+            force_upload=_parse_bool(params.get("force_upload", False)),
+            background_tasks=background_tasks,
+            model_decision=model_decision
         )
     
+    except DeadlineExceededError as e:
+        logger.warning(f"Binary detection dropped: {e}")
+        return deadline_exceeded_response()
+    
+    except ClientDisconnectedError:
+        logger.info("Client disconnected; binary detection cancelled")
+        return client_disconnected_response()
+    
     except Exception as e:
-        logger.error(f"Error during stateless detection: {e}", exc_info=True)
+        logger.error(f"Error during binary detection: {e}", exc_info=True)
         return JSONResponse(
             status_code=500,
             content={"success": False, "message": "Internal server error", "error": str(e)}
         )
 
 
+@app.get("/metrics", tags=["Monitoring"])
+async def prometheus_metrics():
+    """Prometheus metrics: per-stage latency, verdicts, detected classes, queue gauges"""
+    return metrics_response()
+
+
 @app.get("/review-queue", tags=["Admin"])
 async def get_review_queue(jwt_payload: dict = Depends(verify_jwt_token)):
     """Get items pending manual review"""
@@ -519,12 +1268,18 @@ async def health_check():
                 "data": {
                     "detector_status": "initialized",
                     "mode": "stateless",
-                    "device": detector.device,
-                    "torch_version": torch.__version__,
-                    "cuda_available": torch.cuda.is_available(),
-                    "cuda_device_count": torch.cuda.device_count() if torch.cuda.is_available() else 0,
-                    "cuda_device_name": torch.cuda.get_device_name(0) if torch.cuda.is_available() else "N/A",
-                    "pending_reviews": len(manual_review_queue)
+                    **detector.backend.info(),
+                    "pending_reviews": len(manual_review_queue),
+                    "batching": scheduler.stats() if scheduler else None,
+                    "small_model": {
+                        **backends[VARIANT_SMALL].info(),
+                        "batching": schedulers[VARIANT_SMALL].stats()
+                    } if VARIANT_SMALL in backends else None,
+                    "model_selection": model_selector.stats() if model_selector else None,
+                    "rate_limit": rate_limiter.stats() if rate_limiter else None,
+                    "result_cache": detector.cache.stats(),
+                    "jwt_cache": token_verifier.stats(),
+                    "logging": log_pipeline.stats()
                 }
             }
         )
@@ -551,15 +1306,20 @@ async def root():
         "description": "High-performance stateless API - Zero disk I/O, in-memory processing",
         "features": [
             "Base64 image input - no file uploads needed",
+            "Binary multipart/raw image uploads (POST /detect/binary)",
             "Zero disk writes - all processing in memory",
             "Async model inference",
+            "Cross-request micro-batching",
+            "Load-adaptive 640/320 model selection (queue depth, X-Request-Timeout-Ms)",
             "Manual review queue for low-confidence cases",
             "Force upload support (three-strike rule)"
         ],
         "endpoints": {
             "POST /detect": "Detect Aadhaar cards from base64 images",
+            "POST /detect/binary": "Detect Aadhaar cards from multipart or raw image uploads",
             "GET /review-queue": "Get pending manual reviews",
             "GET /health": "Check service health",
+            "GET /metrics": "Prometheus metrics",
             "GET /": "API information"
         }
     }
@@ -0,0 +1,179 @@
+"""
+Prometheus metrics for the detection servers, served at GET /metrics.
+
+Pipeline stage latencies share one histogram, labelled by stage:
+    jwt_verify, download, base64_decode, image_decode,
+    preprocess, inference, postprocess
+preprocess/inference/postprocess come from the backend's per-batch timings
+(InferenceBackend.predict_batch(images, timings)), so with micro-batching one
+observation covers a whole forward pass; aadhaar_inference_batch_size says
+how many images shared it, and aadhaar_model_pass_duration_seconds splits
+whole passes by model variant (full/small, see model_selection.py).
+
+stage_timer() also records the stage as a span of the current request trace
+(see tracing.py), so one instrumentation point feeds both.
+
+Metrics use the default per-process registry. With several uvicorn workers,
+each worker serves its own numbers.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+
+from tracing import record_span
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "aadhaar_stage_duration_seconds",
+    "Time spent in each detection pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "aadhaar_inference_batch_size",
+    "Images per forward pass",
+    buckets=(1, 2, 4, 8, 16, 32)
+)
+VERDICTS = Counter(
+    "aadhaar_verdicts_total",
+    "Detection responses by verdict",
+    ["verdict"]
+)
+DETECTIONS = Counter(
+    "aadhaar_detections_total",
+    "Detections at or above the request's confidence threshold, by class",
+    ["class_name"]
+)
+HTTP_REQUESTS = Counter(
+    "aadhaar_http_requests_total",
+    "HTTP requests by route and status code",
+    ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "aadhaar_http_request_duration_seconds",
+    "End-to-end HTTP request latency by route",
+    ["method", "route"],
+    buckets=STAGE_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "aadhaar_requests_in_flight",
+    "HTTP requests currently being handled"
+)
+QUEUE_DEPTH = Gauge(
+    "aadhaar_inference_queue_depth",
+    "Work waiting for the inference executor or micro-batcher"
+)
+MODEL_SELECTIONS = Counter(
+    "aadhaar_model_selections_total",
+    "Requests served by each model variant, by reason for the choice",
+    ["variant", "reason"]
+)
+MODEL_PASS_SECONDS = Histogram(
+    "aadhaar_model_pass_duration_seconds",
+    "Forward-pass time (preprocess + inference + postprocess) by model variant",
+    ["variant"],
+    buckets=STAGE_BUCKETS
+)
+REVIEW_QUEUE = Gauge(
+    "aadhaar_manual_review_queue_length",
+    "Items waiting for manual review"
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Observe the duration of the with-block as one pipeline stage (metric and trace span)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        record_span(stage, elapsed)
+
+
+def observe_batch(batch_size: int, timings: dict, variant: str = "full"):
+    """Record one forward pass and the stage timings the backend reported for it"""
+    BATCH_SIZE.observe(batch_size)
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    MODEL_PASS_SECONDS.labels(variant).observe(sum(timings.values()))
+
+
+def record_model_selection(variant: str, reason: str):
+    MODEL_SELECTIONS.labels(variant, reason).inc()
+
+
+def count_detections(detections: list[dict], confidence_threshold: float):
+    for detection in detections:
+        if detection["confidence"] >= confidence_threshold:
+            DETECTIONS.labels(detection["class"]).inc()
+
+
+def record_verdict(verdict: str):
+    VERDICTS.labels(verdict).inc()
+
+
+def track_queue_depth(fn: Callable[[], float]):
+    """Read the inference queue depth at scrape time"""
+    QUEUE_DEPTH.set_function(fn)
+
+
+def track_review_queue(fn: Callable[[], float]):
+    """Read the manual review queue length at scrape time"""
+    REVIEW_QUEUE.set_function(fn)
+
+
+def metrics_response() -> Response:
+    """Prometheus text exposition of all metrics"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware counting requests, in-flight requests and latency.
+
+    Routes are labelled by their declared path; unknown paths collapse to
+    "other" so scanners can't blow up label cardinality. receive is passed
+    through untouched, so handlers still see client disconnects.
+    """
+
+    def __init__(self, app, skip_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+        self._routes = None
+
+    def _route(self, scope) -> str:
+        if self._routes is None and scope.get("app") is not None:
+            self._routes = {getattr(route, "path", None) for route in scope["app"].routes}
+        path = scope["path"]
+        return path if self._routes and path in self._routes else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            route = self._route(scope)
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
@@ -0,0 +1,179 @@
+"""
+Cross-request micro-batching for model inference.
+
+Concurrent requests submit single images; the scheduler groups them into one
+batch (up to max_batch_size, or whatever arrived within max_wait_ms of the
+first item) and runs a single batched forward pass in a worker thread, then
+fans the per-image results back out to the awaiting requests.
+
+Items may carry a deadline; anything whose deadline has passed, or whose
+requester has cancelled its future, is dropped before the batch runs.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceededError(TimeoutError):
+    """The request's deadline passed before its work could run"""
+
+
+class MicroBatchScheduler:
+    """
+    Collect inference work from concurrent requests into batches.
+
+    batch_fn receives a list of submitted items and must return a list of
+    results of the same length and order. It runs via asyncio.to_thread so
+    the event loop stays responsive during the forward pass.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], list],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Stats
+        self.total_batches = 0
+        self.total_items = 0
+        self.total_expired = 0
+        self.total_cancelled = 0
+        self.batch_size_counts: Counter = Counter()
+
+    def start(self):
+        """Start the batching loop on the running event loop"""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Micro-batching started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait_ms})"
+        )
+
+    async def stop(self):
+        """Stop the batching loop and fail any work still queued"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference scheduler stopped"))
+
+    @property
+    def queue_depth(self) -> int:
+        """Items waiting to be batched"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, item: Any, deadline: Optional[float] = None) -> Awaitable:
+        """
+        Queue one item for inference; await the returned future for its result.
+
+        Args:
+            item: Passed to batch_fn
+            deadline: time.monotonic() after which the item is dropped unrun
+                (the future then raises DeadlineExceededError)
+        """
+        if self._worker is None:
+            raise RuntimeError("Inference scheduler is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, deadline))
+        return future
+
+    def _drop_stale(self, batch: list) -> list:
+        """Remove items that were cancelled or whose deadline has passed"""
+        now = time.monotonic()
+        live = []
+        for item, future, deadline in batch:
+            if future.done():
+                # Requester went away (client disconnect or timeout)
+                self.total_cancelled += 1
+            elif deadline is not None and deadline <= now:
+                self.total_expired += 1
+                future.set_exception(DeadlineExceededError("Deadline passed while queued for inference"))
+            else:
+                live.append((item, future, deadline))
+        return live
+
+    async def _collect_batch(self) -> list:
+        """Wait for the first item, then gather more until full or the window closes"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Window closed - still take anything already waiting
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                continue
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+
+            batch = self._drop_stale(batch)
+            if not batch:
+                continue
+
+            items = [item for item, _, _ in batch]
+            self.total_batches += 1
+            self.total_items += len(items)
+            self.batch_size_counts[len(items)] += 1
+
+            try:
+                results = await asyncio.to_thread(self.batch_fn, items)
+            except Exception as e:
+                logger.error(f"Batched inference failed (batch_size={len(items)}): {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        """Achieved batch sizes since startup"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "total_expired": self.total_expired,
+            "total_cancelled": self.total_cancelled,
+            "avg_batch_size": round(self.total_items / self.total_batches, 2) if self.total_batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_size_counts.items())},
+            "queue_depth": self.queue_depth
+        }
@@ -0,0 +1,178 @@
+"""
+Load-adaptive choice between the full (640px) and small (320px) model.
+
+convert_best2_to_onnx.py exports both variants; the small one does roughly a
+quarter of the work per image. When the servers hold both, ModelSelector picks
+one per request:
+1. An explicit hint (X-Model-Hint: full | small | auto) wins; the servers
+   only pass it on when the operator sets ALLOW_MODEL_HINT
+2. Under overload - inference queue depth at or above queue_threshold - the
+   small model serves the request instead of it waiting or being shed
+3. With a per-request latency budget (X-Request-Timeout-Ms), the small model
+   is used when the full one is estimated to miss it: a moving average of
+   observed forward-pass time per variant, times the passes queued ahead
+4. Otherwise the full model
+
+Every decision carries its reason; the servers return it in the response and
+count it in aadhaar_model_selections_total.
+"""
+
+import threading
+from typing import NamedTuple, Optional
+
+VARIANT_FULL = "full"
+VARIANT_SMALL = "small"
+
+REASON_DEFAULT = "default"
+REASON_HINT = "hint"
+REASON_QUEUE_DEPTH = "queue_depth"
+REASON_LATENCY_BUDGET = "latency_budget"
+REASON_SMALL_UNAVAILABLE = "small_unavailable"
+
+HINT_HEADER = "X-Model-Hint"
+
+# Accepted hint spellings
+_HINTS = {
+    "full": VARIANT_FULL, "640": VARIANT_FULL, "accurate": VARIANT_FULL,
+    "small": VARIANT_SMALL, "320": VARIANT_SMALL, "fast": VARIANT_SMALL,
+    "auto": None, "": None
+}
+
+
+class InvalidModelHintError(ValueError):
+    """The X-Model-Hint value isn't one of full, small or auto"""
+
+
+def parse_hint(value: Optional[str]) -> Optional[str]:
+    """
+    VARIANT_FULL, VARIANT_SMALL or None (auto) for a hint header value.
+
+    Raises:
+        InvalidModelHintError: for unknown values
+    """
+    if value is None:
+        return None
+    try:
+        return _HINTS[value.strip().lower()]
+    except KeyError:
+        raise InvalidModelHintError(f"{HINT_HEADER} must be one of full, small or auto, got {value!r}")
+
+
+class ModelDecision(NamedTuple):
+    variant: str
+    reason: str
+    input_size: Optional[int]
+
+    def as_dict(self) -> dict:
+        return {"variant": self.variant, "reason": self.reason, "input_size": self.input_size}
+
+
+class ModelSelector:
+    """
+    Thread-safe per-request variant selection.
+
+    drain_per_pass is how many queued items one forward pass removes from the
+    queue (inference workers for the bounded executor, max batch size for the
+    micro-batcher); it turns queue depth into passes waited for.
+    """
+
+    def __init__(
+        self,
+        full_input_size: Optional[int],
+        small_input_size: Optional[int] = None,
+        queue_threshold: int = 4,
+        drain_per_pass: int = 1,
+        ewma_alpha: float = 0.2
+    ):
+        if queue_threshold < 1:
+            raise ValueError("queue_threshold must be >= 1")
+        if drain_per_pass < 1:
+            raise ValueError("drain_per_pass must be >= 1")
+
+        self.input_sizes = {VARIANT_FULL: full_input_size, VARIANT_SMALL: small_input_size}
+        self.queue_threshold = queue_threshold
+        self.drain_per_pass = drain_per_pass
+        self.ewma_alpha = ewma_alpha
+
+        # Moving average of forward-pass seconds per variant (None until observed)
+        self._pass_seconds: dict[str, Optional[float]] = {VARIANT_FULL: None, VARIANT_SMALL: None}
+        self._lock = threading.Lock()
+
+        # Stats
+        self.decisions: dict[tuple[str, str], int] = {}
+
+    @property
+    def small_available(self) -> bool:
+        return self.input_sizes[VARIANT_SMALL] is not None
+
+    def observe(self, variant: str, seconds: float):
+        """Record the duration of one forward pass on variant"""
+        with self._lock:
+            previous = self._pass_seconds[variant]
+            self._pass_seconds[variant] = (
+                seconds if previous is None else previous + self.ewma_alpha * (seconds - previous)
+            )
+
+    def estimated_pass_seconds(self, variant: str) -> Optional[float]:
+        """Observed average, or for an unobserved small model the full one scaled by pixel count"""
+        estimate = self._pass_seconds[variant]
+        if estimate is None and variant == VARIANT_SMALL and self._pass_seconds[VARIANT_FULL] is not None:
+            full_size, small_size = self.input_sizes[VARIANT_FULL], self.input_sizes[VARIANT_SMALL]
+            if full_size and small_size:
+                estimate = self._pass_seconds[VARIANT_FULL] * (small_size / full_size) ** 2
+        return estimate
+
+    def estimated_latency(self, variant: str, queue_depth: int) -> Optional[float]:
+        """Seconds until a request submitted now to variant has run, assuming the queue is full-model work"""
+        own = self.estimated_pass_seconds(variant)
+        full = self.estimated_pass_seconds(VARIANT_FULL)
+        if own is None or full is None:
+            return None
+        return (queue_depth // self.drain_per_pass) * full + own
+
+    def _decide(self, queue_depth: int, budget_seconds: Optional[float], hint: Optional[str]) -> tuple[str, str]:
+        if not self.small_available:
+            return VARIANT_FULL, REASON_SMALL_UNAVAILABLE if hint == VARIANT_SMALL else REASON_DEFAULT
+        if hint is not None:
+            return hint, REASON_HINT
+        if queue_depth >= self.queue_threshold:
+            return VARIANT_SMALL, REASON_QUEUE_DEPTH
+        if budget_seconds is not None:
+            full = self.estimated_latency(VARIANT_FULL, queue_depth)
+            if full is not None and full > budget_seconds:
+                return VARIANT_SMALL, REASON_LATENCY_BUDGET
+        return VARIANT_FULL, REASON_DEFAULT
+
+    def choose(
+        self,
+        queue_depth: int,
+        budget_seconds: Optional[float] = None,
+        hint: Optional[str] = None
+    ) -> ModelDecision:
+        """
+        Pick the variant for one request.
+
+        Args:
+            queue_depth: Inference work currently waiting
+            budget_seconds: Time left for this request, if it set a budget
+            hint: VARIANT_FULL, VARIANT_SMALL or None (see parse_hint)
+        """
+        variant, reason = self._decide(queue_depth, budget_seconds, hint)
+        with self._lock:
+            self.decisions[(variant, reason)] = self.decisions.get((variant, reason), 0) + 1
+        return ModelDecision(variant, reason, self.input_sizes[variant])
+
+    def stats(self) -> dict:
+        with self._lock:
+            decisions = {f"{variant}:{reason}": count for (variant, reason), count in sorted(self.decisions.items())}
+            pass_ms = {
+                variant: round(seconds * 1000, 2) if seconds is not None else None
+                for variant, seconds in self._pass_seconds.items()
+            }
+        return {
+            "small_available": self.small_available,
+            "input_sizes": self.input_sizes,
+            "queue_threshold": self.queue_threshold,
+            "avg_pass_ms": pass_ms,
+            "decisions": decisions
+        }
@@ -4,33 +4,282 @@ Aadhaar Card ONNX Detector
 Loads the ONNX model and detects Aadhaar cards in images.
 """
 
+import ast
+import logging
 import os
 import sys
+import threading
+import time
 import cv2
 import numpy as np
 import onnxruntime as ort
 from pathlib import Path
+from typing import Optional
+
+from image_decode import decode_image
+
+logger = logging.getLogger(__name__)
+
+# Per-inference debug output (output shapes, top-5 scores). Read once at
+# import: when off, the hot path pays one branch and builds no log arguments.
+LOG_HOT_PATH = os.environ.get("LOG_HOT_PATH", "false").strip().lower() in ("1", "true", "yes", "on")
 
 # Model configuration
 SCRIPT_DIR = Path(__file__).resolve().parent
-MODEL_PATH = SCRIPT_DIR / "public" / "models" / "aadhaar_detector_v2.onnx"
+# Exports (convert_best2_to_onnx.py) and the frontend share the repo-root public/models
+MODELS_DIR = SCRIPT_DIR.parent / "public" / "models"
+MODEL_PATH = MODELS_DIR / "aadhaar_detector_v2.onnx"
 MODEL_INPUT_SIZE = 640
 # Model class order: index 0 = back, index 1 = front, index 2 = print
 CLASS_NAMES = ["aadhar_back", "aadhar_front", "aadhar_long_back", "aadhar_long_front", "other", "print_aadhar"]
 CONFIDENCE_THRESHOLD = 0.60
+# Letterbox padding colour used by ultralytics
+LETTERBOX_PAD_VALUE = 114
+# ultralytics predict() defaults, used when returning the full detection list
+NMS_CONFIDENCE_THRESHOLD = 0.25
+NMS_IOU_THRESHOLD = 0.7
+NMS_MAX_DETECTIONS = 300
+# Per-class NMS offset (same trick and value as ultralytics)
+NMS_CLASS_OFFSET = 7680
+
+# ONNX Runtime session tuning profiles, selected with ORT_PROFILE or the
+# constructor. Thread counts of None are resolved at load time from the CPUs
+# this process may run on (see resolve_session_profile).
+#   default     - ONNX Runtime's own defaults (previous behaviour)
+#   latency     - one request at a time gets every core; workers spin for low wake-up latency
+#   throughput  - small intra-op pool so many concurrent runs/batches don't contend
+#   shared-host - cores split across WEB_CONCURRENCY workers, no spin-waiting,
+#                 so several workers on one box don't oversubscribe it
+ORT_PROFILE = os.environ.get("ORT_PROFILE", "default")
+SESSION_PROFILES = {
+    "default": {},
+    "latency": {
+        "intra_op_num_threads": None,
+        "inter_op_num_threads": 1,
+        "execution_mode": "sequential",
+        "graph_optimization_level": "all",
+        "allow_spinning": True,
+    },
+    "throughput": {
+        "intra_op_num_threads": 2,
+        "inter_op_num_threads": 1,
+        "execution_mode": "sequential",
+        "graph_optimization_level": "all",
+        "allow_spinning": False,
+    },
+    "shared-host": {
+        "intra_op_num_threads": None,
+        "inter_op_num_threads": 1,
+        "execution_mode": "sequential",
+        "graph_optimization_level": "all",
+        "allow_spinning": False,
+    },
+}
+
+def int8_model_path(model_path) -> Path:
+    """Where quantize_to_int8.py -i model_path writes its INT8 export (<stem>_int8.onnx)"""
+    model_path = Path(model_path)
+    return model_path.with_name(f"{model_path.stem}_int8.onnx")
+
+
+# Per-thread preprocessing buffers, reused across calls (see _get_buffers)
+_thread_buffers = threading.local()
+
+
+def letterbox_params(height: int, width: int, input_size: int = MODEL_INPUT_SIZE) -> tuple[float, int, int, int, int]:
+    """
+    Compute ultralytics-style letterbox geometry for an image.
+    
+    Returns:
+        (ratio, new_width, new_height, pad_left, pad_top) - the image is resized
+        by ratio to new_width x new_height and placed at (pad_left, pad_top)
+    """
+    ratio = min(input_size / height, input_size / width)
+    new_width = int(round(width * ratio))
+    new_height = int(round(height * ratio))
+    # Same rounding as ultralytics LetterBox so boxes line up with the .pt pipeline
+    pad_left = int(round((input_size - new_width) / 2 - 0.1))
+    pad_top = int(round((input_size - new_height) / 2 - 0.1))
+    return ratio, new_width, new_height, pad_left, pad_top
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects taskset/cgroup affinity where supported)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_session_profile(profile: str) -> dict:
+    """
+    Turn a profile name into concrete settings.
+    
+    ORT_INTRA_OP_THREADS / ORT_INTER_OP_THREADS override the profile's thread counts.
+    """
+    if profile not in SESSION_PROFILES:
+        raise ValueError(f"Unknown ORT profile '{profile}', expected one of {list(SESSION_PROFILES)}")
+    
+    settings = dict(SESSION_PROFILES[profile])
+    if settings.get("intra_op_num_threads", 0) is None:
+        cpus = available_cpus()
+        if profile == "shared-host":
+            workers = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+            settings["intra_op_num_threads"] = max(1, cpus // workers)
+        else:
+            settings["intra_op_num_threads"] = cpus
+    
+    if os.environ.get("ORT_INTRA_OP_THREADS"):
+        settings["intra_op_num_threads"] = int(os.environ["ORT_INTRA_OP_THREADS"])
+    if os.environ.get("ORT_INTER_OP_THREADS"):
+        settings["inter_op_num_threads"] = int(os.environ["ORT_INTER_OP_THREADS"])
+    return settings
+
+
+def build_session_options(settings: dict) -> "ort.SessionOptions":
+    """Apply resolved profile settings to a fresh SessionOptions"""
+    options = ort.SessionOptions()
+    if "intra_op_num_threads" in settings:
+        options.intra_op_num_threads = settings["intra_op_num_threads"]
+    if "inter_op_num_threads" in settings:
+        options.inter_op_num_threads = settings["inter_op_num_threads"]
+    if "execution_mode" in settings:
+        options.execution_mode = {
+            "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+            "parallel": ort.ExecutionMode.ORT_PARALLEL,
+        }[settings["execution_mode"]]
+    if "graph_optimization_level" in settings:
+        options.graph_optimization_level = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[settings["graph_optimization_level"]]
+    if "allow_spinning" in settings:
+        spin = "1" if settings["allow_spinning"] else "0"
+        options.add_session_config_entry("session.intra_op.allow_spinning", spin)
+        options.add_session_config_entry("session.inter_op.allow_spinning", spin)
+    return options
+
+
+def _get_buffers(input_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return this thread's (uint8 HWC canvas, float32 [1,3,H,W] tensor) for input_size"""
+    buffers = getattr(_thread_buffers, "by_size", None)
+    if buffers is None:
+        buffers = _thread_buffers.by_size = {}
+    if input_size not in buffers:
+        canvas = np.full((input_size, input_size, 3), LETTERBOX_PAD_VALUE, dtype=np.uint8)
+        tensor = np.empty((1, 3, input_size, input_size), dtype=np.float32)
+        buffers[input_size] = (canvas, tensor)
+    return buffers[input_size]
+
+
+def letterbox_into(image: np.ndarray, out: np.ndarray, input_size: int = MODEL_INPUT_SIZE) -> None:
+    """
+    Letterbox a BGR image into a preallocated [3, H, W] float32 RGB tensor.
+    
+    The resize writes straight into this thread's reusable canvas, then a
+    single ufunc pass does BGR->RGB, HWC->CHW and /255 into `out`, so no
+    per-image intermediate arrays are allocated.
+    """
+    canvas, _ = _get_buffers(input_size)
+    height, width = image.shape[:2]
+    _, new_width, new_height, pad_left, pad_top = letterbox_params(height, width, input_size)
+    
+    # Reset only the padding bands; the image region is fully overwritten below
+    canvas[:pad_top] = LETTERBOX_PAD_VALUE
+    canvas[pad_top + new_height:] = LETTERBOX_PAD_VALUE
+    canvas[:, :pad_left] = LETTERBOX_PAD_VALUE
+    canvas[:, pad_left + new_width:] = LETTERBOX_PAD_VALUE
+    
+    roi = canvas[pad_top:pad_top + new_height, pad_left:pad_left + new_width]
+    if (new_width, new_height) == (width, height):
+        roi[...] = image
+    else:
+        cv2.resize(image, (new_width, new_height), dst=roi, interpolation=cv2.INTER_LINEAR)
+    
+    # Fused channel swap + transpose + normalize
+    np.multiply(canvas[:, :, ::-1].transpose(2, 0, 1), np.float32(1.0 / 255.0), out=out)
+
+
+def decode_yolo_output(prediction: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode one image's raw YOLOv8 output in a single vectorized pass.
+    
+    Args:
+        prediction: Array of shape [4 + num_classes, num_anchors]
+            Rows: [x, y, w, h, class0_conf, class1_conf, ...]
+            
+    Returns:
+        (boxes, scores, class_ids) where boxes is [num_anchors, 4] as
+        center-x, center-y, width, height in model input pixels
+    """
+    # Argmax over the class axis of the untransposed array keeps reads contiguous
+    class_scores = prediction[4:]
+    class_ids = np.argmax(class_scores, axis=0)
+    scores = np.take_along_axis(class_scores, class_ids[None, :], axis=0)[0]
+    boxes = prediction[:4].T
+    return boxes, scores, class_ids
+
+
+def scale_boxes(
+    boxes_xyxy: np.ndarray,
+    original_width: int,
+    original_height: int,
+    input_size: int = MODEL_INPUT_SIZE
+) -> np.ndarray:
+    """Map [N, 4] x1,y1,x2,y2 boxes from letterboxed model space back to the original image"""
+    ratio, _, _, pad_left, pad_top = letterbox_params(original_height, original_width, input_size)
+    scaled = (boxes_xyxy - np.array([pad_left, pad_top, pad_left, pad_top], dtype=np.float32)) / ratio
+    np.clip(scaled[:, 0::2], 0, original_width, out=scaled[:, 0::2])
+    np.clip(scaled[:, 1::2], 0, original_height, out=scaled[:, 1::2])
+    return scaled
+
+
+def xywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    """Convert [N, 4] center-x, center-y, width, height boxes to x1, y1, x2, y2"""
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+def non_max_suppression(boxes_xyxy: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Greedy NMS.
+    
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    x1, y1, x2, y2 = boxes_xyxy.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        inter_h = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
 
 
 class AadhaarDetector:
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, profile: str = None):
         self.model_path = model_path or str(MODEL_PATH)
+        self.profile = profile or ORT_PROFILE
+        self.session_settings = resolve_session_profile(self.profile)
         self.session = None
         self.input_name = None
         self.output_name = None
+        self.max_batch_size = None  # None = dynamic batch axis
+        self.input_size = MODEL_INPUT_SIZE
+        self.class_names = list(CLASS_NAMES)
         self._load_model()
 
     def _load_model(self):
         """Load the ONNX model"""
-        print(f"Loading model from: {self.model_path}")
+        logger.info(f"Loading model from: {self.model_path}")
         
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model not found at {self.model_path}")
@@ -38,6 +287,7 @@ class AadhaarDetector:
         # Create ONNX Runtime session
         self.session = ort.InferenceSession(
             self.model_path,
+            sess_options=build_session_options(self.session_settings),
             providers=['CPUExecutionProvider']
         )
         
@@ -48,28 +298,37 @@ class AadhaarDetector:
         input_shape = self.session.get_inputs()[0].shape
         output_shape = self.session.get_outputs()[0].shape
         
-        print(f"✅ Model loaded successfully")
-        print(f"   Input name: {self.input_name}, shape: {input_shape}")
-        print(f"   Output name: {self.output_name}, shape: {output_shape}")
-
-    def preprocess(self, image: np.ndarray) -> np.ndarray:
-        """Preprocess image for model input"""
-        # Resize to model input size
-        resized = cv2.resize(image, (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
-        
-        # Convert BGR to RGB
-        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        # ultralytics embeds {index: name} in the ONNX metadata; prefer it when present
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            parsed = ast.literal_eval(names)
+            self.class_names = [parsed[i] for i in sorted(parsed)]
         
-        # Normalize to 0-1
-        normalized = rgb.astype(np.float32) / 255.0
+        # Models exported with dynamic=False have a fixed integer batch axis
+        if isinstance(input_shape[0], int):
+            self.max_batch_size = input_shape[0]
         
-        # Convert to CHW format (channels first)
-        chw = np.transpose(normalized, (2, 0, 1))
+        # The small variant (convert_best2_to_onnx.py) is exported at 320x320
+        if isinstance(input_shape[2], int):
+            self.input_size = input_shape[2]
         
-        # Add batch dimension
-        batch = np.expand_dims(chw, axis=0)
+        logger.info(
+            f"✅ Model loaded: input {self.input_name} {input_shape}, output {self.output_name} {output_shape}, "
+            f"batch axis {'dynamic' if self.max_batch_size is None else self.max_batch_size}, "
+            f"session profile {self.profile} {self.session_settings}"
+        )
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """
+        Preprocess image for model input (letterboxed, RGB, CHW, 0-1)
         
-        return batch
+        Returns this thread's reusable [1, 3, H, W] input buffer. It is
+        overwritten by the next preprocess() call on the same thread, so copy
+        it if it has to outlive the following inference.
+        """
+        _, tensor = _get_buffers(self.input_size)
+        letterbox_into(image, tensor[0], self.input_size)
+        return tensor
 
     def detect(self, image: np.ndarray) -> dict:
         """
@@ -90,14 +349,30 @@ class AadhaarDetector:
         outputs = self.session.run([self.output_name], {self.input_name: input_tensor})
         output = outputs[0]
         
-        print(f"📊 Output shape: {output.shape}")
-        
-        # Parse YOLO output: [1, 7, 8400] for YOLOv8
-        # Format: [batch, channels, detections]
-        # Channels: [x, y, w, h, class0_conf, class1_conf, class2_conf]
+        if LOG_HOT_PATH:
+            logger.debug(f"📊 Output shape: {output.shape}")
         
-        num_detections = output.shape[2]
+        return self.postprocess(output[0], original_width, original_height)
+
+    def postprocess(
+        self,
+        prediction: np.ndarray,
+        original_width: int,
+        original_height: int,
+        confidence_threshold: float = CONFIDENCE_THRESHOLD
+    ) -> dict:
+        """
+        Pick the best detection from one image's raw YOLO output.
         
+        Args:
+            prediction: Raw output for a single image, shape [4 + num_classes, num_anchors]
+            original_width: Width of the image before preprocessing
+            original_height: Height of the image before preprocessing
+            confidence_threshold: Minimum class score for a detection
+            
+        Returns:
+            dict with detection results
+        """
         best_detection = {
             "detected": False,
             "card_type": None,
@@ -105,56 +380,160 @@ class AadhaarDetector:
             "bbox": None
         }
         
-        all_detections = []
+        boxes, scores, class_ids = decode_yolo_output(prediction)
         
-        for i in range(num_detections):
-            # Get class scores
-            class_scores = []
-            for c in range(3):
-                score = output[0, 4 + c, i]
-                class_scores.append(score)
-            
-            max_score = max(class_scores)
-            max_class_idx = class_scores.index(max_score)
-            
-            if max_score > 0.1:  # Log detections above 0.1
-                all_detections.append({
-                    "idx": i,
-                    "class": CLASS_NAMES[max_class_idx],
-                    "score": float(max_score)
-                })
+        if LOG_HOT_PATH:
+            # Show top detections above 0.1 without sorting all anchors
+            candidates = np.flatnonzero(scores > 0.1)
+            if candidates.size:
+                k = min(5, candidates.size)
+                top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+                top = top[np.argsort(-scores[top])]
+                logger.debug("🔍 Top 5 detections: " + ", ".join(
+                    f"{self.class_names[class_ids[i]]}: {scores[i]:.4f}" for i in top
+                ))
+        
+        best_idx = int(np.argmax(scores))
+        max_score = float(scores[best_idx])
+        if max_score <= confidence_threshold:
+            return best_detection
+        
+        # Undo the letterbox: remove padding, rescale, clip to the original image
+        x1, y1, x2, y2 = scale_boxes(
+            xywh_to_xyxy(boxes[best_idx:best_idx + 1]), original_width, original_height, self.input_size
+        )[0]
+        
+        best_detection = {
+            "detected": True,
+            "card_type": self.class_names[class_ids[best_idx]],
+            "confidence": max_score,
+            "bbox": {
+                "x": float(x1),
+                "y": float(y1),
+                "width": float(x2 - x1),
+                "height": float(y2 - y1)
+            }
+        }
+        
+        return best_detection
+
+    def _run_batch(self, images: list[np.ndarray], timings: Optional[dict] = None) -> np.ndarray:
+        """
+        Letterbox images into one [N, 3, H, W] tensor and return the raw [N, 4+C, A] output.
+        Adds "preprocess" and "inference" seconds to timings if given.
+        """
+        started = time.perf_counter()
+        batch = np.empty((len(images), 3, self.input_size, self.input_size), dtype=np.float32)
+        for i, image in enumerate(images):
+            letterbox_into(image, batch[i], self.input_size)
+        preprocessed = time.perf_counter()
+        
+        # Static-batch models can't take N > max_batch_size, so run in chunks
+        chunk_size = self.max_batch_size or len(images)
+        outputs = []
+        for start in range(0, len(images), chunk_size):
+            chunk = batch[start:start + chunk_size]
+            outputs.append(self.session.run([self.output_name], {self.input_name: chunk})[0])
+        output = np.concatenate(outputs, axis=0) if len(outputs) > 1 else outputs[0]
+        
+        if timings is not None:
+            timings["preprocess"] = timings.get("preprocess", 0.0) + preprocessed - started
+            timings["inference"] = timings.get("inference", 0.0) + time.perf_counter() - preprocessed
+        
+        if LOG_HOT_PATH:
+            logger.debug(f"📊 Batch output shape: {output.shape}")
+        return output
+
+    def detect_batch(self, images: list[np.ndarray]) -> list[dict]:
+        """
+        Detect Aadhaar cards in several images with a single inference call
+        
+        Args:
+            images: List of BGR images from cv2.imread()
             
-            if max_score > CONFIDENCE_THRESHOLD and max_score > best_detection["confidence"]:
-                # Get bounding box
-                x_center = output[0, 0, i]
-                y_center = output[0, 1, i]
-                width = output[0, 2, i]
-                height = output[0, 3, i]
-                
-                # Scale to original image dimensions
-                scale_x = original_width / MODEL_INPUT_SIZE
-                scale_y = original_height / MODEL_INPUT_SIZE
-                
-                best_detection = {
-                    "detected": True,
-                    "card_type": CLASS_NAMES[max_class_idx],
-                    "confidence": float(max_score),
-                    "bbox": {
-                        "x": float((x_center - width / 2) * scale_x),
-                        "y": float((y_center - height / 2) * scale_y),
-                        "width": float(width * scale_x),
-                        "height": float(height * scale_y)
-                    }
+        Returns:
+            List of detection result dicts, one per input image (same order)
+        """
+        if not images:
+            return []
+        
+        output = self._run_batch(images)
+        return [
+            self.postprocess(output[i], image.shape[1], image.shape[0])
+            for i, image in enumerate(images)
+        ]
+
+    def detections(
+        self,
+        prediction: np.ndarray,
+        original_width: int,
+        original_height: int,
+        confidence_threshold: float = NMS_CONFIDENCE_THRESHOLD,
+        iou_threshold: float = NMS_IOU_THRESHOLD
+    ) -> list[dict]:
+        """
+        All detections in one image's raw YOLO output after per-class NMS,
+        matching what ultralytics predict() returns for the .pt model.
+        
+        Returns:
+            List of {"class_id", "class", "confidence", "bbox"}, highest confidence first
+        """
+        boxes, scores, class_ids = decode_yolo_output(prediction)
+        
+        candidates = np.flatnonzero(scores > confidence_threshold)
+        if not candidates.size:
+            return []
+        
+        xyxy = xywh_to_xyxy(boxes[candidates])
+        offsets = class_ids[candidates, None].astype(np.float32) * NMS_CLASS_OFFSET
+        kept = non_max_suppression(xyxy + offsets, scores[candidates], iou_threshold)[:NMS_MAX_DETECTIONS]
+        
+        scaled = scale_boxes(xyxy[kept], original_width, original_height, self.input_size)
+        results = []
+        for (x1, y1, x2, y2), idx in zip(scaled, candidates[kept]):
+            results.append({
+                "class_id": int(class_ids[idx]),
+                "class": self.class_names[class_ids[idx]],
+                "confidence": float(scores[idx]),
+                "bbox": {
+                    "x": float(x1),
+                    "y": float(y1),
+                    "width": float(x2 - x1),
+                    "height": float(y2 - y1)
                 }
+            })
+        return results
+
+    def detect_all_batch(
+        self,
+        images: list[np.ndarray],
+        timings: Optional[dict] = None,
+        confidence_threshold: float = NMS_CONFIDENCE_THRESHOLD
+    ) -> list[list[dict]]:
+        """
+        Full post-NMS detection lists for several images in one inference call
         
-        # Sort and show top detections
-        all_detections.sort(key=lambda x: x["score"], reverse=True)
-        if all_detections:
-            print(f"🔍 Top 5 detections:")
-            for det in all_detections[:5]:
-                print(f"   {det['class']}: {det['score']:.4f}")
+        Args:
+            images: List of BGR images
+            timings: Optional dict; "preprocess", "inference" and "postprocess"
+                seconds are added to it
+            confidence_threshold: Minimum class score kept before NMS
+            
+        Returns:
+            One list of detections (see detections()) per input image
+        """
+        if not images:
+            return []
         
-        return best_detection
+        output = self._run_batch(images, timings)
+        started = time.perf_counter()
+        results = [
+            self.detections(output[i], image.shape[1], image.shape[0], confidence_threshold)
+            for i, image in enumerate(images)
+        ]
+        if timings is not None:
+            timings["postprocess"] = timings.get("postprocess", 0.0) + time.perf_counter() - started
+        return results
 
     def detect_from_file(self, image_path: str) -> dict:
         """Load image from file and detect"""
@@ -165,7 +544,7 @@ class AadhaarDetector:
         if image is None:
             raise ValueError(f"Failed to load image: {image_path}")
         
-        print(f"📷 Image loaded: {image_path} ({image.shape[1]}x{image.shape[0]})")
+        logger.info(f"📷 Image loaded: {image_path} ({image.shape[1]}x{image.shape[0]})")
         return self.detect(image)
 
     def detect_from_base64(self, base64_str: str) -> dict:
@@ -176,20 +555,25 @@ class AadhaarDetector:
         if "," in base64_str:
             base64_str = base64_str.split(",")[1]
         
-        # Decode base64
+        # Decode base64; large JPEGs are DCT-downscaled while decoding
         img_bytes = base64.b64decode(base64_str)
-        img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-        image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        image, factor = decode_image(img_bytes, self.input_size)
         
         if image is None:
             raise ValueError("Failed to decode base64 image")
         
-        print(f"📷 Base64 image decoded: {image.shape[1]}x{image.shape[0]}")
-        return self.detect(image)
+        logger.info(f"📷 Base64 image decoded: {image.shape[1]}x{image.shape[0]} (1/{factor} scale)")
+        result = self.detect(image)
+        
+        # Report the box in original image pixels
+        if result["bbox"] and factor != 1:
+            result["bbox"] = {key: value * factor for key, value in result["bbox"].items()}
+        return result
 
 
 def main():
     """Test the detector with sample images"""
+    logging.basicConfig(level=logging.DEBUG if LOG_HOT_PATH else logging.INFO, format="%(message)s")
     print("=" * 60)
     print("Aadhaar ONNX Detector Test")
     print("=" * 60)
@@ -8,7 +8,9 @@ INT8 quantization benefits:
 - Lower memory usage
 - Better battery efficiency
 
-This script supports both static and dynamic quantization.
+This script supports both static and dynamic quantization. Static
+quantization is calibrated on real card images (see create_calibration_data)
+with MinMax, entropy or percentile activation ranges.
 """
 
 import os
@@ -28,28 +30,79 @@ def install_dependencies():
             print(f"Installing {pkg}...")
             os.system(f"{sys.executable} -m pip install {pkg}")
 
-def create_calibration_data(num_samples: int = 100, input_size: int = 640):
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+CALIBRATION_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+# Bump when preprocessing changes so cached tensors are rebuilt
+CALIBRATION_CACHE_VERSION = 1
+
+
+def create_calibration_data(
+    image_dir: Path,
+    num_samples: int = 100,
+    input_size: int = 640,
+    cache_dir: Path = None
+):
     """
-    Create calibration dataset for static quantization.
-    For best results, use real Aadhaar card images.
+    Create calibration dataset for static quantization from real card images.
+    
+    Each image is decoded and letterboxed exactly like the server does it
+    (image_decode.decode_image + AadhaarDetector.preprocess), so the
+    activation ranges match production inputs. Preprocessed tensors are
+    cached as .npy files keyed by image content, input size and
+    CALIBRATION_CACHE_VERSION, so reruns skip decoding.
     
     Args:
-        num_samples: Number of calibration samples
+        image_dir: Directory of real Aadhaar (and other document) photos
+        num_samples: Maximum number of images to use
         input_size: Input image size (640 or 320)
+        cache_dir: Where preprocessed tensors are cached (None = no cache)
     
     Returns:
-        List of numpy arrays for calibration
+        List of [1, 3, input_size, input_size] float32 arrays for calibration
     """
-    print(f"📊 Creating {num_samples} calibration samples...")
+    import hashlib
+    from image_decode import decode_image
+    from onnx_detector import letterbox_into
+    
+    image_paths = sorted(
+        path for path in Path(image_dir).rglob("*")
+        if path.suffix.lower() in CALIBRATION_IMAGE_EXTENSIONS
+    )[:num_samples]
+    if not image_paths:
+        print(f"❌ No calibration images found in {image_dir}")
+        print("   Random noise gives meaningless activation ranges; point --calibration-dir at real card photos")
+        sys.exit(1)
     
-    calibration_data = []
-    for i in range(num_samples):
-        # Generate random images that simulate real input distribution
-        # For production, replace with actual Aadhaar images
-        img = np.random.rand(1, 3, input_size, input_size).astype(np.float32)
-        # Normalize to [0, 1] range (YOLO preprocessing)
-        calibration_data.append(img)
+    print(f"📊 Preparing {len(image_paths)} calibration samples from {image_dir}...")
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
     
+    calibration_data = []
+    cached = 0
+    for path in image_paths:
+        data = path.read_bytes()
+        cache_path = None
+        if cache_dir is not None:
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            cache_path = cache_dir / f"{digest}_{input_size}_v{CALIBRATION_CACHE_VERSION}.npy"
+            if cache_path.exists():
+                # Memory-mapped: only the sample being calibrated is paged in
+                calibration_data.append(np.load(cache_path, mmap_mode="r"))
+                cached += 1
+                continue
+        
+        image, _ = decode_image(data, input_size)
+        if image is None:
+            print(f"   ⚠️ Skipping undecodable image: {path.name}")
+            continue
+        tensor = np.empty((1, 3, input_size, input_size), dtype=np.float32)
+        letterbox_into(image, tensor[0], input_size)
+        if cache_path is not None:
+            np.save(cache_path, tensor)
+        calibration_data.append(tensor)
+    
+    print(f"   {len(calibration_data)} samples ({cached} from cache)")
     return calibration_data
 
 
@@ -64,7 +117,7 @@ class YOLOCalibrationDataReader:
     def get_next(self):
         if self.index >= len(self.calibration_data):
             return None
-        data = {self.input_name: self.calibration_data[self.index]}
+        data = {self.input_name: np.ascontiguousarray(self.calibration_data[self.index])}
         self.index += 1
         return data
     
@@ -93,10 +146,20 @@ def quantize_dynamic(input_model: Path, output_model: Path):
     return output_model
 
 
-def quantize_static(input_model: Path, output_model: Path, calibration_data: list):
+def quantize_static(
+    input_model: Path,
+    output_model: Path,
+    calibration_data: list,
+    calibration_method: str = "percentile",
+    percentile: float = 99.999
+):
     """
     Apply static INT8 quantization with calibration data.
     Better accuracy than dynamic quantization.
+    
+    calibration_method picks how activation ranges are derived:
+    "minmax" (sensitive to outliers), "entropy" (KL divergence) or
+    "percentile" (clip at the given percentile of observed values).
     """
     from onnxruntime.quantization import (
         quantize_static as ort_quantize_static,
@@ -110,6 +173,8 @@ def quantize_static(input_model: Path, output_model: Path, calibration_data: lis
     print(f"   Input: {input_model}")
     print(f"   Output: {output_model}")
     print(f"   Calibration samples: {len(calibration_data)}")
+    print(f"   Calibration method: {calibration_method}"
+          + (f" ({percentile})" if calibration_method == "percentile" else ""))
     
     # Load model to get input name
     model = onnx.load(str(input_model))
@@ -119,17 +184,34 @@ def quantize_static(input_model: Path, output_model: Path, calibration_data: lis
     # Create calibration data reader
     calibration_reader = YOLOCalibrationDataReader(calibration_data, input_name)
     
+    # Shape inference + graph optimization first, as ONNX Runtime recommends
+    # for static quantization; fall back to the raw model if it fails
+    preprocessed_model = output_model.with_name(f"{input_model.stem}_preprocessed.onnx")
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(str(input_model), str(preprocessed_model), skip_symbolic_shape=True)
+        model_to_quantize = preprocessed_model
+    except Exception as e:
+        print(f"   ⚠️ Pre-processing skipped: {e}")
+        model_to_quantize = input_model
+    
     # Quantize with static calibration
     ort_quantize_static(
-        model_input=str(input_model),
+        model_input=str(model_to_quantize),
         model_output=str(output_model),
         calibration_data_reader=calibration_reader,
         quant_format=QuantFormat.QDQ,  # Quantize-DeQuantize format
         per_channel=True,               # Per-channel quantization (better accuracy)
         weight_type=QuantType.QInt8,
         activation_type=QuantType.QUInt8,
-        calibrate_method=CalibrationMethod.MinMax,
+        calibrate_method={
+            "minmax": CalibrationMethod.MinMax,
+            "entropy": CalibrationMethod.Entropy,
+            "percentile": CalibrationMethod.Percentile,
+        }[calibration_method],
+        extra_options={"CalibPercentile": percentile} if calibration_method == "percentile" else {},
     )
+    preprocessed_model.unlink(missing_ok=True)
     
     return output_model
 
@@ -233,7 +315,11 @@ def quantize_model(
     method: str = "dynamic",
     input_size: int = 640,
     num_calibration_samples: int = 100,
-    benchmark: bool = True
+    benchmark: bool = True,
+    calibration_dir: str = None,
+    calibration_method: str = "percentile",
+    percentile: float = 99.999,
+    calibration_cache_dir: str = None
 ):
     """
     Main quantization function.
@@ -245,6 +331,10 @@ def quantize_model(
         input_size: Input image size (640 or 320)
         num_calibration_samples: Number of calibration samples for static quantization
         benchmark: Whether to run benchmarks
+        calibration_dir: Real card images for static calibration (default: public/models)
+        calibration_method: "minmax", "entropy" or "percentile"
+        percentile: Percentile kept by the "percentile" method
+        calibration_cache_dir: Cache of preprocessed calibration tensors
     """
     install_dependencies()
     
@@ -284,8 +374,17 @@ def quantize_model(
     if method == "dynamic":
         quantize_dynamic(input_model, output_model)
     elif method == "static":
-        calibration_data = create_calibration_data(num_calibration_samples, input_size)
-        quantize_static(input_model, output_model, calibration_data)
+        if calibration_method not in CALIBRATION_METHODS:
+            print(f"❌ Unknown calibration method: {calibration_method}")
+            print(f"   Use one of {', '.join(CALIBRATION_METHODS)}")
+            sys.exit(1)
+        calibration_dir = Path(calibration_dir) if calibration_dir else Path(__file__).parent.parent / "public" / "models"
+        if calibration_cache_dir is None:
+            calibration_cache_dir = Path(__file__).parent / ".calibration_cache"
+        calibration_data = create_calibration_data(
+            calibration_dir, num_calibration_samples, input_size, calibration_cache_dir
+        )
+        quantize_static(input_model, output_model, calibration_data, calibration_method, percentile)
     else:
         print(f"❌ Unknown method: {method}")
         print("   Use 'dynamic' or 'static'")
@@ -331,6 +430,12 @@ def quantize_model(
         "filename": output_model.name,
         "method": method,
         "inputSize": input_size,
+        "calibration": {
+            "method": calibration_method,
+            "percentile": percentile if calibration_method == "percentile" else None,
+            "samples": len(calibration_data),
+            "imageDir": str(calibration_dir)
+        } if method == "static" else None,
         "size": size_info,
         "benchmark": benchmark_results if benchmark else None
     }
@@ -393,7 +498,15 @@ if __name__ == "__main__":
     parser.add_argument("--size", "-s", type=int, default=640, 
                         help="Input image size (640 or 320)")
     parser.add_argument("--calibration-samples", "-c", type=int, default=100,
-                        help="Number of calibration samples for static quantization")
+                        help="Maximum number of calibration images for static quantization")
+    parser.add_argument("--calibration-dir", type=str,
+                        help="Directory of real card images for calibration (default: public/models)")
+    parser.add_argument("--calibration-method", choices=CALIBRATION_METHODS, default="percentile",
+                        help="How static quantization derives activation ranges")
+    parser.add_argument("--percentile", type=float, default=99.999,
+                        help="Percentile kept by --calibration-method percentile")
+    parser.add_argument("--calibration-cache", type=str,
+                        help="Cache directory for preprocessed calibration tensors (default: backend/.calibration_cache)")
     parser.add_argument("--no-benchmark", action="store_true",
                         help="Skip benchmarking")
     parser.add_argument("--all", "-a", action="store_true",
@@ -410,5 +523,9 @@ if __name__ == "__main__":
             method=args.method,
             input_size=args.size,
             num_calibration_samples=args.calibration_samples,
-            benchmark=not args.no_benchmark
+            benchmark=not args.no_benchmark,
+            calibration_dir=args.calibration_dir,
+            calibration_method=args.calibration_method,
+            percentile=args.percentile,
+            calibration_cache_dir=args.calibration_cache
         )
@@ -0,0 +1,297 @@
+"""
+Token-bucket rate limiting for the detection endpoints.
+
+Each request draws one token from every bucket that applies to it - one per
+caller identity (JWT user_id, falling back to request_id) and, where the
+servers can see real client addresses, one per client IP - and is rejected
+if any bucket is empty. All buckets are checked and debited atomically, so a
+rejected request costs nothing.
+
+Two interchangeable limiters:
+- RedisRateLimiter runs the bucket logic as a Lua script inside Redis, so all
+  API workers share the limits. Any redis.asyncio-compatible client works,
+  including a local stand-in such as fakeredis. If Redis is unreachable it
+  falls back to per-worker in-process limiting rather than failing requests.
+- InProcessRateLimiter keeps buckets in a sharded dict for single-worker
+  deployments or when REDIS_URL is not set.
+
+The check is a few dict operations (or one Redis round-trip) and runs as a
+FastAPI dependency, before any image is read or decoded.
+"""
+
+import logging
+import math
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    """Refill rate (tokens per second) and capacity of one bucket"""
+    rate: float
+    burst: float
+
+    def __post_init__(self):
+        # Both limiters divide by rate; use RATE_LIMIT_ENABLED=false to turn limiting off
+        if not self.rate > 0:
+            raise ValueError(f"Rate limit refill rate must be > 0, got {self.rate}")
+        if not self.burst >= 1:
+            raise ValueError(f"Rate limit burst must be >= 1, got {self.burst}")
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: float) -> "BucketSpec":
+        return cls(rate=requests_per_minute / 60.0, burst=burst)
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    # Seconds until the request would be allowed (0 when allowed)
+    retry_after: float
+    # Whole tokens left in the emptiest bucket after this request
+    remaining: int
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def client_ip(http_request, trust_forwarded: bool = False) -> Optional[str]:
+    """
+    Client address of a Starlette request. X-Forwarded-For is only honoured
+    when the API sits behind a proxy that sets it (trust_forwarded).
+    """
+    if trust_forwarded:
+        forwarded = http_request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return http_request.client.host if http_request.client else None
+
+
+def request_buckets(
+    jwt_payload: dict,
+    ip: Optional[str],
+    user_spec: BucketSpec,
+    ip_spec: BucketSpec
+) -> list[tuple[str, BucketSpec]]:
+    """
+    Buckets a request draws from: its caller identity and its client IP.
+
+    The frontend mints a fresh request_id per token, so user_id is the stable
+    identity; anonymous callers are limited per token (request_id) and per IP.
+    """
+    buckets = []
+    user_id = jwt_payload.get("user_id")
+    if user_id and user_id != "anonymous":
+        buckets.append((f"user:{user_id}", user_spec))
+    elif jwt_payload.get("request_id"):
+        buckets.append((f"req:{jwt_payload['request_id']}", user_spec))
+    if ip:
+        buckets.append((f"ip:{ip}", ip_spec))
+    return buckets
+
+
+class InProcessRateLimiter:
+    """Token buckets in a lock-sharded dict (per-process limits)"""
+
+    name = "memory"
+
+    def __init__(self, num_shards: int = 16, max_keys_per_shard: int = 10000):
+        self.num_shards = num_shards
+        self.max_keys_per_shard = max_keys_per_shard
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        # key -> [tokens, last refill time, time the bucket is full again]
+        self._shards: list[dict[str, list[float]]] = [{} for _ in range(num_shards)]
+
+        # Stats
+        self.allowed = 0
+        self.denied = 0
+
+    def _evict(self, shard: dict, now: float):
+        """Forget buckets that have refilled completely; they'd be recreated full"""
+        for key in [key for key, state in shard.items() if state[2] <= now]:
+            del shard[key]
+        # Still over budget: drop the oldest-created buckets
+        while len(shard) > self.max_keys_per_shard:
+            del shard[next(iter(shard))]
+
+    def try_acquire(self, buckets: list[tuple[str, BucketSpec]], cost: float = 1.0) -> RateLimitDecision:
+        if not buckets:
+            return RateLimitDecision(True, 0.0, 0)
+
+        shard_ids = {key: hash(key) % self.num_shards for key, _ in buckets}
+        with ExitStack() as stack:
+            # Lock shards in index order so concurrent multi-key checks can't deadlock
+            for shard_id in sorted(set(shard_ids.values())):
+                stack.enter_context(self._locks[shard_id])
+
+            now = time.monotonic()
+            levels = []
+            wait = 0.0
+            for key, spec in buckets:
+                state = self._shards[shard_ids[key]].get(key)
+                level = spec.burst if state is None else min(spec.burst, state[0] + (now - state[1]) * spec.rate)
+                levels.append(level)
+                if level < cost:
+                    wait = max(wait, (cost - level) / spec.rate)
+
+            allowed = wait == 0.0
+            for (key, spec), level in zip(buckets, levels):
+                if allowed:
+                    level -= cost
+                shard = self._shards[shard_ids[key]]
+                shard[key] = [level, now, now + (spec.burst - level) / spec.rate]
+                if len(shard) > self.max_keys_per_shard:
+                    self._evict(shard, now)
+
+        remaining = int(min(levels) - cost) if allowed else int(min(levels))
+        if allowed:
+            self.allowed += 1
+        else:
+            self.denied += 1
+        return RateLimitDecision(allowed, wait, max(0, remaining))
+
+    async def acquire(self, buckets: list[tuple[str, BucketSpec]], cost: float = 1.0) -> RateLimitDecision:
+        return self.try_acquire(buckets, cost)
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "allowed": self.allowed,
+            "denied": self.denied,
+            "tracked_keys": sum(len(shard) for shard in self._shards)
+        }
+
+
+# KEYS: bucket keys. ARGV[1]: cost, then (rate, burst) per key.
+# Uses the Redis server clock so all workers agree on refill time.
+TOKEN_BUCKET_LUA = """
+local cost = tonumber(ARGV[1])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1])
+    if level == nil then
+        level = burst
+    else
+        level = math.min(burst, level + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    levels[i] = level
+    if level < cost then
+        wait = math.max(wait, (cost - level) / rate)
+    end
+end
+
+local allowed = 0
+if wait == 0 then
+    allowed = 1
+end
+
+local remaining = nil
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local level = levels[i]
+    if allowed == 1 then
+        level = level - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(level), 'ts', tostring(now))
+    -- Expire once the bucket would be full again anyway
+    redis.call('PEXPIRE', key, math.ceil((burst - level) / rate * 1000) + 1000)
+    if remaining == nil or level < remaining then
+        remaining = level
+    end
+end
+
+return {allowed, tostring(wait), math.floor(math.max(0, remaining))}
+"""
+
+
+class RedisRateLimiter:
+    """Token buckets shared by all workers, evaluated atomically in Redis"""
+
+    name = "redis"
+
+    def __init__(self, client, prefix: str = "ratelimit:", fallback: Optional[InProcessRateLimiter] = None):
+        """
+        Args:
+            client: redis.asyncio.Redis (or a compatible stand-in)
+            prefix: Namespace for bucket keys
+            fallback: Limiter used while Redis is unreachable
+        """
+        self.client = client
+        self.prefix = prefix
+        self.fallback = fallback if fallback is not None else InProcessRateLimiter()
+        self._script = client.register_script(TOKEN_BUCKET_LUA)
+
+        # Stats
+        self.allowed = 0
+        self.denied = 0
+        self.errors = 0
+
+    async def acquire(self, buckets: list[tuple[str, BucketSpec]], cost: float = 1.0) -> RateLimitDecision:
+        if not buckets:
+            return RateLimitDecision(True, 0.0, 0)
+
+        args = [cost]
+        for _, spec in buckets:
+            args.extend((spec.rate, spec.burst))
+        try:
+            allowed, wait, remaining = await self._script(
+                keys=[self.prefix + key for key, _ in buckets],
+                args=args
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis rate limiter unavailable, limiting in-process: {e}")
+            return self.fallback.try_acquire(buckets, cost)
+
+        decision = RateLimitDecision(bool(int(allowed)), float(wait), int(remaining))
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.denied += 1
+        return decision
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "allowed": self.allowed,
+            "denied": self.denied,
+            "redis_errors": self.errors,
+            "fallback": self.fallback.stats()
+        }
+
+
+def create_rate_limiter(redis_url: Optional[str] = None):
+    """RedisRateLimiter when redis_url is set (and redis is installed), else InProcessRateLimiter"""
+    if redis_url:
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            logger.warning("REDIS_URL is set but the redis package is not installed; limiting in-process")
+        else:
+            logger.info("Rate limiting via Redis")
+            return RedisRateLimiter(redis_asyncio.from_url(redis_url))
+
+    logger.info("Rate limiting in-process (per worker)")
+    return InProcessRateLimiter()
@@ -0,0 +1,100 @@
+"""
+Content-addressed cache of raw inference results.
+
+Keyed by a BLAKE2b hash of the uploaded image bytes, so a resubmitted image
+(e.g. the three-strike force_upload retry) skips both decoding and inference.
+Entries hold the full raw detection list (class, confidence, bbox), not the
+final verdict, so a hit can be re-scored against any confidence_threshold.
+
+Bounded by an approximate byte budget (LRU eviction) and a TTL.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Rough per-entry overhead and per-detection cost of the stored dicts, in bytes
+_ENTRY_OVERHEAD_BYTES = 256
+_DETECTION_BYTES = 512
+
+
+class InferenceResultCache:
+    """Thread-safe LRU + TTL cache of per-image detection lists"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: OrderedDict[bytes, tuple[float, list[dict], int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(image_bytes) -> bytes:
+        """Content hash of the encoded image"""
+        return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[list[dict]]:
+        """Cached detections for key, or None on a miss/expired entry"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, detections, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return detections
+
+    def put(self, key: bytes, detections: list[dict]):
+        """
+        Store all of an image's detections. A hit must answer exactly like a
+        miss, so nothing is trimmed; the byte budget accounts for long lists.
+        """
+        if not self.enabled:
+            return
+        size = _ENTRY_OVERHEAD_BYTES + _DETECTION_BYTES * len(detections)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, detections, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "approx_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Dedicated inference process with shared-memory image transport.
+
+One or more inference servers own the model. API workers (uvicorn processes)
+connect with INFERENCE_BACKEND=remote, and each worker allocates its own ring of
+fixed-size slots in multiprocessing.shared_memory. A decoded image is written
+once into a free slot; only (slot, shape) goes over the Unix-socket control
+channel, and the server runs the model directly on a NumPy view of the slot.
+Pixels are never pickled. Results (small detection dicts) and the batch's
+per-stage timings come back on the same channel.
+
+Requests from all connected workers feed one queue, so the server batches
+across workers as well as across requests.
+
+The control channel unpickles what it receives, so the server and every API
+worker must share a secret INFERENCE_SERVER_AUTHKEY (there is no default), and
+the socket is created owner-only: run the server as the API workers' user.
+
+Run a server:
+    export INFERENCE_SERVER_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+    python shm_inference.py --address /tmp/aadhaar-inference.sock --backend onnx
+
+Then start the API with the same key and:
+    INFERENCE_BACKEND=remote INFERENCE_SERVER_ADDRESS=/tmp/aadhaar-inference.sock
+"""
+
+import argparse
+import itertools
+import logging
+import math
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from inference_backend import BACKEND_ONNX, BACKEND_REMOTE, InferenceBackend, create_backend
+from log_pipeline import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = "/tmp/aadhaar-inference.sock"
+INFERENCE_SERVER_ADDRESS = os.environ.get("INFERENCE_SERVER_ADDRESS", DEFAULT_ADDRESS)
+INFERENCE_SERVER_AUTHKEY = os.environ.get("INFERENCE_SERVER_AUTHKEY", "").encode()
+INFERENCE_SERVER_TIMEOUT = float(os.environ.get("INFERENCE_SERVER_TIMEOUT", "30"))
+# Per API worker: SHM_SLOTS slots of SHM_SLOT_BYTES each (default 8 x ~11 MB)
+SHM_SLOTS = int(os.environ.get("SHM_SLOTS", "8"))
+SHM_SLOT_BYTES = int(os.environ.get("SHM_SLOT_BYTES", str(1920 * 1920 * 3)))
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """
+    Attach to a segment owned by another process.
+
+    Before Python 3.13 attaching also registers the segment with this process's
+    resource tracker, which would unlink it when the server exits even though
+    the API worker still owns it.
+    """
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def _authkey() -> bytes:
+    """
+    INFERENCE_SERVER_AUTHKEY. multiprocessing.connection unpickles whatever an
+    authenticated peer sends, so a guessable key would let any local process run
+    code in the inference server.
+
+    Raises:
+        RuntimeError: if the key isn't set
+    """
+    if not INFERENCE_SERVER_AUTHKEY:
+        raise RuntimeError(
+            "INFERENCE_SERVER_AUTHKEY is not set. Generate one with "
+            "python -c \"import secrets; print(secrets.token_hex(32))\" and set it for "
+            "the inference server and every API worker"
+        )
+    return INFERENCE_SERVER_AUTHKEY
+
+
+# --- Server side ---
+
+class _ClientSession:
+    """Server-side state for one connected API worker"""
+
+    def __init__(self, conn: Connection, shm_name: str, slot_bytes: int, num_slots: int):
+        self.conn = conn
+        self.shm = _attach_shared_memory(shm_name)
+        self.slot_bytes = slot_bytes
+        self.num_slots = num_slots
+        self.send_lock = threading.Lock()
+        self.closed = False
+
+    def view(self, slot: int, shape: tuple) -> np.ndarray:
+        if not 0 <= slot < self.num_slots:
+            raise ValueError(f"Invalid slot {slot}")
+        if math.prod(shape) > self.slot_bytes:
+            raise ValueError(f"Image shape {shape} exceeds slot size")
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def send(self, message: tuple):
+        with self.send_lock:
+            if self.closed:
+                return
+            try:
+                self.conn.send(message)
+            except OSError:
+                # Worker went away mid-request; the reader thread cleans up
+                self.closed = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        try:
+            self.shm.close()
+        except BufferError:
+            # A job still holds a view; the mapping is released when it finishes
+            pass
+
+
+class InferenceServer:
+    """Owns the model and serves inference requests from API workers"""
+
+    def __init__(self, backend: InferenceBackend, address: str = DEFAULT_ADDRESS, max_batch_size: int = 8):
+        self.backend = backend
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self._jobs: queue.Queue = queue.Queue()
+
+    def serve_forever(self):
+        authkey = _authkey()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # Owner-only socket (0600): bind under a restrictive umask so there is no
+        # window in which other users can connect
+        previous_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(previous_umask)
+        threading.Thread(target=self._inference_loop, name="inference", daemon=True).start()
+        logger.info(f"Inference server listening on {self.address} (backend={self.backend.name})")
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning(f"Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _serve_client(self, conn: Connection):
+        session = None
+        try:
+            kind, shm_name, slot_bytes, num_slots = conn.recv()
+            if kind != "hello":
+                raise ValueError(f"Expected hello, got {kind}")
+            session = _ClientSession(conn, shm_name, slot_bytes, num_slots)
+            session.send(("ready", {
+                **self.backend.info(),
+                "class_names": self.backend.class_names,
+                "server_pid": os.getpid()
+            }))
+            logger.info(f"API worker attached ({shm_name}, {num_slots} x {slot_bytes} bytes)")
+
+            while True:
+                kind, request_id, images = conn.recv()
+                if kind != "infer":
+                    raise ValueError(f"Unexpected message {kind}")
+                try:
+                    views = [session.view(slot, tuple(shape)) for slot, shape in images]
+                except ValueError as e:
+                    session.send(("error", request_id, str(e)))
+                    continue
+                self._jobs.put((session, request_id, views))
+                del views
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"API worker connection failed: {e}")
+        finally:
+            if session is not None:
+                session.close()
+                logger.info(f"API worker detached ({session.shm.name})")
+            else:
+                conn.close()
+
+    def _inference_loop(self):
+        while True:
+            # Take whatever is queued (from any worker) up to max_batch_size images
+            jobs = [self._jobs.get()]
+            num_images = len(jobs[0][2])
+            while num_images < self.max_batch_size:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                num_images += len(job[2])
+
+            jobs = [job for job in jobs if not job[0].closed]
+            if not jobs:
+                continue
+
+            images = [view for _, _, views in jobs for view in views]
+            timings = {}
+            try:
+                results = self.backend.predict_batch(images, timings)
+            except Exception as e:
+                logger.error(f"Inference failed (batch_size={len(images)}): {e}")
+                for session, request_id, _ in jobs:
+                    session.send(("error", request_id, str(e)))
+                continue
+            finally:
+                del images
+
+            offset = 0
+            for session, request_id, views in jobs:
+                session.send(("result", request_id, (results[offset:offset + len(views)], timings)))
+                offset += len(views)
+            del jobs
+
+
+# --- API worker side ---
+
+class _ServerConnection:
+    """One API worker's connection and shared-memory slot ring for one inference server"""
+
+    def __init__(self, address: str, num_slots: int, slot_bytes: int, timeout: float):
+        self.address = address
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+
+        self.shm = SharedMemory(
+            name=f"aadhaar-{os.getpid()}-{uuid.uuid4().hex[:8]}",
+            create=True,
+            size=num_slots * slot_bytes
+        )
+        self._free_slots = list(range(num_slots))
+        self._slots_available = threading.Condition()
+
+        self._pending: dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        # Set once the server goes away; RemoteBackend then reconnects
+        self.broken = False
+
+        self.conn = Client(address, family="AF_UNIX", authkey=_authkey())
+        self.conn.send(("hello", self.shm.name, slot_bytes, num_slots))
+        kind, self.server_info = self.conn.recv()
+        if kind != "ready":
+            raise ConnectionError(f"Inference server at {address} refused the session")
+
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def _read_results(self):
+        try:
+            while True:
+                kind, request_id, payload = self.conn.recv()
+                with self._pending_lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if kind == "result":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(f"Inference server error: {payload}"))
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.broken = True
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ConnectionError(f"Lost connection to inference server at {self.address}"))
+
+    def _acquire_slots(self, count: int) -> list[int]:
+        with self._slots_available:
+            if not self._slots_available.wait_for(lambda: len(self._free_slots) >= count, self.timeout):
+                raise TimeoutError("No free shared-memory slots")
+            slots = self._free_slots[:count]
+            del self._free_slots[:count]
+            return slots
+
+    def _release_slots(self, slots: list[int]):
+        with self._slots_available:
+            self._free_slots.extend(slots)
+            self._slots_available.notify_all()
+
+    def infer(self, images: list[np.ndarray]) -> tuple[list[list[dict]], dict]:
+        """Run up to num_slots images through the server; returns (detections, stage timings)"""
+        slots = self._acquire_slots(len(images))
+        future = None
+        try:
+            shapes = []
+            for slot, image in zip(slots, images):
+                view = np.ndarray(image.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+                view[...] = image
+                shapes.append(image.shape)
+                del view
+
+            request_id = next(self._request_ids)
+            future = Future()
+            with self._pending_lock:
+                self._pending[request_id] = future
+            try:
+                with self._send_lock:
+                    self.conn.send(("infer", request_id, list(zip(slots, shapes))))
+            except OSError as e:
+                self.broken = True
+                with self._pending_lock:
+                    self._pending.pop(request_id, None)
+                future.cancel()
+                raise ConnectionError(f"Lost connection to inference server at {self.address}") from e
+            return future.result(timeout=self.timeout)
+        finally:
+            if future is None or future.done():
+                self._release_slots(slots)
+            else:
+                # Timed out while the server may still be reading the slots: keep
+                # them out of the ring until its late reply (or the connection
+                # loss) resolves the request
+                future.add_done_callback(lambda _: self._release_slots(slots))
+
+    def close(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        try:
+            self.shm.close()
+        except BufferError:
+            # A request is still copying an image in; the mapping goes with it
+            pass
+        self.shm.unlink()
+
+
+class RemoteBackend(InferenceBackend):
+    """
+    InferenceBackend that forwards images to one or more dedicated inference
+    servers over shared memory. Several addresses are used round-robin; a
+    connection whose server went away (e.g. restarted) is re-established on
+    its next use.
+    """
+
+    name = BACKEND_REMOTE
+
+    def __init__(
+        self,
+        addresses: list[str],
+        num_slots: int = SHM_SLOTS,
+        slot_bytes: int = SHM_SLOT_BYTES,
+        timeout: float = INFERENCE_SERVER_TIMEOUT
+    ):
+        # No local model, so skip InferenceBackend's model path check
+        self.connections = [_ServerConnection(address, num_slots, slot_bytes, timeout) for address in addresses]
+        self._round_robin = itertools.count()
+        self._cycle_lock = threading.Lock()
+
+        server_info = self.connections[0].server_info
+        self.model_path = server_info.get("model_path")
+        self.device = server_info.get("device", "cpu")
+        self.class_names = server_info["class_names"]
+        self.input_size = server_info.get("input_size")
+        self.max_batch_size = server_info.get("max_batch_size")
+        logger.info(f"Connected to {len(self.connections)} inference server(s): {addresses}")
+
+    def _next_connection(self) -> _ServerConnection:
+        """Next connection round-robin, reconnecting it if its server went away"""
+        with self._cycle_lock:
+            index = next(self._round_robin) % len(self.connections)
+            connection = self.connections[index]
+            if not connection.broken:
+                return connection
+            logger.warning(f"Reconnecting to inference server at {connection.address}")
+            # Fresh shared memory too: the old server may still hold views of the old slots
+            replacement = _ServerConnection(
+                connection.address, connection.num_slots, connection.slot_bytes, connection.timeout
+            )
+            self.connections[index] = replacement
+        connection.close()
+        return replacement
+
+    def _fit_to_slot(self, image: np.ndarray, slot_bytes: int) -> tuple[np.ndarray, float]:
+        """Shrink images that don't fit a slot; returns (image, scale applied)"""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if image.nbytes <= slot_bytes:
+            return image, 1.0
+        scale = math.sqrt(slot_bytes / image.nbytes)
+        height, width = image.shape[:2]
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA), size[0] / width
+
+    def predict_batch(self, images: list[np.ndarray], timings: Optional[dict] = None) -> list[list[dict]]:
+        connection = self._next_connection()
+
+        fitted = [self._fit_to_slot(image, connection.slot_bytes) for image in images]
+        results = []
+        for start in range(0, len(fitted), connection.num_slots):
+            chunk = fitted[start:start + connection.num_slots]
+            chunk_results, server_timings = connection.infer([image for image, _ in chunk])
+            results.extend(chunk_results)
+            if timings is not None:
+                # Stages measured inside the inference server for the batch this chunk rode in
+                for stage, seconds in server_timings.items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+
+        # Map boxes of shrunk images back to the caller's coordinates
+        for detections, (_, scale) in zip(results, fitted):
+            if scale != 1.0:
+                for detection in detections:
+                    detection["bbox"] = {key: value / scale for key, value in detection["bbox"].items()}
+        return results
+
+    def info(self) -> dict:
+        return {
+            "backend": self.name,
+            "device": self.device,
+            "model_path": self.model_path,
+            "inference_servers": [
+                {
+                    "address": c.address,
+                    "server_pid": c.server_info.get("server_pid"),
+                    "backend": c.server_info.get("backend"),
+                    "connected": not c.broken
+                }
+                for c in self.connections
+            ],
+            "shm_slots": self.connections[0].num_slots,
+            "shm_slot_bytes": self.connections[0].slot_bytes
+        }
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+def create_remote_backend() -> RemoteBackend:
+    """RemoteBackend configured from INFERENCE_SERVER_ADDRESS (comma-separated for several servers)"""
+    addresses = [a.strip() for a in INFERENCE_SERVER_ADDRESS.split(",") if a.strip()]
+    return RemoteBackend(addresses)
+
+
+def main():
+    configure_logging(
+        level=os.environ.get("LOG_LEVEL", "INFO"),
+        fmt=os.environ.get("LOG_FORMAT", "text")
+    )
+    base_dir = Path(__file__).parent
+
+    parser = argparse.ArgumentParser(description="Run a dedicated Aadhaar inference server")
+    parser.add_argument("--address", "-a", default=DEFAULT_ADDRESS, help="Unix socket path to listen on")
+    parser.add_argument("--backend", "-b", default=os.environ.get("INFERENCE_SERVER_BACKEND", BACKEND_ONNX),
+                        choices=["onnx", "torch"], help="Backend that owns the model")
+    parser.add_argument("--model", "-m", help="Model path (.onnx or .pt, depending on --backend)")
+    parser.add_argument("--max-batch", type=int, default=int(os.environ.get("BATCH_MAX_SIZE", "8")),
+                        help="Maximum images per forward pass")
+    args = parser.parse_args()
+    # Fail before spending time loading the model
+    _authkey()
+
+    torch_model_path = base_dir / os.environ.get("MODEL1_PATH", "models/best4.pt")
+    onnx_model_path = base_dir / os.environ.get("ONNX_MODEL_PATH", "../public/models/aadhaar_detector_v2.onnx")
+    if args.model:
+        torch_model_path = onnx_model_path = Path(args.model)
+
+    backend = create_backend(args.backend, str(torch_model_path), str(onnx_model_path))
+    if backend.max_batch_size is not None and backend.max_batch_size < args.max_batch:
+        logger.warning(
+            f"Model has a fixed batch axis of {backend.max_batch_size}; batches of up to {args.max_batch} run in "
+            f"chunks. Export with convert_best2_to_onnx.py --dynamic-batch for aadhaar_detector_v2_batch.onnx"
+        )
+    InferenceServer(backend, args.address, args.max_batch).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
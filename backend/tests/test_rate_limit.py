@@ -0,0 +1,133 @@
+"""
+Both rate limiters against the same cases. RedisRateLimiter runs its Lua
+script on fakeredis (with lupa), so no Redis server is needed.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from rate_limit import BucketSpec, InProcessRateLimiter, RedisRateLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+SLOW = BucketSpec(rate=0.01, burst=2)
+FAST = BucketSpec(rate=50.0, burst=1)
+
+
+def make_limiter(kind: str):
+    if kind == "memory":
+        return InProcessRateLimiter()
+    return RedisRateLimiter(fakeredis.FakeAsyncRedis())
+
+
+@pytest.fixture(params=["memory", "redis"])
+def acquire(request):
+    """Run limiter.acquire synchronously; the limiter is acquire.limiter"""
+    limiter = make_limiter(request.param)
+    loop = asyncio.new_event_loop()
+
+    def run(buckets, cost=1.0):
+        return loop.run_until_complete(limiter.acquire(buckets, cost))
+
+    run.limiter = limiter
+    yield run
+    loop.run_until_complete(limiter.close())
+    loop.close()
+
+
+def test_allows_burst_then_denies(acquire):
+    assert acquire([("user:a", SLOW)]).remaining == 1
+    assert acquire([("user:a", SLOW)]).allowed
+
+    denied = acquire([("user:a", SLOW)])
+    assert not denied.allowed
+    assert denied.remaining == 0
+    # One token at 0.01/s: about 100 seconds
+    assert 90 < denied.retry_after <= 100
+    assert denied.retry_after_header == str(int(denied.retry_after) + 1)
+
+
+def test_buckets_are_independent(acquire):
+    acquire([("user:a", SLOW)])
+    acquire([("user:a", SLOW)])
+    assert not acquire([("user:a", SLOW)]).allowed
+    assert acquire([("user:b", SLOW)]).allowed
+
+
+def test_denied_request_debits_no_bucket(acquire):
+    # Empty the shared ip bucket through another user
+    ip = BucketSpec(rate=0.01, burst=1)
+    assert acquire([("user:a", SLOW), ("ip:1", ip)]).allowed
+    assert not acquire([("user:b", SLOW), ("ip:1", ip)]).allowed
+
+    # user:b was not charged for the rejected request: both tokens are left
+    assert acquire([("user:b", SLOW)]).remaining == 1
+    assert acquire([("user:b", SLOW)]).allowed
+
+
+def test_refills_over_time(acquire):
+    assert acquire([("user:a", FAST)]).allowed
+    assert not acquire([("user:a", FAST)]).allowed
+    time.sleep(0.1)
+    assert acquire([("user:a", FAST)]).allowed
+
+
+def test_cost_above_burst_is_never_allowed(acquire):
+    decision = acquire([("user:a", SLOW)], cost=3)
+    assert not decision.allowed
+    assert decision.remaining == 2
+
+
+def test_no_buckets_is_allowed(acquire):
+    assert acquire([]).allowed
+
+
+def test_counts_decisions(acquire):
+    acquire([("user:a", SLOW)])
+    acquire([("user:a", SLOW)])
+    acquire([("user:a", SLOW)])
+    stats = acquire.limiter.stats()
+    assert (stats["allowed"], stats["denied"]) == (2, 1)
+
+
+def test_redis_keys_expire_once_refilled():
+    client = fakeredis.FakeAsyncRedis()
+    limiter = RedisRateLimiter(client, prefix="rl:")
+
+    async def run():
+        await limiter.acquire([("user:a", BucketSpec(rate=1.0, burst=5))])
+        assert float(await client.hget("rl:user:a", "tokens")) == pytest.approx(4.0)
+        # One token short: refilled after 1 s, expired a second after that
+        ttl_ms = await client.pttl("rl:user:a")
+        assert 1000 < ttl_ms <= 2000
+
+    asyncio.run(run())
+
+
+def test_redis_errors_fall_back_to_in_process_limits():
+    class UnreachableRedis:
+        def register_script(self, script):
+            async def call(**kwargs):
+                raise ConnectionError("connection refused")
+            return call
+
+    limiter = RedisRateLimiter(UnreachableRedis())
+
+    async def run():
+        assert (await limiter.acquire([("user:a", SLOW)])).allowed
+        assert (await limiter.acquire([("user:a", SLOW)])).allowed
+        assert not (await limiter.acquire([("user:a", SLOW)])).allowed
+
+    asyncio.run(run())
+    stats = limiter.stats()
+    assert stats["redis_errors"] == 3
+    assert stats["fallback"]["denied"] == 1
+
+
+@pytest.mark.parametrize("rate, burst", [(0, 10), (-1, 10), (1, 0)])
+def test_bucket_spec_rejects_unusable_limits(rate, burst):
+    with pytest.raises(ValueError):
+        BucketSpec(rate=rate, burst=burst)
@@ -0,0 +1,326 @@
+"""
+Lightweight request tracing with Server-Timing headers.
+
+TracingMiddleware opens one trace per HTTP request, keyed by the incoming
+X-Request-ID (the frontend sends a UUID, which maps directly onto a 128-bit
+trace id). Pipeline stages add child spans through span()/record_span(),
+which find the current trace via a contextvar - asyncio.to_thread carries it
+into worker threads; other executors must run work in a copied context.
+
+Every response gets a Server-Timing header with per-stage durations, so the
+browser devtools of the verify page show where a slow request spent its
+time. Finished traces are optionally exported off the request path by a
+background thread:
+- "file": one JSON object per trace per line
+- "otlp": OTLP/HTTP JSON to a collector (e.g. http://localhost:4318/v1/traces)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORTER_NONE = "none"
+EXPORTER_FILE = "file"
+EXPORTER_OTLP = "otlp"
+
+# OTLP span kinds
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("aadhaar_trace", default=None)
+
+
+def _trace_id_for(request_id: str) -> str:
+    """32-hex-char trace id: the request id itself if it is a UUID, else a hash of it"""
+    try:
+        return uuid.UUID(request_id).hex
+    except ValueError:
+        return hashlib.blake2b(request_id.encode(), digest_size=16).hexdigest()
+
+
+def _new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], start_ns: int, end_ns: int = 0, attributes: dict = None):
+        self.name = name
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.attributes = attributes or {}
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes
+        }
+
+
+class Trace:
+    """Root span for one HTTP request plus the stage spans recorded under it"""
+
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.trace_id = _trace_id_for(request_id)
+        self.root = Span(name, None, time.time_ns(), attributes={"request_id": request_id})
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self, **attributes):
+        self.root.end_ns = time.time_ns()
+        self.root.attributes.update(attributes)
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: wall-clock time per stage, then the total so
+        far. Front and back decode in parallel, so a stage's time is the span
+        from its first start to its last end rather than the sum.
+        """
+        with self._lock:
+            windows: dict[str, list[int]] = {}
+            for span in self.spans:
+                window = windows.setdefault(span.name, [span.start_ns, span.end_ns])
+                window[0] = min(window[0], span.start_ns)
+                window[1] = max(window[1], span.end_ns)
+        entries = [f"{name};dur={(end - start) / 1e6:.1f}" for name, (start, end) in windows.items()]
+        entries.append(f"total;dur={(time.time_ns() - self.root.start_ns) / 1e6:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {"trace_id": self.trace_id, "request_id": self.request_id, **self.root.to_dict(), "spans": spans}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record the with-block as a stage span of the current request (no-op outside one)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start_ns = time.time_ns()
+    try:
+        yield
+    finally:
+        trace.add(Span(name, trace.root.span_id, start_ns, time.time_ns(), attributes))
+
+
+def record_span(name: str, seconds: float, end_ns: Optional[int] = None, **attributes):
+    """Add a span measured elsewhere (e.g. by the backend), ending at end_ns or now"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    end_ns = end_ns if end_ns is not None else time.time_ns()
+    trace.add(Span(name, trace.root.span_id, end_ns - int(seconds * 1e9), end_ns, attributes))
+
+
+def record_timings(timings: dict, **attributes):
+    """
+    Add back-to-back spans for a backend's stage timings (in the order the
+    stages ran), ending now. Used for micro-batched inference, where the
+    forward pass runs outside the request's context.
+    """
+    end_ns = time.time_ns() - int(sum(timings.values()) * 1e9)
+    for stage, seconds in timings.items():
+        end_ns += int(seconds * 1e9)
+        record_span(stage, seconds, end_ns, **attributes)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+# --- Export ---
+
+class TraceExporter:
+    """Ships finished traces from a bounded queue on a background thread"""
+
+    def __init__(self, kind: str, service_name: str, file_path: str = "traces.jsonl",
+                 otlp_endpoint: str = "http://localhost:4318/v1/traces", max_queue: int = 1000):
+        if kind not in (EXPORTER_FILE, EXPORTER_OTLP):
+            raise ValueError(f"Unknown trace exporter '{kind}', expected '{EXPORTER_FILE}' or '{EXPORTER_OTLP}'")
+        self.kind = kind
+        self.service_name = service_name
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            # Never let tracing slow down or fail a request
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            while len(batch) < 100:
+                try:
+                    trace = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                if trace is None:
+                    self._write(batch)
+                    return
+                batch.append(trace)
+            self._write(batch)
+
+    def _write(self, traces: list[Trace]):
+        try:
+            if self.kind == EXPORTER_FILE:
+                with open(self.file_path, "a") as f:
+                    for trace in traces:
+                        f.write(json.dumps({"service": self.service_name, **trace.to_dict()}) + "\n")
+            else:
+                request = urllib.request.Request(
+                    self.otlp_endpoint,
+                    data=json.dumps(self._to_otlp(traces)).encode(),
+                    headers={"Content-Type": "application/json"},
+                    method="POST"
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning(f"Failed to export {len(traces)} trace(s): {e}")
+
+    def _to_otlp(self, traces: list[Trace]) -> dict:
+        def attributes(values: dict) -> list[dict]:
+            result = []
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    result.append({"key": key, "value": {"boolValue": value}})
+                elif isinstance(value, int):
+                    result.append({"key": key, "value": {"intValue": str(value)}})
+                elif isinstance(value, float):
+                    result.append({"key": key, "value": {"doubleValue": value}})
+                else:
+                    result.append({"key": key, "value": {"stringValue": str(value)}})
+            return result
+
+        spans = []
+        for trace in traces:
+            for span, kind in [(trace.root, _KIND_SERVER)] + [(s, _KIND_INTERNAL) for s in trace.spans]:
+                otlp_span = {
+                    "traceId": trace.trace_id,
+                    "spanId": span.span_id,
+                    "name": span.name,
+                    "kind": kind,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": attributes(span.attributes)
+                }
+                if span.parent_id:
+                    otlp_span["parentSpanId"] = span.parent_id
+                spans.append(otlp_span)
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "aadhaar.tracing"}, "spans": spans}]
+        }]}
+
+    def close(self):
+        """Flush queued traces and stop the export thread"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+exporter: Optional[TraceExporter] = None
+
+
+def configure(kind: str, service_name: str, file_path: str = "traces.jsonl",
+              otlp_endpoint: str = "http://localhost:4318/v1/traces"):
+    """Set up trace export for this process ("none" keeps Server-Timing only)"""
+    global exporter
+    kind = kind.strip().lower()
+    if kind == EXPORTER_NONE:
+        exporter = None
+        return
+    exporter = TraceExporter(kind, service_name, file_path=file_path, otlp_endpoint=otlp_endpoint)
+    logger.info(f"Exporting traces via {kind} ({file_path if kind == EXPORTER_FILE else otlp_endpoint})")
+
+
+def shutdown():
+    global exporter
+    if exporter is not None:
+        exporter.close()
+        exporter = None
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware: one trace per request, keyed by X-Request-ID (a new
+    UUID if absent), echoed back with a Server-Timing header.
+    """
+
+    def __init__(self, app, skip_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1").strip()
+                break
+        request_id = request_id or str(uuid.uuid4())
+
+        trace = Trace(request_id, f"{scope['method']} {scope['path']}")
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                if not any(name.lower() == b"x-request-id" for name, _ in headers):
+                    headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            trace.finish(**{"http.method": scope["method"], "http.route": scope["path"], "http.status_code": status_code})
+            if exporter is not None:
+                exporter.export(trace)